@@ -0,0 +1,113 @@
+"""
+ファイル名解析のマイクロベンチマーク
+
+変更前の解析処理（呼び出しごとの re.match・datetime・デバッグログ）と filename_parser.parse_filename を
+同じファイル名の列で比較する。parse_filename はキャッシュなし（初回スキャン相当）と
+キャッシュあり（フルスキャンのやり直し相当）の両方を計測し、解析結果が一致することも確認する。
+
+使い方:
+    python benchmarks/bench_filename.py --names 200000
+"""
+
+import argparse
+import logging
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastapi_table_app"))
+
+from filename_parser import parse_filename  # noqa: E402
+
+logger = logging.getLogger("bench_filename")
+
+# 形式に合わない・日時が不正な名前（変更前と同じ結果になることを確認する）
+EDGE_NAMES = [
+    "came01_2024-02-30-10_00_00-1.mp4",
+    "came01_2024-13-01-10_00_00-1.mp4",
+    "came01_2024-01-01-24_00_00-1.mp4",
+    "came01_2024-01-01-10_60_00-1.mp4",
+    "came01_2024-01-01-10_00_00-.mp4",
+    "came01_2024-01-01-10_00_00-12abc.mp4",
+    "came01_2024-01-01-10_00_00-3_merged_x.mp4",
+    "came01_２０２４-01-01-10_00_00-1.mp4",
+    "_2024-01-01-10_00_00-1.mp4",
+    "came01-2024-01-01-10_00_00-1.mp4",
+    "recording.mp4",
+]
+
+
+def legacy_extract(filename):
+    """変更前の extract_recording_time_from_filename（比較用にそのまま再現）"""
+    try:
+        name_without_ext = filename.rsplit('.', 1)[0]
+        pattern = r'^([^_]+)_(\d{4})-(\d{2})-(\d{2})-(\d{2})_(\d{2})_(\d{2})-\d+'
+        match = re.match(pattern, name_without_ext)
+        if match:
+            device_name, year, month, day, hour, minute, second = match.groups()
+            recording_datetime = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+            timestamp = recording_datetime.timestamp()
+            logger.debug(f"ファイル名解析成功: {filename} -> {recording_datetime}")
+            return timestamp
+        return None
+    except Exception:
+        return None
+
+
+def make_names(count, devices, seed=0):
+    """synthetic_nas.py と同じ形式のファイル名を作成"""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    names = []
+    for i in range(count):
+        recorded = start + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+        name = f"came{rng.randrange(devices) + 1:02d}_{recorded:%Y-%m-%d-%H_%M_%S}-{i % 100}"
+        if rng.random() < 0.1:
+            name += f"_merged_{rng.randrange(1, 10)}"
+        names.append(name + ".mp4")
+    return names
+
+
+def timed(func, names):
+    started = time.perf_counter()
+    for name in names:
+        func(name)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ファイル名解析のマイクロベンチマーク")
+    parser.add_argument("--names", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=8)
+    args = parser.parse_args()
+
+    names = make_names(args.names, args.devices)
+    # 変更前と同じくデバッグログの組み立てまで含めて計測する（出力はしない）
+    logging.basicConfig(level=logging.INFO)
+
+    mismatches = [name for name in names + EDGE_NAMES
+                  if legacy_extract(name) != (getattr(parse_filename(name), "timestamp", None))]
+    parse_filename.cache_clear()
+
+    legacy = timed(legacy_extract, names)
+    cold = timed(lambda name: parse_filename.__wrapped__(name), names)
+    parse_filename.cache_clear()
+    timed(parse_filename, names[:parse_filename.cache_info().maxsize])
+    warm_names = names[:parse_filename.cache_info().maxsize]
+    warm = timed(parse_filename, warm_names)
+
+    per_name = lambda seconds, count: seconds / count * 1e6
+    print(f"{len(names)}件のファイル名")
+    print(f"変更前（re.match + datetime）  {legacy:6.2f}秒  {per_name(legacy, len(names)):6.2f}µs/件")
+    print(f"parse_filename（キャッシュなし） {cold:6.2f}秒  {per_name(cold, len(names)):6.2f}µs/件  ({legacy / cold:.1f}倍)")
+    print(f"parse_filename（キャッシュあり） {warm:6.2f}秒  {per_name(warm, len(warm_names)):6.2f}µs/件  ({len(warm_names)}件)")
+    print(f"解析結果の不一致: {len(mismatches)}件")
+    for name in mismatches[:10]:
+        print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()
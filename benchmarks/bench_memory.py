@@ -0,0 +1,100 @@
+"""
+カタログのメモリ使用量のベンチマーク
+
+ファイルを作らずにスキャン結果と同じ形のレコードをメモリ上に作成し、
+従来の辞書形式（表示用の文字列・フルパスを含む8キー）と CatalogRecord の
+1件あたりのバイト数を tracemalloc で計測する。
+
+使い方:
+    python benchmarks/bench_memory.py --records 1000000
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastapi_table_app"))
+
+from catalog_record import CatalogRecord  # noqa: E402
+
+BASE_PATH = "/mnt/nas/surveillance"
+CATEGORY_FOLDERS = {"エラーフォルダ": "エラー", "その他フォルダ": "その他", "誤検知フォルダ": "誤検知", "人物フォルダ": "人物"}
+
+
+def iter_files(count, devices, seed=0):
+    """(機器名, 日付フォルダ, カテゴリフォルダ, ファイル名, 撮影時間, txtの有無, サイズ) を生成
+
+    スキャン時と同じく、文字列は1件ごとに別のオブジェクトとして作る
+    """
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1).timestamp()
+    span = 3 * 365 * 86400
+    folders = list(CATEGORY_FOLDERS)
+    for i in range(count):
+        device = f"came{rng.randrange(devices) + 1:02d}"
+        timestamp = int(start + rng.random() * span)
+        local = time.localtime(timestamp)
+        date_path = f"{local.tm_year:04d}/{local.tm_mon:02d}/{local.tm_mday:02d}"
+        name = f"{device}_{time.strftime('%Y-%m-%d-%H_%M_%S', local)}-{i % 100}.mp4"
+        yield device, date_path, rng.choice(folders), name, timestamp, rng.random() < 0.5, rng.randrange(1 << 26)
+
+
+def legacy_record(device, date_path, folder, name, timestamp, txt, size):
+    """変更前のスキャン処理が作っていた辞書形式のレコード"""
+    relative_path = f"{device}/{date_path}/{folder}/{name}"
+    formatted = datetime.fromtimestamp(timestamp).strftime("%Y年%m月%d日 %H時%M分%S秒")
+    return {
+        "id": device,
+        "datetime": formatted,
+        "option": "あり" if txt else "なし",
+        "category": CATEGORY_FOLDERS[folder],
+        "file_path": relative_path,
+        "full_path": os.path.join(BASE_PATH, *relative_path.split("/")),
+        "date": date_path,
+        "sort_timestamp": float(timestamp),
+        "size": size
+    }
+
+
+def compact_record(device, date_path, folder, name, timestamp, txt, size):
+    return CatalogRecord(device, CATEGORY_FOLDERS[folder], f"{device}/{date_path}/{folder}/{name}", timestamp, txt, size)
+
+
+def measure(factory, count, devices):
+    """レコードを count 件作成し、(保持しているバイト数, 作成にかかった秒数) を返す"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = [factory(*fields) for fields in iter_files(count, devices)]
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="カタログのメモリ使用量のベンチマーク")
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--devices", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {}
+    for label, factory in (("辞書（従来）", legacy_record), ("CatalogRecord", compact_record)):
+        used, elapsed = measure(factory, args.records, args.devices)
+        results[label] = used
+        print(f"{label:<14} {used / 1024 / 1024:8.1f} MiB  {used / args.records:6.1f} バイト/件  (作成 {elapsed:.1f}秒)")
+
+    legacy, compact = results.values()
+    print(f"削減率: {(1 - compact / legacy) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+/api/search の検索処理（列指向インデックス）のベンチマーク
+
+ファイルを作らずにメモリ上で疑似カタログを作成し、代表的な検索条件ごとの
+件数取得＋1ページ切り出しの所要時間を計測する。
+
+使い方:
+    python benchmarks/bench_query.py --records 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastapi_table_app"))
+
+from catalog_record import CatalogRecord  # noqa: E402
+from query_engine import CatalogQueryIndex  # noqa: E402
+
+CATEGORIES = ["エラー", "その他", "誤検知", "人物"]
+
+
+def make_records(count, devices, seed=0):
+    """撮影時間順に並んだ疑似カタログを作成"""
+    rng = random.Random(seed)
+    device_names = [f"came{i + 1:02d}" for i in range(devices)]
+    start = datetime(2023, 1, 1).timestamp()
+    span = 3 * 365 * 86400
+    records = []
+    for i in range(count):
+        timestamp = float(int(start + rng.random() * span))
+        records.append(CatalogRecord(rng.choice(device_names), rng.choice(CATEGORIES), f"{i}.mp4", timestamp, False))
+    records.sort(key=CatalogRecord.key)
+    return records, start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検索処理のベンチマーク")
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    records, start = make_records(args.records, args.devices)
+    index = CatalogQueryIndex(records)
+    print(f"{len(records)}件のインデックスを構築: {index.build_ms}ms")
+
+    day = 86400
+    cases = [
+        ("条件なし", {}),
+        ("機器1台", {"devices": ["came01"]}),
+        ("機器2台×カテゴリ", {"devices": ["came01", "came02"], "categories": ["人物"]}),
+        ("日付範囲30日", {"start_timestamp": start + 100 * day, "end_timestamp": start + 130 * day}),
+        ("機器＋日付範囲", {"devices": ["came01"], "start_timestamp": start + 100 * day, "end_timestamp": start + 130 * day}),
+        ("時間帯 06:15-18:45", {"start_seconds": 6 * 3600 + 15 * 60, "end_seconds": 18 * 3600 + 45 * 60}),
+        ("全条件", {"devices": ["came01"], "categories": ["人物"], "start_timestamp": start + 100 * day,
+                  "end_timestamp": start + 130 * day, "start_seconds": 6 * 3600 + 15 * 60, "end_seconds": 18 * 3600 + 45 * 60}),
+    ]
+
+    print(f"{'条件':<24} {'件数':>9} {'先頭ページ(ms)':>14} {'中間ページ(ms)':>14}")
+    for name, conditions in cases:
+        index.query(**conditions)  # キャッシュの準備
+        first, middle = [], []
+        total = 0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = index.query(**conditions)
+            total = result.total
+            result.page(0, 50)
+            first.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            result = index.query(**conditions)
+            result.page(result.total // 2, 50)
+            middle.append(time.perf_counter() - started)
+        first.sort()
+        middle.sort()
+        print(f"{name:<24} {total:>9} {first[len(first) // 2] * 1000:>14.3f} {middle[len(middle) // 2] * 1000:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+スキャン処理のベンチマーク
+
+従来の pathlib rglob/glob/stat ベースのスキャンと、os.scandir で固定階層をたどる
+現在のスキャン（フル/差分）を同じ疑似NASツリー上で比較する。
+
+使い方:
+    python benchmarks/bench_scan.py                      # 一時ディレクトリに約10万件を生成して計測
+    python benchmarks/bench_scan.py --root /path/to/tree  # 既存ツリーで計測
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "fastapi_table_app"))
+
+from synthetic_nas import generate_tree  # noqa: E402
+
+
+def legacy_scan_directories(scanner):
+    """変更前の rglob ベースのスキャン処理（比較用にそのまま再現）"""
+    data = []
+    for device_path in scanner.base_path.iterdir():
+        if not device_path.is_dir():
+            continue
+        device_name = device_path.name
+        for mp4_file in device_path.rglob("*.mp4"):
+            category_folder = mp4_file.parent
+            if category_folder.name not in scanner.category_mapping:
+                continue
+            category = scanner.category_mapping[category_folder.name]
+            date_parts = mp4_file.relative_to(device_path).parts[:3]
+            if len(date_parts) != 3:
+                continue
+            date_path = "/".join(date_parts)
+            recording_timestamp = scanner.extract_recording_time_from_filename(mp4_file.name)
+            if recording_timestamp is not None:
+                datetime_str = scanner.format_timestamp_to_datetime_string(recording_timestamp)
+                sort_timestamp = recording_timestamp
+            else:
+                file_timestamp = mp4_file.stat().st_mtime
+                datetime_str = scanner.format_timestamp_to_datetime_string(file_timestamp)
+                sort_timestamp = file_timestamp
+            date_folder = mp4_file.parent.parent.parent
+            txt_exists = any(f.suffix.lower() == '.txt' for f in date_folder.glob('*.txt'))
+            relative_path = str(mp4_file.relative_to(scanner.base_path)).replace("\\", "/")
+            data.append({
+                "id": device_name,
+                "datetime": datetime_str,
+                "option": "あり" if txt_exists else "なし",
+                "category": category,
+                "file_path": relative_path,
+                "full_path": str(mp4_file),
+                "date": date_path,
+                "sort_timestamp": sort_timestamp
+            })
+    data.sort(key=lambda x: (x.get("sort_timestamp", 0), x.get("id", "")))
+    return data
+
+
+def best_of(func, repeat):
+    """repeat回実行して最短時間（秒）と最後の結果を返す"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(root, repeat, workers):
+    os.environ["NAS_PATH"] = root
+    import main  # NAS_PATH 設定後に読み込む
+
+    # スキャン処理そのものを比較するためファイル単位のログ出力は止める
+    logging.disable(logging.WARNING)
+
+    results = []
+
+    scanner = main.NASDataScanner(root, max_workers=1)
+    elapsed, data = best_of(lambda: legacy_scan_directories(scanner), repeat)
+    results.append(("legacy rglob", elapsed, len(data)))
+
+    for count in sorted({1, workers}):
+        scanner = main.NASDataScanner(root, max_workers=count)
+        elapsed, data = best_of(lambda: scanner.scan_directories(), repeat)
+        results.append((f"scandir full (workers={count})", elapsed, len(data)))
+
+    scanner.MTIME_SETTLE_SECONDS = 0
+    scanner.scan_directories()
+    elapsed, data = best_of(lambda: scanner.scan_directories(incremental=True), repeat)
+    results.append((f"scandir incremental, no changes (workers={workers})", elapsed, len(data)))
+
+    baseline = results[0][1]
+    print(f"{'implementation':<52} {'seconds':>9} {'files':>9} {'speedup':>8}")
+    for name, elapsed, count in results:
+        print(f"{name:<52} {elapsed:>9.3f} {count:>9} {baseline / elapsed:>7.1f}x")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="スキャン処理のベンチマーク")
+    parser.add_argument("--root", help="既存の疑似NASツリー（省略時は一時ディレクトリに生成）")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-category", type=int, default=70)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.root:
+        run(args.root, args.repeat, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="nas_bench_") as root:
+        started = time.perf_counter()
+        count = generate_tree(root, devices=args.devices, days=args.days, per_category=args.per_category)
+        print(f"{count}件のMP4ファイルを生成 ({time.perf_counter() - started:.1f}s): {root}")
+        run(root, args.repeat, args.workers)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,363 @@
+"""
+ベンチマークスイート（疑似NASツリーの生成 → スキャン → APIの同時負荷 → /api/video の範囲配信）
+
+バージョン間で比較できるように、結果を JSON で出力する。規模は --size で 10k / 100k / 1m から選ぶ
+（機器数 × 日数 × 4カテゴリ × カテゴリフォルダあたりのファイル数）。
+
+- スキャン: NASDataScanner.scan_directories() のフルスキャンと変更なしの差分スキャン（最短時間と段階ごとの時間）
+- API: 代表的なリクエストごとに、複数のクライアントから一定時間同時に送ったときのスループットとレイテンシ
+- 動画: 一部のMP4を指定サイズに広げ（スパースファイル）、ランダムな位置への Range リクエストのスループット
+
+使い方:
+    python benchmarks/bench_suite.py --size 100k --output result.json
+    python benchmarks/bench_suite.py --root /tmp/synthetic_nas --output result.json  # 既存ツリーで計測
+    python benchmarks/bench_suite.py --compare before.json after.json                  # 2つの結果を比較
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "fastapi_table_app"))
+
+from synthetic_nas import generate_tree  # noqa: E402
+
+# 規模ごとの (機器数, 日数, カテゴリフォルダあたりのファイル数)
+SIZES = {
+    "10k": (4, 25, 25),       # 10,000件
+    "100k": (4, 90, 70),      # 100,800件
+    "1m": (8, 730, 43),       # 1,004,480件（2年分）
+}
+
+# 負荷をかけるリクエスト（名前, パス, パラメータ）。検索条件はクライアントごとに変えず、ページだけ変える
+API_REQUESTS = [
+    ("index", "/", {}),
+    ("data", "/api/data", {"per_page": 50}),
+    ("search_all", "/api/search", {"per_page": 100}),
+    ("search_device", "/api/search", {"device": "came01", "per_page": 100}),
+    ("search_range", "/api/search", {"start_date": "{first_date}", "end_date": "{last_date}",
+                                     "start_time": "08:00", "end_time": "18:00", "category": "人物,エラー", "per_page": 100}),
+    ("search_cursor", "/api/search", {"pagination": "cursor", "per_page": 1000}),
+    ("available_dates", "/api/available-dates", {}),
+    ("stats", "/api/stats", {}),
+    ("scan_stats", "/api/scan-stats", {}),
+]
+
+# ページ番号を変えるリクエストで使うページの範囲
+MAX_PAGE = 20
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def summarize(latencies, elapsed, errors, transferred=None):
+    """レイテンシの一覧をまとめる（時間はミリ秒）"""
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+    if transferred is not None:
+        result["mb_per_s"] = round(transferred / elapsed / 1e6, 1) if elapsed else 0.0
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def grow_video_files(root, count, size):
+    """先頭から count 件のMP4を size バイトに広げ（スパースファイル）、相対パスの一覧を返す"""
+    paths = []
+    for path in sorted(Path(root).rglob("*.mp4"))[:count]:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+        paths.append(str(path.relative_to(root)).replace("\\", "/"))
+    return paths
+
+
+def bench_scan(root, repeat, workers):
+    """フルスキャンと変更なしの差分スキャンの所要時間"""
+    import main  # NAS_PATH 設定後に読み込む
+
+    def best_of(scan):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            scan()
+            elapsed = time.perf_counter() - started
+            if best is None or elapsed < best[0]:
+                best = (elapsed, dict(scanner.last_scan_stats))
+        return best
+
+    scanner = main.NASDataScanner(root, max_workers=workers)
+    scanner.MTIME_SETTLE_SECONDS = 0
+    results = {}
+    for mode, scan in [("full", lambda: scanner.scan_directories()),
+                       ("incremental", lambda: scanner.scan_directories(incremental=True))]:
+        elapsed, stats = best_of(scan)
+        results[mode] = {
+            "seconds": round(elapsed, 3),
+            "files_per_s": round(len(scanner.cached_data) / elapsed) if elapsed else 0,
+            "records": len(scanner.cached_data),
+            **{key: stats[key] for key in ("listed_dirs", "skipped_dirs", "stat_ms", "parse_ms", "list_ms",
+                                           "day_scan_ms", "sort_ms", "query_index_ms") if key in stats}
+        }
+    return results
+
+
+def serve(root, port):
+    """ベンチマーク用サーバー（子プロセスで実行）"""
+    os.environ["NAS_PATH"] = root
+    import uvicorn
+    import main  # NAS_PATH 設定後に読み込む
+
+    logging.disable(logging.WARNING)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(root):
+    """ベンチマーク用サーバーを子プロセスで起動し、(プロセス, ポート番号) を返す（起動時のスキャン完了まで待つ）"""
+    import httpx
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, NAS_INDEX_DB="", NAS_WATCH="", NAS_SCAN_INTERVAL="0", NAS_VIDEO_CACHE_DIR="",
+               NAS_THUMBNAIL_DIR="", NAS_LOG_LEVEL="WARNING")
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(port), "--root", root], stdout=subprocess.DEVNULL, env=env
+    )
+    deadline = time.time() + 1800
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/scan-stats", timeout=5).json().get("scan_stats"):
+                return process, port
+        except (httpx.HTTPError, ValueError):
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("ベンチマーク用サーバーが起動しませんでした")
+
+
+async def run_api_load(client, path, params, clients, duration, paged):
+    """1種類のリクエストを clients 並列で duration 秒送り続ける"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            query = dict(params, page=rng.randint(1, MAX_PAGE)) if paged else params
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params=query)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(clients)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run_video_load(client, paths, file_size, clients, duration, read_size):
+    """ランダムな位置への Range リクエスト（シーク）を clients 並列で duration 秒送り続ける"""
+    latencies = []
+    errors = 0
+    transferred = 0
+    deadline = time.perf_counter() + duration
+
+    async def viewer(seed):
+        nonlocal errors, transferred
+        rng = random.Random(seed)
+        path = rng.choice(paths)
+        while time.perf_counter() < deadline:
+            start = rng.randrange(0, max(1, file_size - read_size))
+            headers = {"Range": f"bytes={start}-{start + read_size - 1}"}
+            started = time.perf_counter()
+            try:
+                response = await client.get("/api/video", params={"path": path}, headers=headers)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 206:
+                errors += 1
+            transferred += len(response.content)
+            if rng.random() < 0.1:
+                path = rng.choice(paths)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(viewer(i) for i in range(clients)))
+    return summarize(latencies, time.perf_counter() - started, errors, transferred)
+
+
+async def bench_http(base_url, clients, duration, video_paths, video_size, read_size):
+    import httpx
+
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        dates = (await client.get("/api/available-dates")).json().get("dates") or ["2024/01/01"]
+        first_date, last_date = dates[0].replace("/", "-"), dates[min(len(dates) - 1, 6)].replace("/", "-")
+
+        api = {}
+        for name, path, params in API_REQUESTS:
+            params = {key: str(value).format(first_date=first_date, last_date=last_date) for key, value in params.items()}
+            paged = path in ("/api/data", "/api/search") and params.get("pagination") != "cursor"
+            api[name] = await run_api_load(client, path, params, clients, duration, paged)
+            print(f"  {name:<16} {api[name]['rps']:>8.1f} req/s  p50 {api[name]['p50_ms']:>8.2f}ms  "
+                  f"p95 {api[name]['p95_ms']:>8.2f}ms  errors {api[name]['errors']}", file=sys.stderr)
+
+        video = None
+        if video_paths:
+            video = await run_video_load(client, video_paths, video_size, clients, duration, read_size)
+            print(f"  {'video_range':<16} {video['rps']:>8.1f} req/s  {video['mb_per_s']:>8.1f} MB/s  "
+                  f"p95 {video['p95_ms']:>8.2f}ms", file=sys.stderr)
+
+        cache_stats = (await client.get("/api/cache-stats")).json().get("response_cache_stats")
+    return api, video, cache_stats
+
+
+def run(root, args, generated=None):
+    os.environ["NAS_PATH"] = root
+    logging.disable(logging.WARNING)
+    result = {
+        "revision": git_revision(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {"size": args.size if not args.root else None, "clients": args.clients, "duration": args.duration,
+                   "workers": args.workers, "video_files": args.video_files, "video_size_mb": args.video_size,
+                   "read_size_kb": args.read_size},
+        "tree": generated or {"root": root},
+    }
+
+    video_size = args.video_size * 1024 * 1024
+    video_paths = grow_video_files(root, args.video_files, video_size) if args.video_files else []
+
+    print("スキャン", file=sys.stderr)
+    result["scan"] = bench_scan(root, args.repeat, args.workers)
+    result["tree"]["files"] = result["scan"]["full"]["records"]
+
+    print(f"API（クライアント {args.clients}, 各 {args.duration}秒）", file=sys.stderr)
+    process, port = start_server(root)
+    try:
+        result["api"], result["video"], result["response_cache"] = asyncio.run(bench_http(
+            f"http://127.0.0.1:{port}", args.clients, args.duration, video_paths, video_size, args.read_size * 1024
+        ))
+    finally:
+        process.terminate()
+        process.wait()
+    return result
+
+
+def flatten(result, prefix=""):
+    """比較用に数値だけを "scan.full.seconds" のようなキーで取り出す"""
+    values = {}
+    for key, value in (result or {}).items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(before_path, after_path):
+    """2つの結果の数値を並べて表示（scan・api・video の項目のみ）"""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"before: {before.get('revision')} ({before.get('tree', {}).get('files')}件)  "
+          f"after: {after.get('revision')} ({after.get('tree', {}).get('files')}件)")
+    old, new = flatten(before), flatten(after)
+    print(f"{'metric':<40} {'before':>12} {'after':>12} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        if not key.startswith(("scan.", "api.", "video.")):
+            continue
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "-"
+        print(f"{key:<40} {old[key]:>12.6g} {new[key]:>12.6g} {change:>8}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="ベンチマークスイート（結果はJSONで出力）")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k", help="生成する疑似NASツリーの規模")
+    parser.add_argument("--root", help="既存の疑似NASツリー（省略時は一時ディレクトリに生成）")
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    parser.add_argument("--clients", type=int, default=20, help="同時に送るクライアント数")
+    parser.add_argument("--duration", type=float, default=5.0, help="リクエストの種類ごとの負荷時間（秒）")
+    parser.add_argument("--repeat", type=int, default=3, help="スキャンの繰り返し回数（最短時間を記録）")
+    parser.add_argument("--workers", type=int, default=8, help="スキャンの並列スレッド数")
+    parser.add_argument("--video-files", type=int, default=8, help="Range 配信の計測用に広げるMP4ファイル数（0で計測しない）")
+    parser.add_argument("--video-size", type=int, default=64, help="広げるMP4ファイルのサイズ（MB）")
+    parser.add_argument("--read-size", type=int, default=1024, help="1回の Range リクエストで読むサイズ（KB）")
+    parser.add_argument("--txt-ratio", type=float, default=0.5, help="txtファイルを置く日付フォルダの割合")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="2つの結果のJSONを比較して表示")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.root, args.serve)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.root:
+        result = run(args.root, args)
+    else:
+        with tempfile.TemporaryDirectory(prefix="nas_bench_") as root:
+            devices, days, per_category = SIZES[args.size]
+            started = time.perf_counter()
+            count = generate_tree(root, devices=devices, days=days, per_category=per_category, txt_ratio=args.txt_ratio)
+            generated = {"devices": devices, "days": days, "per_category": per_category,
+                         "generated": count, "generate_seconds": round(time.perf_counter() - started, 1)}
+            print(f"{count}件のMP4ファイルを生成 ({generated['generate_seconds']}s)", file=sys.stderr)
+            result = run(root, args, generated)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"結果を出力しました: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
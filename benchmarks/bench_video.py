@@ -0,0 +1,209 @@
+"""
+/api/video の負荷ベンチマーク
+
+疑似NASツリー（指定サイズのMP4）に対して、シーク操作を模した Range リクエスト
+（ランダムな位置から指定バイト数）を多数のクライアントから同時に送り、スループットと
+レイテンシを計測する。負荷をかけている間に /api/scan-stats を定期的に呼び出し、
+動画配信がイベントループを止めていないか（他のAPIの応答時間）も確認する。
+
+比較用に変更前のブロッキング読み込みの実装を /bench/legacy-video として同じサーバーに追加する。
+サーバーは別プロセスの uvicorn で起動し、--nas-latency-ms で1回の読み込みごとの遅延（遅いNAS）を模擬できる。
+
+使い方:
+    python benchmarks/bench_video.py --clients 50 --duration 10 --nas-latency-ms 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "fastapi_table_app"))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from synthetic_nas import generate_tree  # noqa: E402
+
+
+def add_legacy_route(main, nas_latency):
+    """変更前の get_video（async ジェネレーター内でブロッキング open/read）を比較用に再現"""
+    from fastapi import Query, Request
+    from fastapi.responses import StreamingResponse
+
+    async def legacy_get_video(request: Request, path: str = Query(...)):
+        video_path = main.scanner.get_video_file_path(main.scanner.decode_path(path))
+        file_size = video_path.stat().st_size
+        range_match = re.match(r'bytes=(\d+)-(\d*)', request.headers.get('Range', ''))
+        start = int(range_match.group(1))
+        end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
+        content_length = end - start + 1
+
+        async def video_stream():
+            with open(video_path, 'rb') as f:
+                f.seek(start)
+                remaining = content_length
+                while remaining > 0:
+                    time.sleep(nas_latency)
+                    data = f.read(min(1024 * 1024, remaining))
+                    if not data:
+                        break
+                    yield data
+                    remaining -= len(data)
+
+        return StreamingResponse(video_stream(), status_code=206, headers={
+            'Content-Range': f'bytes {start}-{end}/{file_size}',
+            'Content-Length': str(content_length),
+            'Content-Type': 'video/mp4'
+        })
+
+    main.app.add_api_route("/bench/legacy-video", legacy_get_video, methods=["GET"])
+
+
+def serve(root, port, nas_latency):
+    """ベンチマーク用サーバー（子プロセスで実行）"""
+    os.environ["NAS_PATH"] = root
+    import main  # NAS_PATH 設定後に読み込む
+    import video_serving
+
+    logging.disable(logging.WARNING)
+    add_legacy_route(main, nas_latency)
+    read_at = video_serving._read_at
+
+    def slow_read_at(f, offset, size):
+        time.sleep(nas_latency)
+        return read_at(f, offset, size)
+
+    video_serving._read_at = slow_read_at
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(root, nas_latency):
+    """ベンチマーク用サーバーを子プロセスで起動し、(プロセス, ポート番号) を返す"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(port), "--root", root, "--nas-latency-ms", str(nas_latency * 1000)],
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/scan-stats").status_code == 200:
+                return process, port
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("ベンチマーク用サーバーが起動しませんでした")
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+async def run_load(base_url, endpoint, paths, file_size, clients, duration, read_size):
+    latencies = []
+    probe_latencies = []
+    transferred = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=clients + 1)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def viewer(seed):
+            nonlocal transferred
+            rng = random.Random(seed)
+            path = rng.choice(paths)
+            while time.perf_counter() < deadline:
+                # シーク: ランダムな位置から read_size バイト
+                start = rng.randrange(0, max(1, file_size - read_size))
+                headers = {"Range": f"bytes={start}-{start + read_size - 1}"}
+                started = time.perf_counter()
+                response = await client.get(endpoint, params={"path": path}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                transferred += len(response.content)
+                if rng.random() < 0.1:
+                    path = rng.choice(paths)
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.get("/api/scan-stats")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(viewer(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "mb_per_s": transferred / elapsed / 1e6,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "probe_p50_ms": percentile(probe_latencies, 0.5) * 1000,
+        "probe_p95_ms": percentile(probe_latencies, 0.95) * 1000,
+    }
+
+
+def run(root, clients, duration, read_size, nas_latency):
+    paths = sorted(str(p.relative_to(root)).replace("\\", "/") for p in Path(root).rglob("*.mp4"))
+    file_size = (Path(root) / paths[0]).stat().st_size
+    process, port = start_server(root, nas_latency)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"{len(paths)}ファイル × {file_size // (1024 * 1024)}MB, クライアント {clients}, {duration}秒, "
+          f"1リクエスト {read_size // 1024}KB, NAS遅延 {nas_latency * 1000:.0f}ms/読み込み")
+    print(f"{'implementation':<22} {'req':>7} {'req/s':>8} {'MB/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'api p50':>8} {'api p95':>8}")
+    try:
+        for name, endpoint in [("legacy blocking read", "/bench/legacy-video"), ("thread pool read", "/api/video")]:
+            result = asyncio.run(run_load(base_url, endpoint, paths, file_size, clients, duration, read_size))
+            print(f"{name:<22} {result['requests']:>7} {result['rps']:>8.1f} {result['mb_per_s']:>8.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['probe_p50_ms']:>8.1f} {result['probe_p95_ms']:>8.1f}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="/api/video の負荷ベンチマーク")
+    parser.add_argument("--root", help="既存の疑似NASツリー（省略時は一時ディレクトリに生成）")
+    parser.add_argument("--files", type=int, default=8, help="生成するMP4ファイル数")
+    parser.add_argument("--file-size", type=int, default=32, help="生成するMP4ファイルのサイズ（MB）")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--read-size", type=int, default=1024, help="1リクエストで読むサイズ（KB）")
+    parser.add_argument("--nas-latency-ms", type=float, default=0.0, help="1回の読み込みごとに加える遅延（遅いNASの模擬）")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    nas_latency = args.nas_latency_ms / 1000
+
+    if args.serve:
+        serve(args.root, args.serve, nas_latency)
+        return
+    if args.root:
+        run(args.root, args.clients, args.duration, args.read_size * 1024, nas_latency)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="nas_bench_") as root:
+        generate_tree(root, devices=1, days=1, per_category=max(1, args.files // 4),
+                      txt_ratio=0, file_size=args.file_size * 1024 * 1024)
+        run(root, args.clients, args.duration, args.read_size * 1024, nas_latency)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,73 @@
+"""
+ベンチマーク用の疑似NASツリー生成スクリプト
+
+機器名/年/月/日/カテゴリフォルダ/*.mp4 の固定階層で空のMP4ファイルを生成する。
+ファイル名は came01_YYYY-MM-DD-HH_MM_SS-N[_merged_M].mp4 の形式。
+
+使い方:
+    python benchmarks/synthetic_nas.py OUT_DIR --devices 4 --days 90 --per-category 70
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+CATEGORY_FOLDERS = ["エラーフォルダ", "その他フォルダ", "誤検知フォルダ", "人物フォルダ"]
+
+
+def generate_tree(root: str, devices: int = 4, days: int = 90, per_category: int = 70,
+                  start_date: str = "2024-01-01", txt_ratio: float = 0.5,
+                  merged_ratio: float = 0.1, file_size: int = 0, seed: int = 0) -> int:
+    """疑似NASツリーを生成して作成したMP4ファイル数を返す"""
+    rng = random.Random(seed)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    payload = b"\0" * file_size
+    created = 0
+
+    for device_index in range(devices):
+        device = f"came{device_index + 1:02d}"
+        for day_offset in range(days):
+            day = start + timedelta(days=day_offset)
+            day_path = os.path.join(root, device, f"{day:%Y}", f"{day:%m}", f"{day:%d}")
+            for category in CATEGORY_FOLDERS:
+                category_path = os.path.join(day_path, category)
+                os.makedirs(category_path, exist_ok=True)
+                for number in range(per_category):
+                    recorded = day + timedelta(seconds=rng.randrange(86400))
+                    name = f"{device}_{recorded:%Y-%m-%d-%H_%M_%S}-{number}"
+                    if rng.random() < merged_ratio:
+                        name += f"_merged_{rng.randrange(1, 10)}"
+                    with open(os.path.join(category_path, name + ".mp4"), "wb") as f:
+                        f.write(payload)
+                    created += 1
+            if rng.random() < txt_ratio:
+                with open(os.path.join(day_path, "detection.txt"), "w", encoding="utf-8") as f:
+                    f.write("synthetic\n")
+
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の疑似NASツリーを生成")
+    parser.add_argument("root", help="出力先ディレクトリ")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-category", type=int, default=70, help="カテゴリフォルダあたりのMP4ファイル数")
+    parser.add_argument("--start-date", default="2024-01-01")
+    parser.add_argument("--txt-ratio", type=float, default=0.5, help="txtファイルを置く日付フォルダの割合")
+    parser.add_argument("--merged-ratio", type=float, default=0.1, help="_merged_N 付きファイル名の割合")
+    parser.add_argument("--file-size", type=int, default=0, help="各MP4ファイルのバイト数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    count = generate_tree(
+        args.root, devices=args.devices, days=args.days, per_category=args.per_category,
+        start_date=args.start_date, txt_ratio=args.txt_ratio, merged_ratio=args.merged_ratio,
+        file_size=args.file_size, seed=args.seed
+    )
+    print(f"{count}件のMP4ファイルを生成しました: {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+カタログ更新のブラウザへの通知（Server-Sent Events）
+
+スキャン・監視モードでカタログが変わるたびに、追加・更新されたレコードと削除されたファイルパスを
+接続中のクライアントへ配信する。スキャンはワーカースレッドで行われるため、publish はどのスレッドから
+呼んでもよく、各クライアントのキューへの追加はイベントループ上で行う。
+
+- 1回の変更で MAX_EVENT_RECORDS 件を超える場合やフルスキャンの場合はレコードを送らず reset を通知する
+- 受け取りが追いつかないクライアントはキューを空にして reset を1件だけ送る（取りこぼしは再取得で回復させる）
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 1イベントで送るレコード数の上限
+MAX_EVENT_RECORDS = 500
+
+# クライアントごとに溜めておくイベント数の上限
+CLIENT_QUEUE_SIZE = 64
+
+
+class CatalogEventBroker:
+    """カタログ更新イベントを接続中のクライアント（asyncio.Queue）へ配信する"""
+
+    def __init__(self, max_records: int = MAX_EVENT_RECORDS, queue_size: int = CLIENT_QUEUE_SIZE,
+                 serialize: Optional[Callable[[List], List[Dict]]] = None):
+        self.max_records = max_records
+        # レコードをJSONにできる辞書へ変換する関数（送るときだけ変換する）
+        self.serialize = serialize or list
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self.counters = {"published": 0, "resets": 0, "overflows": 0}
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """配信に使うイベントループを設定（起動時に呼び出す）"""
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._clients.discard(queue)
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, changed: List, removed_paths: set, full_scan: bool, version: int, total: int) -> None:
+        """カタログの変更を配信（どのスレッドから呼んでもよい）"""
+        if self._loop is None or not self.client_count():
+            return
+        reset = full_scan or len(changed) + len(removed_paths) > self.max_records
+        event = {
+            "type": "reset" if reset else "delta",
+            "catalog_version": version,
+            "total": total,
+            "changed_count": len(changed),
+            "removed_count": len(removed_paths),
+        }
+        if not reset:
+            event["changed"] = self.serialize(changed)
+            event["removed"] = sorted(removed_paths)
+        self.counters["published"] += 1
+        if reset:
+            self.counters["resets"] += 1
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, json.dumps(event, ensure_ascii=False), version)
+        except RuntimeError:
+            # イベントループが終了している（シャットダウン中）
+            pass
+
+    def _dispatch(self, payload: str, version: int) -> None:
+        """各クライアントのキューへ追加（イベントループ上で実行）"""
+        with self._lock:
+            clients = list(self._clients)
+        for queue in clients:
+            try:
+                queue.put_nowait((version, payload))
+            except asyncio.QueueFull:
+                self.counters["overflows"] += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait((version, json.dumps({"type": "reset", "catalog_version": version}, ensure_ascii=False)))
+
+    def get_stats(self) -> Dict:
+        return dict(self.counters, clients=self.client_count())
+
+
+def format_sse(payload: str, event: str = "catalog", event_id: Optional[int] = None) -> str:
+    """Server-Sent Events の1イベント分の文字列を作成"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
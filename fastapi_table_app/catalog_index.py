@@ -0,0 +1,211 @@
+"""
+SQLiteによるカタログの永続インデックス
+
+スキャン結果（1録画1行）と差分スキャン用のディレクトリmtimeをSQLite（WALモード）に保存し、
+再起動時にNASを全走査せずにカタログを復元できるようにする（検索はメモリ上の列指向インデックスで行う）。
+MP4ヘッダーの読み取り結果は (ファイルパス, サイズ, mtime) ごとに media_info に保存し、再起動後も読み直さない。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog_record import CatalogRecord
+from media_info import MediaInfo, MediaInfoResult
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = "5"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    file_path TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sort_timestamp INTEGER NOT NULL,
+    txt INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_ts ON recordings (sort_timestamp, device, file_path);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    children TEXT NOT NULL,
+    txt INTEGER
+);
+CREATE TABLE IF NOT EXISTS media_info (
+    file_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    codec TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _record_row(record: CatalogRecord) -> Tuple:
+    return (
+        record.file_path, record.device, record.category, record.timestamp, int(record.txt), record.size
+    )
+
+
+def _media_info(values: Tuple) -> Optional[MediaInfo]:
+    # 列がすべて NULL なら情報なし（読み取り済みだが解釈できなかったファイル、または未読み取り）
+    return MediaInfo(*values) if any(value is not None for value in values) else None
+
+
+def _row_record(row: Tuple) -> CatalogRecord:
+    file_path, device, category, sort_timestamp, txt, size, *media = row
+    media_info = _media_info(tuple(media)) if media else None
+    return CatalogRecord(device, category, file_path, sort_timestamp, txt, size, media_info)
+
+
+class CatalogIndex:
+    """カタログをSQLiteに永続化するインデックス"""
+
+    def __init__(self, db_path: str, base_path: str):
+        self.db_path = db_path
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        # NASパスやスキーマが変わった場合は古いインデックスを破棄する
+        meta = self._read_meta()
+        if meta.get("schema_version") != SCHEMA_VERSION or meta.get("base_path") != base_path:
+            if meta:
+                logger.info(f"インデックスの前提が変わったため破棄します: {db_path}")
+            if meta.get("schema_version") != SCHEMA_VERSION:
+                # 列構成が変わっている可能性があるためテーブルごと作り直す
+                with self._lock, self._conn:
+                    self._conn.execute("DROP TABLE IF EXISTS recordings")
+                    self._conn.execute("DROP TABLE IF EXISTS directories")
+                    self._conn.execute("DROP TABLE IF EXISTS media_info")
+                self._conn.executescript(SCHEMA)
+            self.clear()
+        logger.info(f"カタログインデックスを開きました: {db_path}")
+
+    def _read_meta(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def clear(self) -> None:
+        """インデックスの内容をすべて削除"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM recordings")
+            self._conn.execute("DELETE FROM directories")
+            self._conn.execute("DELETE FROM media_info")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [("schema_version", SCHEMA_VERSION), ("base_path", self.base_path)]
+            )
+
+    def load(self) -> Optional[Tuple[List[CatalogRecord], Dict[str, Dict], Dict[str, Dict], datetime]]:
+        """保存済みのカタログを読み込む
+
+        戻り値は (撮影時間順のレコード, ディレクトリ状態, カテゴリフォルダ別レコード, 最終スキャン時刻)。
+        一度もスキャン結果を保存していない場合は None
+        """
+        meta = self._read_meta()
+        if "last_scan_time" not in meta:
+            return None
+
+        with self._lock:
+            # ヘッダー情報はサイズが一致するもの（読み取り後にファイルが変わっていないもの）だけ付ける
+            rows = self._conn.execute(
+                "SELECT r.file_path, r.device, r.category, r.sort_timestamp, r.txt, r.size, "
+                "m.duration, m.width, m.height, m.codec "
+                "FROM recordings r LEFT JOIN media_info m ON m.file_path = r.file_path AND m.size = r.size "
+                "ORDER BY r.sort_timestamp, r.device, r.file_path"
+            ).fetchall()
+            dir_rows = self._conn.execute("SELECT path, mtime, children, txt FROM directories").fetchall()
+
+        records = [_row_record(row) for row in rows]
+        category_records: Dict[str, Dict] = {}
+        for record in records:
+            full_path = record.full_path(self.base_path)
+            category_records.setdefault(os.path.dirname(full_path), {})[os.path.basename(full_path)] = record
+
+        dir_state = {}
+        for path, mtime, children, txt in dir_rows:
+            state = {"mtime": mtime, "children": json.loads(children)}
+            if txt is not None:
+                state["txt"] = bool(txt)
+            dir_state[path] = state
+
+        return records, dir_state, category_records, datetime.fromisoformat(meta["last_scan_time"])
+
+    def save_scan(self, full_scan: bool, records: Iterable[CatalogRecord], removed_paths: Iterable[str],
+                  dir_state: Dict[str, Dict], scan_time: datetime, removed_dirs: Iterable[str] = ()) -> None:
+        """スキャン結果を保存（フルスキャン時は全置換、差分スキャン時は変更分のみ）
+
+        records には追加・更新されたレコード（フルスキャン時は全レコード）を、dir_state には
+        記録し直したディレクトリの状態（フルスキャン時は全ディレクトリ）を、removed_dirs には消えたディレクトリを渡す
+        """
+        with self._lock, self._conn:
+            if full_scan:
+                self._conn.execute("DELETE FROM recordings")
+            else:
+                self._conn.executemany("DELETE FROM recordings WHERE file_path = ?", ((p,) for p in removed_paths))
+                self._conn.executemany("DELETE FROM media_info WHERE file_path = ?", ((p,) for p in removed_paths))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recordings "
+                "(file_path, device, category, sort_timestamp, txt, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (_record_row(record) for record in records)
+            )
+            if full_scan:
+                # なくなったファイルのヘッダー情報も消す
+                self._conn.execute("DELETE FROM media_info WHERE file_path NOT IN (SELECT file_path FROM recordings)")
+            if full_scan:
+                self._conn.execute("DELETE FROM directories")
+            else:
+                self._conn.executemany("DELETE FROM directories WHERE path = ?", ((p,) for p in removed_dirs))
+            if dir_state:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO directories (path, mtime, children, txt) VALUES (?, ?, ?, ?)",
+                    (
+                        (path, state["mtime"], json.dumps(state["children"], ensure_ascii=False),
+                         None if "txt" not in state else int(state["txt"]))
+                        for path, state in dir_state.items()
+                    )
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_scan_time', ?)", (scan_time.isoformat(),)
+            )
+
+    def load_media_info(self) -> List[MediaInfoResult]:
+        """保存済みのMP4ヘッダーの読み取り結果（情報なしのファイルを含む）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path, size, mtime_ns, duration, width, height, codec FROM media_info"
+            ).fetchall()
+        return [MediaInfoResult(row[0], row[1], row[2], _media_info(row[3:])) for row in rows]
+
+    def save_media_info(self, results: Iterable[MediaInfoResult]) -> None:
+        """MP4ヘッダーの読み取り結果を保存（情報なしの場合は列を NULL にして読み取り済みだけ記録）"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media_info (file_path, size, mtime_ns, duration, width, height, codec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (result.file_path, result.size, result.mtime_ns) + (tuple(result.info) if result.info else (None,) * 4)
+                    for result in results
+                )
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
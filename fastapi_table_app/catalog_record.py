@@ -0,0 +1,95 @@
+"""
+カタログのレコード（録画1件分）
+
+1件ごとに辞書と表示用の文字列を持つと、100万件規模ではメモリの大半が
+重複した文字列（機器名・カテゴリ・日付・日時の表示・フルパス）で占められる。
+そのため __slots__ のオブジェクトに最小限の値だけを持たせる。
+
+- 機器名・カテゴリは sys.intern で全レコードから同じ文字列オブジェクトを参照する
+- 撮影時間は整数のタイムスタンプ、txtの有無は bool で持つ
+- パスはNASルートからの相対パスだけを持ち、日付（YYYY/MM/DD）とフルパスはそこから求める
+- 表示用の日時文字列などは to_dict でレスポンスを作るときにだけ作る
+- 公開したカタログのレコードは書き換えず、サイズやtxtの有無が変わった場合は replace で作り直す
+- MP4ヘッダーの情報（長さ・解像度・コーデック）は読み取り済みの場合だけ media に MediaInfo を持つ
+"""
+
+import os
+import sys
+import time
+from typing import Dict, Tuple
+
+OPTION_LABELS = ("なし", "あり")
+
+
+def format_datetime(timestamp: float) -> str:
+    """タイムスタンプを日本語の日時文字列に変換（YYYY年MM月DD日 HH時MM分SS秒）"""
+    try:
+        local = time.localtime(timestamp)
+    except (OverflowError, OSError, ValueError):
+        return "unknown_time"
+    return (f"{local.tm_year:04d}年{local.tm_mon:02d}月{local.tm_mday:02d}日 "
+            f"{local.tm_hour:02d}時{local.tm_min:02d}分{local.tm_sec:02d}秒")
+
+
+class CatalogRecord:
+    """録画1件分のレコード
+
+    file_path は "機器名/年/月/日/カテゴリフォルダ/ファイル名" の相対パス
+    """
+
+    __slots__ = ("device", "category", "file_path", "timestamp", "txt", "size", "media")
+
+    def __init__(self, device: str, category: str, file_path: str, timestamp: float, txt: bool, size: int = 0,
+                 media=None):
+        self.device = sys.intern(device)
+        self.category = sys.intern(category)
+        self.file_path = file_path
+        self.timestamp = int(timestamp)
+        self.txt = bool(txt)
+        self.size = size
+        self.media = media
+
+    def replace(self, **changes) -> "CatalogRecord":
+        """一部の値を変えた新しいレコード（公開済みのカタログが参照しているレコードは書き換えない）"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return CatalogRecord(**values)
+
+    @property
+    def date(self) -> str:
+        """日付フォルダの YYYY/MM/DD"""
+        return "/".join(self.file_path.split("/", 4)[1:4])
+
+    @property
+    def option(self) -> str:
+        """日付フォルダ直下のtxtの有無（あり / なし）"""
+        return OPTION_LABELS[self.txt]
+
+    def key(self) -> Tuple[int, str, str]:
+        """カタログの並び順を決めるキー（撮影時間 → 機器名 → ファイルパス）"""
+        return (self.timestamp, self.device, self.file_path)
+
+    def full_path(self, base_path: str) -> str:
+        return os.path.join(base_path, *self.file_path.split("/"))
+
+    def to_dict(self, base_path: str) -> Dict:
+        """APIレスポンス用の辞書（表示用の文字列はここで作る）"""
+        media = self.media
+        return {
+            "id": self.device,
+            "datetime": format_datetime(self.timestamp),
+            "option": OPTION_LABELS[self.txt],
+            "category": self.category,
+            "file_path": self.file_path,
+            "full_path": self.full_path(base_path),
+            "date": self.date,
+            "sort_timestamp": self.timestamp,
+            "size": self.size,
+            "duration": media.duration if media is not None else None,
+            "width": media.width if media is not None else None,
+            "height": media.height if media is not None else None,
+            "codec": media.codec if media is not None else None
+        }
+
+    def __repr__(self) -> str:
+        return f"CatalogRecord({self.file_path!r}, timestamp={self.timestamp})"
@@ -0,0 +1,134 @@
+"""
+カタログの集計（/api/stats）
+
+機器名 × カテゴリ × 日付ごとの件数・合計バイト数と、撮影時刻（0〜23時）ごとの件数を
+カウンタとして保持し、スキャンのたびに追加・削除されたレコードの分だけ増減させる。
+リクエストのたびにカタログ全件を走査しない。集計結果はカタログ番号ごとに1度だけ組み立てる。
+
+カウンタはどのカタログ番号のものかを一緒に持ち、増減はカタログの公開と同時に行う
+（スキャン中の未公開の変更を現在の番号の集計として返さない）。
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog_record import CatalogRecord
+
+CellKey = Tuple[str, str, str]
+Tally = Tuple[Dict[CellKey, List[int]], List[int]]
+
+
+def _hour_of(record: CatalogRecord) -> int:
+    return time.localtime(record.timestamp).tm_hour
+
+
+def _add(cells: Dict[CellKey, List[int]], hours: List[int], records: Iterable[CatalogRecord], sign: int) -> None:
+    for record in records:
+        key = (record.device, record.category, record.date)
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0, 0]
+        cell[0] += sign
+        cell[1] += sign * record.size
+        if cell[0] <= 0:
+            del cells[key]
+        hours[_hour_of(record)] += sign
+
+
+class CatalogStats:
+    """機器名 × カテゴリ × 日付の件数・バイト数と、時刻別件数のカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (機器名, カテゴリ, 日付) → [件数, 合計バイト数]
+        self._cells: Dict[CellKey, List[int]] = {}
+        self._hours = [0] * 24
+        # カウンタがどのカタログ番号のものか
+        self._version = 0
+        self._summary: Optional[Dict] = None
+
+    @staticmethod
+    def tally(records: Iterable[CatalogRecord]) -> Tally:
+        """全レコードを集計したカウンタ（reset に渡す。ロックを取らずに作れるため公開前に用意しておく）"""
+        cells: Dict[CellKey, List[int]] = {}
+        hours = [0] * 24
+        _add(cells, hours, records, 1)
+        return cells, hours
+
+    def reset(self, tally: Tally, version: int) -> None:
+        """tally で集計したカウンタに置き換える（フルスキャン・インデックス復元時）"""
+        with self._lock:
+            self._cells, self._hours = tally
+            self._version = version
+            self._summary = None
+
+    def apply(self, added: Iterable[CatalogRecord], removed: Iterable[CatalogRecord], version: int) -> None:
+        """追加・削除されたレコードの分だけカウンタを増減し、カタログ番号 version のカウンタとする
+
+        サイズの変わったレコードは、新しいレコードを added に、古いレコードを removed に渡す
+        """
+        with self._lock:
+            _add(self._cells, self._hours, added, 1)
+            _add(self._cells, self._hours, removed, -1)
+            self._version = version
+            self._summary = None
+
+    def export_state(self) -> Dict:
+        """カウンタをJSONにできる形で取り出す（共有カタログファイルに書き出し、読み取り側で load_state する）"""
+        with self._lock:
+            return {
+                "cells": [[device, category, date, count, size]
+                          for (device, category, date), (count, size) in self._cells.items()],
+                "hours": list(self._hours)
+            }
+
+    def load_state(self, state: Dict, version: int) -> None:
+        """export_state で取り出したカウンタに置き換える"""
+        with self._lock:
+            self._cells = {(device, category, date): [count, size]
+                           for device, category, date, count, size in state.get("cells", [])}
+            self._hours = list(state.get("hours") or [0] * 24)
+            self._version = version
+            self._summary = None
+
+    def summary(self) -> Dict:
+        """集計結果を取得（catalog_version はカウンタのカタログ番号。同じ番号の間は組み立て済みの結果を返す）"""
+        with self._lock:
+            if self._summary is None:
+                self._summary = self._build_summary(self._version)
+            return self._summary
+
+    def dates(self) -> Tuple[int, List[str]]:
+        """カウンタのカタログ番号と、録画のある日付の一覧（昇順）"""
+        with self._lock:
+            return self._version, sorted({date for _, _, date in self._cells})
+
+    def _build_summary(self, version: int) -> Dict:
+        by_device: Dict[str, Dict] = {}
+        by_category: Dict[str, Dict] = {}
+        by_day: Dict[str, Dict] = {}
+        cells = []
+        total = 0
+        total_bytes = 0
+        for (device, category, date), (count, size) in sorted(self._cells.items()):
+            cells.append({"device": device, "category": category, "date": date, "count": count, "bytes": size})
+            for bucket, key in ((by_device, device), (by_category, category), (by_day, date)):
+                entry = bucket.setdefault(key, {"count": 0, "bytes": 0})
+                entry["count"] += count
+                entry["bytes"] += size
+            total += count
+            total_bytes += size
+        days = sorted(by_day)
+        return {
+            "catalog_version": version,
+            "total": total,
+            "total_bytes": total_bytes,
+            "oldest_date": days[0] if days else None,
+            "newest_date": days[-1] if days else None,
+            "by_device": by_device,
+            "by_category": by_category,
+            "by_day": {day: by_day[day] for day in days},
+            "by_hour": list(self._hours),
+            "cells": cells
+        }
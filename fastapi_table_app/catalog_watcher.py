@@ -0,0 +1,341 @@
+"""
+NASフォルダの監視（監視モード）
+
+録画の追加・移動・削除を検知し、変更のあった日付フォルダ（機器名/年/月/日）だけを
+カタログへ反映する。定期的な全体スキャンやリフレッシュボタンを押さなくても新着が反映される。
+
+- inotify: NASがローカルのファイルシステムとしてマウントされている場合（Linuxのみ）。
+  機器名〜カテゴリフォルダの各ディレクトリを監視し、MP4の書き込み完了・移動・削除と
+  txtの有無の変化を日付フォルダ単位にまとめて通知する
+- ポーリング: ネットワークファイルシステム（NFS/SMB等、inotifyが届かない）やLinux以外の場合。
+  一定間隔で今日の日付フォルダだけを差分スキャンする（mtimeが変わっていなければ stat のみ）
+
+どちらもイベントを DEBOUNCE_SECONDS の間まとめてから apply(日付フォルダの集合, 全体スキャンが必要か) を呼ぶ。
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 変更を検知してから反映するまで待つ秒数（この間の変更はまとめて反映する）
+DEBOUNCE_SECONDS = 1.0
+
+# inotifyが届かないファイルシステム（/proc/mounts の種別）
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "ceph", "glusterfs", "fuse.rclone"}
+
+# inotify のイベント種別（<sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 監視するディレクトリの深さ（ベースパス=0, 機器名=1, 年=2, 月=3, 日=4, カテゴリ=5）
+DAY_DEPTH = 4
+CATEGORY_DEPTH = 5
+
+ApplyFunc = Callable[[Set[str], bool], None]
+
+
+def is_network_filesystem(path: str) -> bool:
+    """path を含むマウントがネットワークファイルシステムか判定（判定できない場合は False）"""
+    try:
+        real = os.path.realpath(path)
+        best, fstype = "", ""
+        with open("/proc/mounts", encoding="utf-8") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (real == mount_point or real.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+                    best, fstype = mount_point, fields[2]
+        return fstype in NETWORK_FILESYSTEMS
+    except OSError:
+        return False
+
+
+def _load_libc():
+    """inotify を使える libc を読み込む（Linux以外、または見つからない場合は None）"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class _Watcher(abc.ABC):
+    """監視スレッドの共通部分（変更のあった日付フォルダをまとめて apply へ渡す）"""
+
+    name = "watcher"
+
+    def __init__(self, base_path: str, apply: ApplyFunc):
+        self.base_path = os.path.abspath(base_path)
+        self.apply = apply
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._dirty: Set[str] = set()
+        self._rescan = False
+        self._first_change: Optional[float] = None
+        self._last_change: Optional[float] = None
+        self.stats = {"mode": self.name, "events": 0, "applied": 0, "rescans": 0, "errors": 0}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run_safely, name=f"nas-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, pending=len(self._dirty))
+
+    def _run_safely(self) -> None:
+        try:
+            self._run()
+        except Exception as e:
+            logger.error(f"フォルダ監視 ({self.name}) が停止しました: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+    @abc.abstractmethod
+    def _run(self) -> None:
+        """監視ループ本体（_stop が立つまで変更を _mark し、_flush で反映する）"""
+
+    def _mark(self, day_rel: Optional[str] = None, rescan: bool = False) -> None:
+        """変更を記録（day_rel は "機器名/年/月/日"、rescan=True は階層全体の差分スキャンが必要な変更）"""
+        now = time.monotonic()
+        if day_rel:
+            self._dirty.add(day_rel)
+        self._rescan = self._rescan or rescan
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+        self.stats["events"] += 1
+
+    def _flush(self, force: bool = False) -> None:
+        """変更が落ち着いたら（または溜め始めてから時間が経ったら）まとめて反映"""
+        if self._first_change is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_change < DEBOUNCE_SECONDS and now - self._first_change < DEBOUNCE_SECONDS * 5:
+            return
+        dirty, rescan = self._dirty, self._rescan
+        self._dirty, self._rescan = set(), False
+        self._first_change = self._last_change = None
+        try:
+            self.apply(dirty, rescan)
+            self.stats["applied"] += 1
+            if rescan:
+                self.stats["rescans"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"フォルダ監視の変更反映エラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+    def _relative_parts(self, path: str):
+        rel = os.path.relpath(path, self.base_path)
+        return [] if rel == "." else rel.replace(os.sep, "/").split("/")
+
+
+class InotifyWatcher(_Watcher):
+    """inotify による監視（機器名〜カテゴリフォルダの全ディレクトリを監視する）"""
+
+    name = "inotify"
+
+    def __init__(self, base_path: str, apply: ApplyFunc, libc):
+        super().__init__(base_path, apply)
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        # ウォッチ番号 → (ディレクトリのパス, 深さ)
+        self._watches: Dict[int, tuple] = {}
+        try:
+            self._add_tree(self.base_path, 0)
+        except OSError:
+            os.close(self._fd)
+            raise
+        self.stats["watches"] = len(self._watches)
+        logger.info(f"inotify によるフォルダ監視を開始: {len(self._watches)}ディレクトリ")
+
+    def stop(self) -> None:
+        super().stop()
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+    def _add_tree(self, path: str, depth: int, mark_days: bool = False) -> None:
+        """path 以下カテゴリフォルダまでのディレクトリを監視対象に追加"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify の監視数の上限に達しました (fs.inotify.max_user_watches)")
+            logger.warning(f"監視を追加できません: {path} ({os.strerror(err)})")
+            return
+        self._watches[wd] = (path, depth)
+        if mark_days and depth == DAY_DEPTH:
+            self._mark("/".join(self._relative_parts(path)))
+        if depth >= CATEGORY_DEPTH:
+            return
+        try:
+            with os.scandir(path) as it:
+                children = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for child in children:
+            self._add_tree(child, depth + 1, mark_days)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], DEBOUNCE_SECONDS / 2)
+            if readable:
+                try:
+                    buffer = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    buffer = b""
+                self._handle_events(buffer)
+            self._flush()
+        self._flush(force=True)
+
+    def _handle_events(self, buffer: bytes) -> None:
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify のイベントが溢れたため全体を差分スキャンします")
+                self._mark(rescan=True)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            watched = self._watches.get(wd)
+            if watched is None:
+                continue
+            self._handle_event(watched[0], watched[1], mask, name)
+
+    def _handle_event(self, path: str, depth: int, mask: int, name: str) -> None:
+        parts = self._relative_parts(path)
+        if mask & IN_DELETE_SELF:
+            # 日付フォルダより上の階層が消えた場合は配下が分からないため全体を差分スキャンする
+            if depth >= DAY_DEPTH:
+                self._mark("/".join(parts[:DAY_DEPTH]))
+            else:
+                self._mark(rescan=True)
+            return
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and depth < CATEGORY_DEPTH:
+                # 新しい年・月・日・カテゴリフォルダは監視を追加し、配下の日付フォルダを反映対象にする
+                try:
+                    self._add_tree(os.path.join(path, name), depth + 1, mark_days=True)
+                except OSError as e:
+                    logger.error(f"新しいフォルダを監視できません: {os.path.join(path, name)} ({e})")
+                    self._mark(rescan=True)
+                self.stats["watches"] = len(self._watches)
+                if depth + 1 > DAY_DEPTH:
+                    self._mark("/".join(parts[:DAY_DEPTH]))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                if depth + 1 >= DAY_DEPTH:
+                    self._mark("/".join((parts + [name])[:DAY_DEPTH]))
+                else:
+                    self._mark(rescan=True)
+            return
+
+        lower = name.lower()
+        if depth == CATEGORY_DEPTH and lower.endswith(".mp4"):
+            # 書き込み中のファイルは完了（IN_CLOSE_WRITE）まで待つ
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                self._mark("/".join(parts[:DAY_DEPTH]))
+        elif depth == DAY_DEPTH and lower.endswith(".txt"):
+            if mask & (IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                self._mark("/".join(parts))
+
+
+class PollingWatcher(_Watcher):
+    """ポーリングによる監視（今日の日付フォルダだけを一定間隔で差分スキャンする）"""
+
+    name = "poll"
+
+    def __init__(self, base_path: str, apply: ApplyFunc, interval: float):
+        super().__init__(base_path, apply)
+        self.interval = max(1.0, interval)
+        self._last_date = None
+        logger.info(f"ポーリングによるフォルダ監視を開始: {self.interval}秒間隔（今日の日付フォルダのみ）")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            today = datetime.now().date()
+            dates = [today]
+            # 日付が変わった直後は前日の書き込み分を取りこぼさないよう前日も確認する
+            if self._last_date is not None and self._last_date != today:
+                dates.append(today - timedelta(days=1))
+            self._last_date = today
+            try:
+                with os.scandir(self.base_path) as it:
+                    devices = [entry.name for entry in it if entry.is_dir()]
+            except OSError as e:
+                logger.error(f"ポーリングで機器フォルダを列挙できません: {e}")
+                continue
+            self._dirty = {f"{device}/{date:%Y/%m/%d}" for device in devices for date in dates}
+            # 今日の日付フォルダは mtime が変わっていなければ stat だけで済む
+            self._first_change = self._last_change = 0.0
+            self._flush(force=True)
+
+
+def create_watcher(mode: str, base_path: str, apply: ApplyFunc, poll_interval: float) -> Optional[_Watcher]:
+    """監視モード（auto / inotify / poll）に応じて監視を作成（開始はしない）
+
+    auto はローカルにマウントされたLinux上のNASなら inotify、それ以外はポーリングを使う
+    """
+    if mode not in ("auto", "inotify", "poll"):
+        logger.error(f"不明な監視モードです: {mode}（auto / inotify / poll）")
+        return None
+
+    if mode in ("auto", "inotify"):
+        libc = _load_libc()
+        if libc is None:
+            logger.info("inotify が使えないためポーリングで監視します")
+        elif mode == "auto" and is_network_filesystem(base_path):
+            logger.info("NASがネットワークファイルシステムのためポーリングで監視します")
+        else:
+            try:
+                return InotifyWatcher(base_path, apply, libc)
+            except OSError as e:
+                logger.warning(f"inotify による監視を開始できないためポーリングで監視します: {e}")
+    return PollingWatcher(base_path, apply, poll_interval)
@@ -0,0 +1,148 @@
+"""
+録画ファイル名の解析
+
+ファイル名は "機器名_YYYY-MM-DD-HH_MM_SS-動画番号[_merged_結合番号].mp4" の形式。
+フルスキャンでは全ファイルを解析するため、1件あたりの処理を軽くする。
+
+- 固定位置の区切り文字を確認し、時・分・秒は2桁の文字列→値の辞書で引く（正規表現・int() を使わない）
+- タイムスタンプは日付ごとに0時の値をキャッシュし、時・分・秒を足して求める
+  （夏時間の切り替えがある日だけは毎回 datetime で求める）
+- 動画番号の後ろに _merged_N 以外が続く名前など、高速判定で扱えないものは従来の正規表現で判定する
+- 解析結果はファイル名ごとに lru_cache で保持する（フルスキャンのやり直しで同じ名前を再解析しない）
+- 形式に合わないファイル名は呼び出し側で UnparsedReport にまとめ、1件ずつログに出さない
+"""
+
+import functools
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+# ファイル名ごとの解析結果のキャッシュ件数
+PARSE_CACHE_SIZE = 65536
+
+# UnparsedReport で保持する例の件数
+MAX_REPORT_SAMPLES = 50
+
+# 高速判定で扱えない名前（全角数字など）の判定用。従来の正規表現と同じ条件
+_FALLBACK_PATTERN = re.compile(r'^([^_]+)_(\d{4})-(\d{2})-(\d{2})-(\d{2})_(\d{2})_(\d{2})-(\d+)')
+_MERGED_MARKER = "_merged_"
+
+# 2桁の時・分・秒の文字列 → 値（int() より辞書引きの方が速く、数字かどうかの確認も兼ねる）
+_TWO_DIGITS = {f"{value:02d}": value for value in range(60)}
+
+# "YYYY-MM-DD" → その日の0時0分0秒のタイムスタンプ（その日に夏時間の切り替えがある場合は None）
+_day_bases: Dict[str, Optional[float]] = {}
+
+
+class ParsedName(NamedTuple):
+    """ファイル名から取り出した値"""
+    timestamp: float          # 撮影時間（ローカル時刻のタイムスタンプ）
+    device: str               # ファイル名中の機器名
+    number: int               # 動画番号
+    merged: Optional[int]     # 結合番号（_merged_N がない場合は None）
+
+
+def _local_timestamp(year: int, month: int, day: int, hour: int, minute: int, second: int) -> float:
+    """ローカル時刻のタイムスタンプ（日時が不正なら ValueError）"""
+    return datetime(year, month, day, hour, minute, second).timestamp()
+
+
+def _day_base(date_text: str) -> Optional[float]:
+    """"YYYY-MM-DD" の0時のタイムスタンプ（夏時間の切り替え日は None、不正な日付は ValueError）"""
+    if date_text in _day_bases:
+        return _day_bases[date_text]
+    if not (date_text[4] == date_text[7] == "-" and date_text[:4].isdecimal()
+            and date_text[5:7].isdecimal() and date_text[8:].isdecimal()):
+        raise ValueError(f"日付の形式が不正です: {date_text}")
+    year, month, day = int(date_text[:4]), int(date_text[5:7]), int(date_text[8:])
+    midnight = datetime(year, month, day)
+    base = midnight.timestamp()
+    # 翌日0時までが24時間でない日（夏時間の切り替え日）は時刻ごとに求める
+    if (midnight + timedelta(days=1)).timestamp() - base != 86400:
+        base = None
+    _day_bases[date_text] = base
+    return base
+
+
+def _parse_fast(stem: str) -> Optional[ParsedName]:
+    """固定位置の区切り文字を確認して解析（形式に合わなければ None）"""
+    sep = stem.find("_")
+    # 機器名_YYYY-MM-DD-HH_MM_SS- の「-」まで
+    end = sep + 21
+    if sep <= 0 or len(stem) <= end:
+        return None
+    if stem[sep + 11] != "-" or stem[sep + 14] != "_" or stem[sep + 17] != "_" or stem[end - 1] != "-":
+        return None
+    hour = _TWO_DIGITS.get(stem[sep + 12:sep + 14])
+    minute = _TWO_DIGITS.get(stem[sep + 15:sep + 17])
+    second = _TWO_DIGITS.get(stem[sep + 18:sep + 20])
+    if hour is None or hour > 23 or minute is None or second is None:
+        return None
+    base = _day_base(stem[sep + 1:sep + 11])
+
+    rest = stem[end:]
+    merged = None
+    marker = rest.find(_MERGED_MARKER)
+    number_text = rest[:marker] if marker >= 0 else rest
+    if not number_text.isdecimal():
+        return None
+    if marker >= 0:
+        merged_text = rest[marker + len(_MERGED_MARKER):]
+        if merged_text.isdecimal():
+            merged = int(merged_text)
+
+    if base is None:
+        date_text = stem[sep + 1:sep + 11]
+        timestamp = _local_timestamp(int(date_text[:4]), int(date_text[5:7]), int(date_text[8:]), hour, minute, second)
+    else:
+        timestamp = base + hour * 3600 + minute * 60 + second
+    return ParsedName(timestamp, stem[:sep], int(number_text), merged)
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_filename(filename: str) -> Optional[ParsedName]:
+    """ファイル名を解析（形式に合わない・日時が不正な場合は None）"""
+    stem = filename.rsplit(".", 1)[0]
+    try:
+        parsed = _parse_fast(stem)
+        if parsed is not None:
+            return parsed
+        # 全角数字など高速判定で扱えない名前は従来の正規表現で確認
+        match = _FALLBACK_PATTERN.match(stem)
+        if match is None:
+            return None
+        device, *fields, number = match.groups()
+        return ParsedName(_local_timestamp(*(int(value) for value in fields)), device, int(number), None)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+class UnparsedReport:
+    """形式に合わないファイル名の一覧（スキャン中の複数スレッドから追加される）"""
+
+    def __init__(self, max_samples: int = MAX_REPORT_SAMPLES):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._paths = set()
+
+    def add(self, path: str) -> None:
+        with self._lock:
+            self._paths.add(path)
+
+    def discard(self, paths) -> None:
+        with self._lock:
+            self._paths.difference_update(paths)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._paths.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._paths)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples: List[str] = sorted(self._paths)[:self.max_samples]
+            return {"count": len(self._paths), "samples": samples}
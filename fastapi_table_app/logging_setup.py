@@ -0,0 +1,137 @@
+"""
+ログ出力の設定（キュー経由の非同期出力・呼び出し箇所ごとの件数制限・実行中のレベル変更）
+
+- ログを出すスレッドはレコードをキューに入れるだけで、ファイル・標準出力への書き込みと
+  整形は QueueListener のスレッドで行う（キューが満杯の場合は待たずに破棄して件数を数える）
+- 同じ呼び出し箇所（ファイル・行）からのログは RATE_LIMIT_WINDOW 秒あたり RATE_LIMIT_COUNT 件までにし、
+  超えた分は次に出力するログに省略件数として付記する（NASの障害時などに同じエラーが大量に出るのを防ぐ）
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# ログキューに溜めておける件数（超えた分は破棄）
+QUEUE_SIZE = 10000
+
+# 呼び出し箇所ごとの件数制限（RATE_LIMIT_WINDOW 秒あたり RATE_LIMIT_COUNT 件）
+RATE_LIMIT_WINDOW = 60.0
+RATE_LIMIT_COUNT = 20
+
+LEVEL_NAMES = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+
+
+class RateLimitFilter(logging.Filter):
+    """呼び出し箇所ごとに一定時間あたりの件数を制限するフィルタ"""
+
+    def __init__(self, window: float = RATE_LIMIT_WINDOW, limit: int = RATE_LIMIT_COUNT):
+        super().__init__()
+        self.window = window
+        self.limit = limit
+        self._lock = threading.Lock()
+        # (ファイル, 行) → [ウィンドウ開始時刻, 件数, 省略件数]
+        self._sites: Dict[tuple, list] = {}
+        self.suppressed_total = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg}（同じ箇所のログを直前の{self.window:.0f}秒間に{suppressed}件省略）"
+                return True
+            if site[1] < self.limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """キューに入れるだけのハンドラー（整形は出力側のスレッドで行い、満杯なら破棄）"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 標準の QueueHandler はここで整形するが、同じプロセス内のキューなのでそのまま渡す
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """ルートロガー → キュー → ファイル・標準出力 の出力経路"""
+
+    def __init__(self, log_file: str, level: str = "INFO", file_level: str = "DEBUG",
+                 console_level: str = "INFO", queue_size: int = QUEUE_SIZE):
+        formatter = logging.Formatter(LOG_FORMAT)
+        self.file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
+        self.file_handler.setLevel(file_level)
+        self.file_handler.setFormatter(formatter)
+        self.console_handler = logging.StreamHandler(sys.stdout)
+        self.console_handler.setLevel(console_level)
+        self.console_handler.setFormatter(formatter)
+
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.rate_limit = RateLimitFilter()
+        self.queue_handler.addFilter(self.rate_limit)
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, self.file_handler, self.console_handler, respect_handler_level=True
+        )
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(level)
+        self.listener.start()
+        self._running = True
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """キューに残ったログを書き出して出力スレッドを止める（複数回呼んでもよい）"""
+        if self._running:
+            self._running = False
+            self.listener.stop()
+
+    def set_level(self, level: str, name: Optional[str] = None) -> None:
+        """ロガーのレベルを変更（name 省略時はルートロガー）"""
+        level = level.upper()
+        if level not in LEVEL_NAMES:
+            raise ValueError(f"不明なログレベルです: {level}")
+        logging.getLogger(name if name and name != "root" else None).setLevel(level)
+
+    def get_levels(self) -> Dict:
+        """ルートロガーと個別にレベルを設定したロガーのレベル、キューの状態"""
+        loggers = {"root": logging.getLevelName(logging.getLogger().level)}
+        for name, item in sorted(logging.Logger.manager.loggerDict.items()):
+            if isinstance(item, logging.Logger) and item.level != logging.NOTSET:
+                loggers[name] = logging.getLevelName(item.level)
+        return {
+            "loggers": loggers,
+            "handlers": {
+                "file": logging.getLevelName(self.file_handler.level),
+                "console": logging.getLevelName(self.console_handler.level)
+            },
+            "queued": self.queue_handler.queue.qsize(),
+            "dropped": self.queue_handler.dropped,
+            "rate_limited": self.rate_limit.suppressed_total
+        }
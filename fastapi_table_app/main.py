@@ -7,39 +7,131 @@
 import os
 import logging
 import re
+import secrets
 import sys
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from fastapi import FastAPI, Request, HTTPException, Query
-from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import mimetypes
 import uvicorn
 import asyncio
+import base64
+import csv
+import functools
+import heapq
+import io
+import json
+from collections import OrderedDict
 from fastapi.middleware.cors import CORSMiddleware
 import urllib.parse
 from urllib.parse import unquote, quote
 
-nas_PATH = "H:/Nas_Video_Viewer/fastapi_table_app/TEST_NAS"
+from catalog_events import CatalogEventBroker, format_sse
+from catalog_index import CatalogIndex
+from catalog_record import CatalogRecord, format_datetime
+from catalog_stats import CatalogStats
+from catalog_watcher import create_watcher
+from filename_parser import UnparsedReport, parse_filename
+from logging_setup import LoggingPipeline
+from media_info import MediaInfoCache, MediaInfoExtractor, MediaInfoResult
+from mp4_clip import ClipError, ClipLayoutCache, ClipOutOfRange, build_clip_response
+from metrics import SCAN_BUCKETS, MetricsRegistry, end_profile, stage, start_profile
+from query_engine import CatalogQueryIndex, record_key, time_bounds
+from response_cache import ResponseCache, dumps as dump_json, etag_matches, make_etag, with_catalog_age
+from scan_coordinator import CatalogSnapshot, ScanCoordinator
+from shared_catalog import MappedRecords, SharedCatalog
+from thumbnails import KINDS as THUMBNAIL_KINDS, PRIORITY_REQUEST, SPRITE_FRAMES, ThumbnailService, find_ffmpeg
+from video_cache import VideoCache
+from video_serving import build_file_response
+from zip_stream import ZipEntry, ZipStream
 
+nas_PATH = os.environ.get("NAS_PATH", "H:/Nas_Video_Viewer/fastapi_table_app/TEST_NAS")
 
+# カタログの定期再スキャン間隔（秒）。0以下の場合は定期再スキャンを行わない
+SCAN_INTERVAL_SECONDS = int(os.environ.get("NAS_SCAN_INTERVAL", "0"))
 
+# スキャン時の並列スレッド数（機器フォルダ・日付フォルダ単位で並列化）
+SCAN_WORKERS = int(os.environ.get("NAS_SCAN_WORKERS", "8"))
 
-# ロギング設定
-file_handler = logging.FileHandler('app.log', mode='w', encoding='utf-8')
-file_handler.setLevel(logging.DEBUG)  # ファイルハンドラーのログレベルをDEBUGに設定
+# フォルダ監視モード（空: 無効 / auto / inotify / poll）とポーリング間隔（秒）。有効な場合は定期再スキャンを行わない
+WATCH_MODE = os.environ.get("NAS_WATCH", "").strip().lower()
+WATCH_POLL_SECONDS = float(os.environ.get("NAS_WATCH_POLL_INTERVAL", "5"))
 
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)  # 標準出力のログレベルをINFOに設定
+# カタログ更新イベント（SSE）のキープアライブ間隔（秒）
+EVENT_KEEPALIVE_SECONDS = 15
 
-logging.basicConfig(
-    level=logging.DEBUG,  # より詳細なログを出力
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[file_handler, stream_handler]
-)
+# カタログの永続インデックス（SQLite）のファイルパス。空の場合は永続化しない
+INDEX_DB_PATH = os.environ.get("NAS_INDEX_DB", "")
+
+# ページ番号方式の1ページあたりの最大件数と、カーソル方式（連続取得向け）の最大件数
+MAX_PER_PAGE = 100
+CURSOR_MAX_PER_PAGE = int(os.environ.get("NAS_CURSOR_MAX_PER_PAGE", "1000"))
+
+# メインページに埋め込む先頭ブロックの件数（残りは仮想スクロールで /api/search から同じ件数ずつ取得）
+INDEX_FIRST_PAGE_SIZE = MAX_PER_PAGE
+
+# 動画配信のファイル読み込み用スレッド数と、1回に読み込むバイト数
+VIDEO_READ_WORKERS = int(os.environ.get("NAS_VIDEO_READ_WORKERS", "16"))
+VIDEO_CHUNK_SIZE = 1024 * 1024
+
+# 動画のローカルディスクキャッシュのディレクトリ（空の場合はキャッシュしない）と容量の上限（GB）
+VIDEO_CACHE_DIR = os.environ.get("NAS_VIDEO_CACHE_DIR", "")
+VIDEO_CACHE_MAX_BYTES = int(float(os.environ.get("NAS_VIDEO_CACHE_MAX_GB", "20")) * 1024 ** 3)
+
+# サムネイル（ffmpeg）の設定。キャッシュディレクトリが空、または ffmpeg が見つからない場合は無効
+THUMBNAIL_CACHE_DIR = os.environ.get("NAS_THUMBNAIL_DIR", str(Path(__file__).parent / "thumbnail_cache"))
+FFMPEG_COMMAND = os.environ.get("NAS_FFMPEG", "ffmpeg")
+THUMBNAIL_WORKERS = int(os.environ.get("NAS_THUMBNAIL_WORKERS", "2"))
+# スキャンごとに先行生成する新着ファイル数の上限（新しい順）
+THUMBNAIL_PREFETCH_LIMIT = int(os.environ.get("NAS_THUMBNAIL_PREFETCH", "200"))
+
+# X-Profile: 1 ヘッダー付きのリクエストに Server-Timing ヘッダーで区間ごとの所要時間を返すか（0で無効）
+PROFILING_ENABLED = os.environ.get("NAS_PROFILING", "1") != "0"
+
+# ログレベル（実行中は POST /api/log-level で変更できる）。DEBUG にするとファイルには詳細ログも出力される
+LOG_LEVEL = os.environ.get("NAS_LOG_LEVEL", "INFO").upper()
+
+# 検索系API（/api/search・/api/available-dates・/api/stats）のレスポンスキャッシュの件数と容量の上限（MB）。件数0でキャッシュしない（ETag / 304 は有効）
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("NAS_RESPONSE_CACHE_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(float(os.environ.get("NAS_RESPONSE_CACHE_MAX_MB", "64")) * 1024 ** 2)
+
+# MP4ヘッダー（長さ・解像度・コーデック）の読み取り（1で有効）。スキャン後にワーカースレッドで読み取り、
+# NAS_MEDIA_INFO_FLUSH 秒ごと（待ちがなくなった時点でも）にまとめてカタログへ反映する
+MEDIA_INFO_ENABLED = os.environ.get("NAS_MEDIA_INFO", "0") != "0"
+MEDIA_INFO_WORKERS = int(os.environ.get("NAS_MEDIA_INFO_WORKERS", "2"))
+MEDIA_INFO_FLUSH_SECONDS = float(os.environ.get("NAS_MEDIA_INFO_FLUSH", "30"))
+
+# エクスポート時にまとめて書き出すレコード数と、CSVの列
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CSV_FIELDS = ["id", "datetime", "date", "category", "option", "file_path", "sort_timestamp", "size",
+                     "duration", "width", "height", "codec"]
+
+# ZIP一括ダウンロード（/api/zip）で1回に入れるファイル数の上限
+ZIP_MAX_FILES = int(os.environ.get("NAS_ZIP_MAX_FILES", "5000"))
+
+# 複数ワーカーで共有するカタログのディレクトリ（未設定ならワーカーごとにスキャンする）。設定するとスキャンは
+# 1プロセスだけが行ってカタログファイルを書き出し、他のワーカーはそれをメモリマップして使う
+SHARED_CATALOG_DIR = os.environ.get("NAS_SHARED_CATALOG", "")
+# auto: スキャン担当が空いていれば引き受ける / reader: スキャンを担当しない（スキャン担当を別プロセスで動かす場合）
+SHARED_CATALOG_ROLE = os.environ.get("NAS_SHARED_CATALOG_ROLE", "auto").strip().lower()
+# 新しいカタログファイル・再スキャン要求・スキャン担当の空きを確認する間隔（秒）
+SHARED_CATALOG_POLL_SECONDS = float(os.environ.get("NAS_SHARED_CATALOG_POLL", "1"))
+# 読み取り側のワーカーが最初のカタログ・依頼した再スキャンの完了を待つ時間（秒）
+SHARED_CATALOG_WAIT_SECONDS = 300
+
+
+
+
+# ロギング設定（ファイル: DEBUG以上、標準出力: INFO以上。書き込みはキュー経由で別スレッドが行う）
+logging_pipeline = LoggingPipeline('app.log', level=LOG_LEVEL, file_level="DEBUG", console_level="INFO")
 logger = logging.getLogger(__name__)
 
 # 文字エンコーディングの設定
@@ -50,11 +142,56 @@ sys.stderr.reconfigure(encoding='utf-8')
 # グローバル変数の定義
 app = FastAPI(title="監視カメラデータ管理システム")
 scanner = None
+video_cache = None
+thumbnail_service = None
+catalog_watcher = None
+media_extractor = None
+shared_catalog = None
+event_broker = CatalogEventBroker(serialize=lambda records: scanner.serialize(records))
+response_cache = ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+clip_layouts = ClipLayoutCache()
 templates = None
 
+# 計測値（/metrics）
+metrics_registry = MetricsRegistry()
+scan_duration_histogram = metrics_registry.histogram(
+    "nas_scan_duration_seconds", "スキャン1回の所要時間", ["mode"], SCAN_BUCKETS
+)
+scan_phase_histogram = metrics_registry.histogram(
+    "nas_scan_phase_seconds", "スキャンの段階ごとの所要時間（stat・parse は全スレッドの合計）", ["phase"], SCAN_BUCKETS
+)
+scan_files_counter = metrics_registry.counter("nas_scan_files_total", "スキャンで確認したMP4ファイル数")
+scan_directories_counter = metrics_registry.counter(
+    "nas_scan_directories_total", "スキャンで再列挙・スキップしたディレクトリ数", ["result"]
+)
+scan_records_counter = metrics_registry.counter("nas_scan_records_total", "スキャンで追加・更新・削除したレコード数", ["change"])
+http_duration_histogram = metrics_registry.histogram(
+    "nas_http_request_duration_seconds", "リクエストの応答開始までの時間", ["method", "route", "status"]
+)
+stage_duration_histogram = metrics_registry.histogram("nas_stage_duration_seconds", "リクエスト処理の区間ごとの所要時間", ["stage"])
+video_bytes_counter = metrics_registry.counter("nas_video_bytes_sent_total", "動画配信で送ったバイト数", ["source"])
+video_read_histogram = metrics_registry.histogram("nas_video_read_seconds", "動画配信のチャンク読み込み時間", ["source"])
+response_cache_counter = metrics_registry.counter(
+    "nas_response_cache_requests_total", "検索系APIのレスポンスキャッシュの結果（hit / miss / not_modified）", ["route", "result"]
+)
+metrics_registry.gauge("nas_catalog_records", "カタログの件数", lambda: len(scanner.cached_data))
+metrics_registry.gauge("nas_catalog_version", "カタログのスナップショット番号", lambda: scanner.catalog_version)
+metrics_registry.gauge("nas_event_clients", "カタログ更新イベントの接続数", lambda: event_broker.client_count())
+metrics_registry.gauge("nas_response_cache_bytes", "検索系APIのレスポンスキャッシュの使用量", lambda: response_cache.get_stats()["bytes"])
+
+SCAN_PHASES = ("list", "day_scan", "stat", "parse", "sort", "index_save", "query_index", "shared_write")
+
 class NASDataScanner:
     """NAS上の監視カメラデータをスキャンするクラス"""
-    def __init__(self, base_path: str):
+
+    # 更新直後のディレクトリはmtimeの分解能の都合で変更を取りこぼす恐れがあるため、
+    # この秒数以内に更新されたディレクトリは次回の差分スキャンでも再列挙する
+    MTIME_SETTLE_SECONDS = 2.0
+
+    # カーソルページング用に保持しておく過去のカタログ（スナップショット）の数
+    SNAPSHOT_RETENTION = 4
+
+    def __init__(self, base_path: str, max_workers: int = 8, index=None, media_cache=None):
         self.base_path = Path(base_path)
         self.category_mapping = {
             "エラーフォルダ": "エラー",
@@ -62,8 +199,40 @@ class NASDataScanner:
             "誤検知フォルダ": "誤検知",
             "人物フォルダ": "人物"
         }
-        self.cached_data = []
-        self.last_scan_time = None
+        # 公開中のカタログ（レコード一覧・列指向インデックス・スキャン時刻・統計）。スキャン完了時に丸ごと差し替える
+        self._catalog = CatalogSnapshot(CatalogQueryIndex([], version=0), None, {})
+        # カタログ番号の系列（プロセスごとの乱数）。番号は起動のたびに1から数えるため、ETag に含めて別の系列と区別する。
+        # 共有カタログではカタログファイルに書き出し、割り当てたワーカーは同じ系列を使う
+        self.catalog_epoch = secrets.randbits(32)
+        # 差分スキャン用: ディレクトリパス → {mtime, 子ディレクトリ名, ...}
+        self._dir_state = {}
+        # 前回インデックスへ保存した後に記録・削除したディレクトリのパス（変わった行だけを保存する）
+        self._changed_dirs = set()
+        # 差分スキャン用: カテゴリフォルダパス → {ファイル名: レコード}
+        self._category_records = {}
+        # 機器・日付フォルダ単位の並列スキャン用スレッドプール
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="nas-scan")
+        self._scan_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        # ファイル名から撮影時間を抽出できなかったファイル（相対パス）
+        self.unparsed_files = UnparsedReport()
+        # 永続インデックス（CatalogIndex、未設定ならメモリのみ）
+        self.index = index
+        # MP4ヘッダーの読み取り結果（MediaInfoCache、未設定なら読み取らない）
+        self.media_cache = media_cache
+        # 複数ワーカーで共有するカタログ（SharedCatalog）。スキャン担当の場合だけ設定し、公開のたびに書き出す
+        self.shared_catalog = None
+        # MP4ヘッダー情報を反映したが、まだ共有カタログファイルに書き出していないか
+        self._media_unshared = False
+        # カーソルページング用: スナップショット番号 → 列指向インデックス（新しいものから SNAPSHOT_RETENTION 件）
+        self._snapshots = OrderedDict()
+        # 同時に届いたスキャン要求を1回のスキャンにまとめる
+        self.scan_jobs = ScanCoordinator(self._run_scan_job)
+        # 機器名 × カテゴリ × 日付の件数・バイト数と時刻別件数（/api/stats、カタログと対で更新する）
+        self.catalog_stats = CatalogStats()
+        # スキャン完了時に (追加・更新されたレコード, 削除されたファイルパス, フルスキャンか) で呼び出す関数
+        self._scan_listeners = []
         self.device_pattern = re.compile(r'^came\d{2}$', re.IGNORECASE)  # 大文字小文字を区別しない
         self.year_pattern = re.compile(r'^\d{4}$')  # 年ディレクトリ用
         self.month_pattern = re.compile(r'^\d{2}$')  # 月ディレクトリ用
@@ -80,6 +249,41 @@ class NASDataScanner:
         else:
             logger.info(f"ベースパスの内容: {[d.name for d in self.base_path.iterdir() if d.is_dir()]}")
 
+    @property
+    def cached_data(self) -> List[CatalogRecord]:
+        """公開中のカタログのレコード一覧（撮影時間順、読み取り専用）"""
+        return self._catalog.records
+
+    @property
+    def last_scan_time(self) -> Optional[datetime]:
+        return self._catalog.scan_time
+
+    @property
+    def last_scan_stats(self) -> Dict:
+        return self._catalog.scan_stats
+
+    @property
+    def catalog_version(self) -> int:
+        return self._catalog.version
+
+    def get_catalog_snapshot(self) -> CatalogSnapshot:
+        """公開中のカタログ（複数の値を組み合わせて使う場合は、これを1回だけ取り出して使う）"""
+        return self._catalog
+
+    def get_catalog(self) -> List[Dict]:
+        """メモリ上のカタログを取得（未スキャンの場合のみスキャンを実行）"""
+        if self.last_scan_time is None:
+            logger.info("カタログが未作成のためスキャンを実行")
+            self.scan_directories()
+        return self.cached_data
+
+    def get_catalog_age(self) -> Optional[float]:
+        """最終スキャンからの経過秒数を取得（未スキャンの場合はNone）"""
+        scan_time = self.last_scan_time
+        if scan_time is None:
+            return None
+        return round((datetime.now() - scan_time).total_seconds(), 1)
+
     def encode_path(self, path: str) -> str:
         """パスを正規化"""
         try:
@@ -92,7 +296,7 @@ class NASDataScanner:
             
             # URLエンコード（日本語などの特殊文字を処理）
             encoded = quote(normalized, safe='/:')
-            logger.debug(f"パス正規化: {path} -> {encoded}")
+            logger.debug("パス正規化: %s -> %s", path, encoded)
             
             return encoded
         except Exception as e:
@@ -112,7 +316,7 @@ class NASDataScanner:
             
             # パスを正規化
             normalized = str(Path(decoded)).replace("\\", "/")
-            logger.debug(f"パス正規化: {path} -> {normalized}")
+            logger.debug("パス正規化: %s -> %s", path, normalized)
             
             return normalized
         except Exception as e:
@@ -125,129 +329,676 @@ class NASDataScanner:
         return list(self.category_mapping.values())
 
     def extract_recording_time_from_filename(self, filename: str) -> Optional[float]:
-        """ファイル名から撮影時間を抽出してタイムスタンプ（float）を返す"""
-        try:
-            # ファイル拡張子を除去
-            name_without_ext = filename.rsplit('.', 1)[0]
-            
-            # 正規表現パターン（機器名_年-月-日-時_分_秒-動画番号[_merged_結合番号]）
-            pattern = r'^([^_]+)_(\d{4})-(\d{2})-(\d{2})-(\d{2})_(\d{2})_(\d{2})-\d+'
-            match = re.match(pattern, name_without_ext)
-            
-            if match:
-                device_name, year, month, day, hour, minute, second = match.groups()
-                
-                # datetimeオブジェクトを作成
-                recording_datetime = datetime(
-                    int(year), int(month), int(day), 
-                    int(hour), int(minute), int(second)
-                )
-                
-                # タイムスタンプ（float）として返す
-                timestamp = recording_datetime.timestamp()
-                logger.debug(f"ファイル名解析成功: {filename} -> {recording_datetime}")
-                return timestamp
-            else:
-                logger.warning(f"ファイル名パターンが一致しません: {filename}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"ファイル名解析エラー: {filename}, エラー: {e}")
-            return None
+        """ファイル名から撮影時間を抽出してタイムスタンプ（float）を返す（形式に合わない場合は None）"""
+        parsed = parse_filename(filename)
+        return parsed.timestamp if parsed is not None else None
 
     def format_timestamp_to_datetime_string(self, timestamp: float) -> str:
         """タイムスタンプを日本語の日時文字列に変換（YYYY年MM月DD日 HH時MM分SS秒）"""
-        try:
-            dt = datetime.fromtimestamp(timestamp)
-            return dt.strftime("%Y年%m月%d日 %H時%M分%S秒")
-        except:
-            return "unknown_time"
+        return format_datetime(timestamp)
+
+    def serialize(self, records: List[CatalogRecord]) -> List[Dict]:
+        """レコードをAPIレスポンス用の辞書に変換（表示用の文字列はここで初めて作る）"""
+        base_path = str(self.base_path)
+        return [record.to_dict(base_path) for record in records]
 
-    def scan_directories(self) -> List[Dict]:
-        """ディレクトリを再帰的にスキャンしてMP4ファイル情報を取得（撮影時間順ソート）"""
+    def scan_directories(self, incremental: bool = False) -> List[Dict]:
+        """ディレクトリをスキャンしてMP4ファイル情報を取得（撮影時間順ソート）
+
+        incremental=True の場合は前回スキャン時のディレクトリ更新時刻（mtime）と比較し、
+        変更のあったディレクトリのみ再列挙してキャッシュを差分更新する。
+        実行中・実行待ちのスキャンがあれば相乗りしてその結果を返す（scan_jobs）
+        """
         try:
             if not self.base_path.exists():
                 logger.warning(f"NASパスが存在しません: {self.base_path}")
                 return []
 
-            data = []
-            logger.info("ディレクトリスキャン開始")
+            return self.scan_jobs.run(incremental).records
 
-            # 機器名フォルダを検索
-            for device_path in self.base_path.iterdir():
-                if not device_path.is_dir():
+        except Exception as e:
+            logger.error(f"ディレクトリスキャンエラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+            return []
+
+    def start_scan(self, incremental: bool = False):
+        """スキャンを要求して完了を待たずにジョブ（ScanJob）を返す（結果は公開後の CatalogSnapshot）"""
+        return self.scan_jobs.request(incremental)
+
+    def _run_scan_job(self, incremental: bool) -> CatalogSnapshot:
+        """scan_jobs から別スレッドで呼ばれるスキャン本体"""
+        if not self.base_path.exists():
+            raise FileNotFoundError(f"NASパスが存在しません: {self.base_path}")
+        with self._scan_lock:
+            self._scan_directories_locked(incremental)
+            return self._catalog
+
+    @staticmethod
+    def _new_scan_stats() -> Dict:
+        # files/stat_ms/parse_ms は確認したMP4ファイル数と、stat・ファイル名解析の合計時間（全スレッドの合計）
+        return {"listed_dirs": 0, "skipped_dirs": 0, "added": 0, "removed": 0, "updated": 0,
+                "files": 0, "stat_ms": 0.0, "parse_ms": 0.0, "file_errors": 0}
+
+    @staticmethod
+    def _merge_scan_stats(stats: Dict, other: Dict) -> None:
+        for key in ("listed_dirs", "skipped_dirs", "updated", "files", "stat_ms", "parse_ms", "file_errors"):
+            stats[key] += other[key]
+        if "file_error_sample" in other:
+            stats.setdefault("file_error_sample", other["file_error_sample"])
+
+    @staticmethod
+    def sort_key(item: CatalogRecord):
+        """カタログの並び順（撮影時間 → 機器名 → ファイルパス）"""
+        return record_key(item)
+
+    def _scan_directories_locked(self, incremental: bool) -> List[Dict]:
+        """スキャン本体（_scan_lock 取得済みで呼び出す）
+
+        機器フォルダ単位で年/月/日フォルダを列挙し、日付フォルダ単位でカテゴリフォルダを
+        列挙する処理をそれぞれスレッドプールで並列実行する
+        """
+        started = time.perf_counter()
+        full_scan = not incremental or self.last_scan_time is None
+        if full_scan:
+            self._dir_state = {}
+            self._changed_dirs = set()
+            self._category_records = {}
+            self.unparsed_files.clear()
+        logger.info(f"ディレクトリスキャン開始 ({'フル' if full_scan else '差分'}, workers={self.max_workers})")
+
+        stats = self._new_scan_stats()
+        added: List[Dict] = []
+        updated: List[Dict] = []
+        removed_paths = set()
+
+        # 機器名フォルダごとに 年 → 月 → 日 の階層をたどって日付フォルダを集める
+        phase_started = time.perf_counter()
+        devices = self._list_subdirs((str(self.base_path), "", None), stats, removed_paths)
+        day_folders = []
+        for device_days, device_stats, device_removed in self._executor.map(self._collect_day_folders, devices):
+            day_folders.extend(device_days)
+            self._merge_scan_stats(stats, device_stats)
+            removed_paths |= device_removed
+        stats["list_ms"] = round((time.perf_counter() - phase_started) * 1000, 1)
+
+        # 日付フォルダごとにカテゴリフォルダ内のMP4を列挙
+        phase_started = time.perf_counter()
+        for day_stats, day_added, day_updated, day_removed in self._executor.map(self._scan_day_task, day_folders):
+            self._merge_scan_stats(stats, day_stats)
+            added.extend(day_added)
+            updated.extend(day_updated)
+            removed_paths |= day_removed
+        stats["day_scan_ms"] = round((time.perf_counter() - phase_started) * 1000, 1)
+
+        return self._commit_scan(full_scan, added, updated, removed_paths, stats, started)
+
+    def scan_day_folders(self, day_rels) -> List[Dict]:
+        """指定した日付フォルダ（"機器名/年/月/日" の相対パス）だけを差分スキャンしてカタログへ反映（監視モード用）
+
+        存在しない日付フォルダは無視し、前回スキャン時にあったものは配下のレコードを削除扱いにする。
+        変更がなければカタログ・スナップショットはそのまま
+        """
+        if self.last_scan_time is None:
+            return self.scan_directories(incremental=True)
+        try:
+            with self._scan_lock:
+                started = time.perf_counter()
+                stats = self._new_scan_stats()
+                added: List[Dict] = []
+                updated: List[Dict] = []
+                removed_paths = set()
+                for rel in sorted(set(day_rels)):
+                    day = (os.path.join(str(self.base_path), *rel.split("/")), rel, None)
+                    day_stats, day_added, day_updated, day_removed = self._scan_day_task(day)
+                    if day[0] in self._dir_state:
+                        self._register_ancestors(rel)
+                    self._merge_scan_stats(stats, day_stats)
+                    added.extend(day_added)
+                    updated.extend(day_updated)
+                    removed_paths |= day_removed
+                if not (added or updated or removed_paths):
+                    return self.cached_data
+                return self._commit_scan(False, added, updated, removed_paths, stats, started, mode="watch")
+        except Exception as e:
+            logger.error(f"日付フォルダの差分スキャンエラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+            return self.cached_data
+
+    def _register_ancestors(self, day_rel: str) -> None:
+        """日付フォルダを親（ベース〜月フォルダ）の列挙結果に登録
+
+        監視モードで見つけた新しい日付フォルダも、後の差分スキャンで親ごと消えたことを検知できるようにする。
+        登録した親は次回の差分スキャンで再列挙させる
+        """
+        path = str(self.base_path)
+        with self._state_lock:
+            for name in day_rel.split("/"):
+                state = self._dir_state.get(path)
+                if state is None:
+                    self._dir_state[path] = {"mtime": -1, "children": [name]}
+                    self._changed_dirs.add(path)
+                elif name not in state["children"]:
+                    state["children"] = sorted(state["children"] + [name])
+                    state["mtime"] = -1
+                    self._changed_dirs.add(path)
+                path = os.path.join(path, name)
+
+    def _commit_scan(self, full_scan: bool, added: List[Dict], updated: List[Dict], removed_paths: set,
+                     stats: Dict, started: float, mode: Optional[str] = None) -> List[Dict]:
+        """スキャン結果をカタログへ反映し、インデックス保存・スナップショット公開・通知を行う（_scan_lock 取得済みで呼び出す）"""
+        # 削除分の除外・並べ替え・集計の用意（sort_ms）。集計カウンタはスナップショットの公開と同時に増減する
+        phase_started = time.perf_counter()
+        # 同じスキャンでサイズとtxtの両方が変わったレコードは最後に作り直したものだけを使う
+        updated = list({record.file_path: record for record in updated}.values())
+        update_stats = None
+        if full_scan:
+            data = [record for records in self._category_records.values() for record in records.values()]
+            data.sort(key=self.sort_key)
+            update_stats = functools.partial(self.catalog_stats.reset, CatalogStats.tally(data))
+        elif added or removed_paths or updated:
+            # 削除分を除外し、更新分を差し替え、追加分を加えて並べ直す（ほぼ整列済みのため高速）
+            data = []
+            removed_records = []
+            replaced_records = []
+            replacements = {record.file_path: record for record in updated}
+            for item in self.cached_data:
+                if item.file_path in removed_paths:
+                    removed_records.append(item)
                     continue
+                replacement = replacements.get(item.file_path)
+                if replacement is None:
+                    data.append(item)
+                else:
+                    # 集計では古いレコードを除いて新しいレコードを加える（サイズの変化をバイト数に反映）
+                    data.append(replacement)
+                    removed_records.append(item)
+                    replaced_records.append(replacement)
+            data.extend(added)
+            data.sort(key=self.sort_key)
+            update_stats = functools.partial(self.catalog_stats.apply, added + replaced_records, removed_records)
+        else:
+            data = self.cached_data
+        stats["sort_ms"] = round((time.perf_counter() - phase_started) * 1000, 1)
+        stats["stat_ms"] = round(stats["stat_ms"], 1)
+        stats["parse_ms"] = round(stats["parse_ms"], 1)
 
-                device_name = device_path.name
-                mp4_count = 0
+        stats["added"] = len(added) if not full_scan else len(data)
+        stats["removed"] = len(removed_paths)
+        stats["mode"] = mode or ("full" if full_scan else "incremental")
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        stats["total"] = len(data)
+        self.unparsed_files.discard(removed_paths)
+        stats["unparsed"] = len(self.unparsed_files)
 
-                # 年/月/日のディレクトリを再帰的に検索
-                for mp4_file in device_path.rglob("*.mp4"):
-                    try:
-                        # カテゴリフォルダの確認
-                        category_folder = mp4_file.parent
-                        if category_folder.name not in self.category_mapping:
-                            continue
-
-                        category = self.category_mapping[category_folder.name]
-                        
-                        # 日付パスの取得（年/月/日）
-                        date_parts = mp4_file.relative_to(device_path).parts[:3]
-                        if len(date_parts) != 3:
-                            continue
-                        date_path = "/".join(date_parts)
-
-                        # ファイル名から撮影時間を抽出
-                        recording_timestamp = self.extract_recording_time_from_filename(mp4_file.name)
-                        
-                        if recording_timestamp is not None:
-                            datetime_str = self.format_timestamp_to_datetime_string(recording_timestamp)
-                            sort_timestamp = recording_timestamp
-                        else:
-                            # ファイル名から撮影時間を抽出できない場合はファイルの変更時刻を使用
-                            file_stat = mp4_file.stat()
-                            file_timestamp = file_stat.st_mtime
-                            datetime_str = self.format_timestamp_to_datetime_string(file_timestamp)
-                            sort_timestamp = file_timestamp
-                            logger.warning(f"ファイル名から撮影時間を抽出できないため、ファイル変更時刻を使用: {mp4_file.name}")
-
-                        # txtファイルの存在確認（日付フォルダ直下）
-                        date_folder = mp4_file.parent.parent.parent
-                        txt_exists = any(f.suffix.lower() == '.txt' for f in date_folder.glob('*.txt'))
-
-                        # 相対パスの生成
-                        relative_path = str(mp4_file.relative_to(self.base_path)).replace("\\", "/")
-
-                        data.append({
-                            "id": device_name,
-                            "datetime": datetime_str,
-                            "option": "あり" if txt_exists else "なし",
-                            "category": category,
-                            "file_path": relative_path,
-                            "full_path": str(mp4_file),
-                            "date": date_path,
-                            "sort_timestamp": sort_timestamp
-                        })
-                        mp4_count += 1
-
-                    except Exception as e:
-                        logger.error(f"ファイル処理エラー {mp4_file}: {e}")
+        logger.info(
+            f"総計 {len(data)} 件のMP4ファイルを検出 "
+            f"(再列挙: {stats['listed_dirs']}, スキップ: {stats['skipped_dirs']}, "
+            f"追加: {stats['added']}, 削除: {stats['removed']}, {stats['duration_ms']}ms)"
+        )
+        if stats["file_errors"]:
+            logger.error(f"ファイル処理エラー: {stats['file_errors']}件 (例: {stats.get('file_error_sample')})")
+        if stats["unparsed"] and added:
+            # 1件ずつではなくスキャンごとにまとめて出す（一覧は /api/scan-stats の unparsed_files）
+            logger.warning(f"ファイル名から撮影時間を抽出できないファイル: {stats['unparsed']}件（ファイル変更時刻で代用）")
+        scan_time = datetime.now()
+        with self._state_lock:
+            changed_dirs, self._changed_dirs = self._changed_dirs, set()
+        if self.index is not None:
+            self._save_index(full_scan, data if full_scan else added + updated, removed_paths, changed_dirs,
+                             stats, scan_time)
+
+        # 新しいカタログを1回の代入で公開（変更がなければ列指向インデックスと番号はそのまま）
+        if data is not self.cached_data:
+            self._publish_snapshot(data, scan_time, stats, update_stats)
+        else:
+            self._catalog = CatalogSnapshot(self._catalog.query_index, scan_time, stats)
+            if self.shared_catalog is not None:
+                try:
+                    self.shared_catalog.touch(scan_time)
+                except Exception as e:
+                    logger.error(f"共有カタログのスキャン時刻の更新エラー: {e}")
+        self._notify_scan_listeners(data if full_scan else added + updated, removed_paths, full_scan)
+        return data
+
+    def add_scan_listener(self, listener) -> None:
+        """スキャン完了時に呼び出す関数を登録"""
+        self._scan_listeners.append(listener)
+
+    def _notify_scan_listeners(self, changed: List[Dict], removed_paths: set, full_scan: bool) -> None:
+        for listener in self._scan_listeners:
+            try:
+                listener(changed, removed_paths, full_scan)
+            except Exception as e:
+                logger.error(f"スキャン完了通知の処理中にエラーが発生: {e}")
+                logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+    def _publish_snapshot(self, data: List[CatalogRecord], scan_time: datetime, stats: Dict,
+                          update_stats=None) -> CatalogSnapshot:
+        """新しいカタログの列指向インデックスを作成し、スナップショット番号を進めて公開（_scan_lock 取得済みで呼び出す）
+
+        update_stats はカタログ番号を受け取って集計カウンタを更新する関数（None ならカウンタは変わらない）
+        """
+        query_index = CatalogQueryIndex(data, version=self.catalog_version + 1)
+        stats["query_index_ms"] = query_index.build_ms
+        snapshot = CatalogSnapshot(query_index, scan_time, stats)
+        self._install_snapshot(snapshot, update_stats)
+        if self.shared_catalog is not None:
+            self._write_shared_catalog(snapshot, stats)
+            self._media_unshared = False
+        return snapshot
+
+    def _install_snapshot(self, snapshot: CatalogSnapshot, update_stats=None) -> None:
+        """スナップショットを公開し、同じロックの中で集計カウンタをそのカタログ番号のものにする"""
+        with self._state_lock:
+            if update_stats is None:
+                self.catalog_stats.apply((), (), snapshot.version)
+            else:
+                update_stats(snapshot.version)
+            self._snapshots[snapshot.version] = snapshot.query_index
+            while len(self._snapshots) > self.SNAPSHOT_RETENTION:
+                self._snapshots.popitem(last=False)
+            self._catalog = snapshot
+
+    def _write_shared_catalog(self, snapshot: CatalogSnapshot, stats: Dict) -> None:
+        """公開したカタログを共有カタログファイルに書き出す（失敗してもこのプロセスでは新しいカタログを使う）"""
+        try:
+            started = time.perf_counter()
+            written = self.shared_catalog.write(
+                snapshot.query_index, snapshot.scan_time, snapshot.scan_stats, self.catalog_stats.export_state(),
+                self.catalog_epoch
+            )
+            stats["shared_write_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logger.debug(f"共有カタログを書き出し: カタログ {snapshot.version}, {written}バイト")
+        except Exception as e:
+            logger.error(f"共有カタログの書き出しエラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+    def adopt_snapshot(self, query_index: CatalogQueryIndex, scan_time: Optional[datetime], scan_stats: Dict,
+                       stats_state: Optional[Dict] = None, epoch: Optional[int] = None) -> CatalogSnapshot:
+        """他のプロセスが作成したカタログ（共有カタログファイル）を同じ系列・番号のまま公開"""
+        if epoch is not None:
+            self.catalog_epoch = epoch
+        snapshot = CatalogSnapshot(query_index, scan_time, scan_stats)
+        self._install_snapshot(
+            snapshot, functools.partial(self.catalog_stats.load_state, stats_state) if stats_state is not None else None
+        )
+        return snapshot
+
+    def update_scan_time(self, scan_time: Optional[datetime]) -> None:
+        """カタログはそのままでスキャン時刻だけを更新（共有カタログで差分のなかったスキャン）"""
+        catalog = self._catalog
+        self._catalog = CatalogSnapshot(catalog.query_index, scan_time, catalog.scan_stats)
+
+    def get_query_index(self) -> CatalogQueryIndex:
+        """現在のカタログに対応する列指向インデックスを取得"""
+        return self._catalog.query_index
+
+    def get_snapshot(self, version: int) -> Optional[CatalogQueryIndex]:
+        """指定した番号のスナップショットを取得（保持期間を過ぎていれば None）"""
+        with self._state_lock:
+            return self._snapshots.get(version)
+
+    def _save_index(self, full_scan: bool, records: List[Dict], removed_paths: set, changed_dirs: set,
+                    stats: Dict, scan_time: datetime) -> None:
+        """スキャン結果を永続インデックスへ反映（失敗してもスキャン結果は使う）
+
+        ディレクトリ状態はフルスキャンなら全件、差分スキャンなら記録・削除したディレクトリの分だけを書き換える
+        """
+        try:
+            started = time.perf_counter()
+            with self._state_lock:
+                if full_scan:
+                    dir_state, removed_dirs = dict(self._dir_state), []
+                else:
+                    dir_state = {path: self._dir_state[path] for path in changed_dirs if path in self._dir_state}
+                    removed_dirs = [path for path in changed_dirs if path not in self._dir_state]
+            self.index.save_scan(full_scan, records, removed_paths, dir_state, scan_time, removed_dirs)
+            stats["index_save_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            # 保存できなかったディレクトリは次のスキャンで保存する
+            with self._state_lock:
+                self._changed_dirs |= changed_dirs
+            logger.error(f"インデックス保存エラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+    def load_index(self) -> int:
+        """永続インデックスからカタログと差分スキャン用の状態を復元（復元件数を返す）"""
+        if self.index is None:
+            return 0
+        try:
+            started = time.perf_counter()
+            loaded = self.index.load()
+            if loaded is None:
+                logger.info("インデックスにスキャン結果がないためフルスキャンを行います")
+                return 0
+            records, dir_state, category_records, scan_time = loaded
+            if self.media_cache is not None:
+                self.media_cache.load(self.index.load_media_info())
+            with self._scan_lock:
+                self._dir_state = dir_state
+                self._changed_dirs = set()
+                self._category_records = category_records
+                self._publish_snapshot(records, scan_time, {},
+                                       functools.partial(self.catalog_stats.reset, CatalogStats.tally(records)))
+            logger.info(f"インデックスからカタログを復元: {len(records)}件 ({(time.perf_counter() - started) * 1000:.1f}ms)")
+            return len(records)
+        except Exception as e:
+            logger.error(f"インデックス読み込みエラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+            return 0
+
+    def _locate_record(self, file_path: str) -> Tuple[Optional[Dict[str, CatalogRecord]], str]:
+        """相対パスから (フォルダのレコード辞書, ファイル名) を求める（_state_lock を取って呼ぶ）"""
+        folder, name = os.path.split(os.path.join(str(self.base_path), *file_path.split("/")))
+        return self._category_records.get(folder), name
+
+    def find_records(self, file_paths: List[str]) -> List[CatalogRecord]:
+        """相対パスの一覧からカタログのレコードを取得（カタログにないパスは除く）"""
+        records = self.cached_data
+        if isinstance(records, MappedRecords):
+            # 共有カタログを割り当てている間は差分スキャン用の状態がないため、ファイルのパス順の並びから探す
+            return [record for record in map(records.find, file_paths) if record is not None]
+        found = []
+        with self._state_lock:
+            for file_path in file_paths:
+                records, name = self._locate_record(file_path)
+                record = records.get(name) if records is not None else None
+                if record is not None:
+                    found.append(record)
+        return found
+
+    def apply_media_info(self, results: List[MediaInfoResult]) -> int:
+        """MP4ヘッダーの読み取り結果をカタログへ反映（反映した件数を返す）
+
+        読み取り後にサイズが変わったファイル・削除されたファイルの結果は反映しない（次のスキャンで読み直す）
+        """
+        if self.index is not None:
+            try:
+                self.index.save_media_info(results)
+            except Exception as e:
+                logger.error(f"MP4ヘッダー情報の保存エラー: {e}")
+                logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        with self._scan_lock:
+            updated = []
+            with self._state_lock:
+                for result in results:
+                    records, name = self._locate_record(result.file_path)
+                    record = records.get(name) if records is not None else None
+                    if record is None or record.size != result.size or record.media == result.info:
                         continue
+                    record = record.replace(media=result.info)
+                    records[name] = record
+                    updated.append(record)
+            if updated:
+                self._publish_media(updated)
+        return len(updated)
+
+    def _publish_media(self, updated: List[CatalogRecord]) -> None:
+        """MP4ヘッダー情報だけが変わったレコードを公開中のカタログへ反映（_scan_lock 取得済みで呼び出す）
+
+        並び順は変わらないため並べ替え・インデックスの作り直しはせず、レコードと長さの列だけを差し替える。
+        カタログ番号も進めない（レスポンスキャッシュ・カーソルはそのまま使え、通知・共有カタログの書き出しもしない）。
+        /api/search は列指向インデックスの revision をキャッシュのキーに含めて区別する
+        """
+        catalog = self._catalog
+        query_index = catalog.query_index
+        replacements = {}
+        for record in updated:
+            row = query_index.key_position(record_key(record), after=False)
+            if row < query_index.size and query_index.records[row].file_path == record.file_path:
+                replacements[row] = record
+        query_index = query_index.with_media(replacements)
+        self._install_snapshot(CatalogSnapshot(query_index, catalog.scan_time, catalog.scan_stats))
+        if self.shared_catalog is not None:
+            self._media_unshared = True
+        logger.debug(f"MP4ヘッダー情報をカタログへ反映: {len(replacements)}件 ({query_index.build_ms}ms)")
 
-                if mp4_count > 0:
-                    logger.info(f"機器 {device_name}: {mp4_count}件のMP4ファイル")
+    def share_media_info(self) -> bool:
+        """反映済みのMP4ヘッダー情報を共有カタログに書き出す（カタログ番号を進める。書き出したら True）
 
-            # 撮影時間順でソート
-            data.sort(key=lambda x: (x.get("sort_timestamp", 0), x.get("id", "")))
+        読み取り側のワーカーは番号の進んだファイルしか割り当てないため、ヘッダーの読み取りが一段落したときにまとめて行う
+        """
+        with self._scan_lock:
+            if not self._media_unshared:
+                return False
+            catalog = self._catalog
+            self._publish_snapshot(catalog.records, catalog.scan_time, dict(catalog.scan_stats))
+            return True
 
-            logger.info(f"総計 {len(data)} 件のMP4ファイルを検出")
-            self.cached_data = data
-            self.last_scan_time = datetime.now()
-            return data
+    def _collect_day_folders(self, device: Tuple[str, str, Optional[int]]):
+        """機器フォルダ配下の日付フォルダを列挙（スレッドプールで実行）"""
+        stats = self._new_scan_stats()
+        removed_paths = set()
+        day_folders = []
+        for year in self._list_subdirs(device, stats, removed_paths):
+            for month in self._list_subdirs(year, stats, removed_paths):
+                day_folders.extend(self._list_subdirs(month, stats, removed_paths))
+        return day_folders, stats, removed_paths
 
+    def _scan_day_task(self, day: Tuple[str, str, Optional[int]]):
+        """日付フォルダ1件分のスキャン（スレッドプールで実行）"""
+        stats = self._new_scan_stats()
+        added = []
+        updated = []
+        removed_paths = set()
+        try:
+            self._scan_day_folder(day, stats, added, updated, removed_paths)
         except Exception as e:
-            logger.error(f"ディレクトリスキャンエラー: {e}")
+            logger.error(f"日付フォルダのスキャンエラー {day[0]}: {e}")
+        return stats, added, updated, removed_paths
+
+    def _is_unchanged(self, path: str, mtime_ns: int) -> bool:
+        """前回スキャン時からディレクトリのmtimeが変わっていないか確認"""
+        state = self._dir_state.get(path)
+        return state is not None and state["mtime"] == mtime_ns
+
+    def _remember_dir(self, path: str, mtime_ns: int, children: List, **extra) -> None:
+        """ディレクトリの列挙結果を記録（更新直後のディレクトリは次回も再列挙する）"""
+        if time.time() - mtime_ns / 1e9 < self.MTIME_SETTLE_SECONDS:
+            mtime_ns = -1
+        with self._state_lock:
+            self._dir_state[path] = {"mtime": mtime_ns, "children": children, **extra}
+            self._changed_dirs.add(path)
+
+    def _forget_subtree(self, path: str, removed_paths: set) -> None:
+        """削除されたディレクトリ配下のキャッシュを破棄"""
+        prefix = path + os.sep
+        with self._state_lock:
+            for key in [k for k in self._dir_state if k == path or k.startswith(prefix)]:
+                del self._dir_state[key]
+                self._changed_dirs.add(key)
+            for key in [k for k in self._category_records if k == path or k.startswith(prefix)]:
+                removed_paths.update(record.file_path for record in self._category_records.pop(key).values())
+
+    def _dir_mtime(self, folder: Tuple[str, str, Optional[int]], removed_paths: set) -> Optional[int]:
+        """ディレクトリのmtimeを取得（親の列挙時にDirEntryから取得済みならそれを使う）"""
+        path, _, mtime_ns = folder
+        if mtime_ns is not None:
+            return mtime_ns
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            self._forget_subtree(path, removed_paths)
+            return None
+
+    def _list_subdirs(self, folder: Tuple[str, str, Optional[int]], stats: Dict, removed_paths: set) -> List[Tuple[str, str, Optional[int]]]:
+        """サブディレクトリの一覧を (フルパス, 相対パス, mtime) で取得
+
+        mtimeが変わっていなければ前回の列挙結果を再利用する。再列挙した場合は
+        os.scandir の DirEntry からサブディレクトリのmtimeも取得しておき、子の stat を省く
+        """
+        mtime_ns = self._dir_mtime(folder, removed_paths)
+        if mtime_ns is None:
             return []
+        path, rel, _ = folder
+
+        if self._is_unchanged(path, mtime_ns):
+            stats["skipped_dirs"] += 1
+            children = [(name, None) for name in self._dir_state[path]["children"]]
+        else:
+            stats["listed_dirs"] += 1
+            children = []
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            children.append((entry.name, entry.stat().st_mtime_ns))
+                    except OSError:
+                        continue
+            children.sort()
+            names = [name for name, _ in children]
+            previous = self._dir_state.get(path)
+            if previous:
+                for name in set(previous["children"]) - set(names):
+                    self._forget_subtree(os.path.join(path, name), removed_paths)
+            self._remember_dir(path, mtime_ns, names)
+
+        prefix = rel + "/" if rel else ""
+        return [(os.path.join(path, name), prefix + name, child_mtime) for name, child_mtime in children]
+
+    def _scan_day_folder(self, day: Tuple[str, str, Optional[int]], stats: Dict, added: List[Dict],
+                         updated: List[Dict], removed_paths: set) -> None:
+        """日付フォルダ直下のtxt有無とカテゴリフォルダ内のMP4を差分更新
+
+        日付フォルダは1回だけ列挙し、カテゴリフォルダの一覧とtxtファイルの有無を同時に取得する
+        """
+        mtime_ns = self._dir_mtime(day, removed_paths)
+        if mtime_ns is None:
+            return
+        day_path, day_rel, _ = day
+
+        previous = self._dir_state.get(day_path)
+        if self._is_unchanged(day_path, mtime_ns):
+            stats["skipped_dirs"] += 1
+            categories = [(name, None) for name in previous["children"]]
+            txt_exists = previous["txt"]
+        else:
+            stats["listed_dirs"] += 1
+            categories = []
+            txt_exists = False
+            with os.scandir(day_path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if entry.name in self.category_mapping:
+                                categories.append((entry.name, entry.stat().st_mtime_ns))
+                        elif entry.name.lower().endswith('.txt'):
+                            txt_exists = True
+                    except OSError:
+                        continue
+            categories.sort()
+            names = [name for name, _ in categories]
+            if previous:
+                for name in set(previous["children"]) - set(names):
+                    self._forget_subtree(os.path.join(day_path, name), removed_paths)
+            self._remember_dir(day_path, mtime_ns, names, txt=txt_exists)
+
+        # txtの有無が変わった場合はキャッシュ済みレコードのオプション列を更新
+        txt_changed = previous is not None and previous.get("txt") != txt_exists
+
+        device_name = day_rel.split("/", 1)[0]
+        for name, category_mtime in categories:
+            category_folder = (os.path.join(day_path, name), f"{day_rel}/{name}", category_mtime)
+            records = self._scan_category_folder(
+                category_folder, device_name, txt_exists, stats, added, updated, removed_paths
+            )
+            if txt_changed:
+                # 公開中のレコードは書き換えず、作り直したものに差し替える
+                with self._state_lock:
+                    for name, record in list(records.items()):
+                        if record.txt != txt_exists:
+                            records[name] = record = record.replace(txt=txt_exists)
+                            updated.append(record)
+                            stats["updated"] += 1
+
+    def _scan_category_folder(self, category_folder: Tuple[str, str, Optional[int]], device_name: str, txt: bool,
+                              stats: Dict, added: List[CatalogRecord], updated: List[CatalogRecord],
+                              removed_paths: set) -> Dict[str, CatalogRecord]:
+        """カテゴリフォルダ内のMP4ファイルを差分更新（ファイル名→レコードの辞書を返す）
+
+        再列挙したフォルダでは既存のファイルのサイズも確認する（見つけた時点で書き込み中だったファイル向け）
+        """
+        mtime_ns = self._dir_mtime(category_folder, removed_paths)
+        if mtime_ns is None:
+            return {}
+        category_path, category_rel, _ = category_folder
+
+        records = self._category_records.get(category_path, {})
+        if self._is_unchanged(category_path, mtime_ns):
+            stats["skipped_dirs"] += 1
+            return records
+
+        stats["listed_dirs"] += 1
+        category = self.category_mapping[os.path.basename(category_path)]
+        current = {}
+        with os.scandir(category_path) as it:
+            for entry in it:
+                name = entry.name
+                if not name.lower().endswith(".mp4"):
+                    continue
+                stats["files"] += 1
+                if name in records:
+                    record = records[name]
+                    stat_started = time.perf_counter()
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        size = record.size
+                    stats["stat_ms"] += (time.perf_counter() - stat_started) * 1000
+                    if size != record.size:
+                        # ヘッダー情報は書き込み中に読んだものかもしれないため読み直す
+                        record = record.replace(size=size, media=None)
+                        updated.append(record)
+                        stats["updated"] += 1
+                    current[name] = record
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    record = self._build_record(entry, f"{category_rel}/{name}", device_name, category, txt, stats)
+                except Exception as e:
+                    # 1件ずつではなくスキャンの最後にまとめて出す
+                    stats["file_errors"] += 1
+                    stats.setdefault("file_error_sample", f"{entry.path}: {e}")
+                    continue
+                current[name] = record
+                added.append(record)
+
+        for name in records.keys() - current.keys():
+            removed_paths.add(records[name].file_path)
+
+        with self._state_lock:
+            self._category_records[category_path] = current
+        self._remember_dir(category_path, mtime_ns, [])
+        return current
+
+    def _build_record(self, entry: os.DirEntry, relative_path: str, device_name: str,
+                      category: str, txt: bool, stats: Dict) -> CatalogRecord:
+        """MP4ファイル1件分のカタログレコードを作成（stat・ファイル名解析の時間を stats に加算）"""
+        # ファイル名から撮影時間を抽出
+        parse_started = time.perf_counter()
+        parsed = parse_filename(entry.name)
+        # サイズ（/api/stats のバイト数集計用）。DirEntry の stat 結果はキャッシュされる
+        stat_started = time.perf_counter()
+        file_stat = entry.stat()
+        stat_finished = time.perf_counter()
+        stats["parse_ms"] += (stat_started - parse_started) * 1000
+        stats["stat_ms"] += (stat_finished - stat_started) * 1000
+
+        if parsed is not None:
+            sort_timestamp = parsed.timestamp
+        else:
+            # ファイル名から撮影時間を抽出できない場合はファイルの変更時刻を使用（DirEntryのstatキャッシュを利用）
+            sort_timestamp = file_stat.st_mtime
+            self.unparsed_files.add(relative_path)
+
+        # 読み取り済みのMP4ヘッダー情報があれば付ける（未読み取りならスキャン後にワーカーで読む）
+        media = None
+        if self.media_cache is not None:
+            _, media = self.media_cache.get(relative_path, file_stat.st_size, file_stat.st_mtime_ns)
+
+        # 表示用の日時・オプション・日付・フルパスは持たず、レスポンス作成時に求める
+        return CatalogRecord(device_name, category, relative_path, sort_timestamp, txt, file_stat.st_size, media)
 
     def get_devices(self) -> List[str]:
         """機器名の一覧を取得"""
@@ -268,6 +1019,27 @@ class NASDataScanner:
             logger.error(f"ファイルパス取得エラー: {e}")
             return None
 
+# リクエストごとの応答時間の計測と、X-Profile ヘッダー付きリクエストへの Server-Timing の付与
+@app.middleware("http")
+async def collect_request_metrics(request: Request, call_next):
+    profile = token = None
+    if PROFILING_ENABLED and request.headers.get("x-profile") == "1":
+        profile, token = start_profile()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if profile is not None:
+            response.headers["Server-Timing"] = profile.server_timing()
+        return response
+    finally:
+        # ラベルはURLではなくルートのパス（/api/video?path=... も /api/video にまとめる）
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        http_duration_histogram.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+        if token is not None:
+            end_profile(token)
+
 # セキュリティヘッダーの追加
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -312,33 +1084,498 @@ try:
         raise PermissionError(f"ディレクトリへの読み取りアクセス権がありません: {NAS_BASE_PATH}")
     
     # scannerインスタンスの作成
-    scanner = NASDataScanner(NAS_BASE_PATH)
+    index = CatalogIndex(INDEX_DB_PATH, str(Path(NAS_BASE_PATH))) if INDEX_DB_PATH else None
+    media_cache = MediaInfoCache() if MEDIA_INFO_ENABLED else None
+    scanner = NASDataScanner(NAS_BASE_PATH, max_workers=SCAN_WORKERS, index=index, media_cache=media_cache)
     logger.info("NASDataScannerインスタンスの作成完了")
 
+    # 複数ワーカーで共有するカタログ（任意）。スキャン担当は起動時に決める
+    shared_catalog = SharedCatalog(
+        SHARED_CATALOG_DIR, str(Path(NAS_BASE_PATH)), SHARED_CATALOG_ROLE, NASDataScanner.SNAPSHOT_RETENTION
+    ) if SHARED_CATALOG_DIR else None
+
+    # カタログの変更を接続中のブラウザへ配信
+    scanner.add_scan_listener(
+        lambda changed, removed_paths, full_scan: event_broker.publish(
+            changed, removed_paths, full_scan, scanner.catalog_version, len(scanner.cached_data)
+        )
+    )
+
+    # スキャン統計を /metrics に反映
+    scanner.add_scan_listener(
+        lambda changed, removed_paths, full_scan: observe_scan_metrics(scanner.last_scan_stats)
+    )
+
+    # MP4ヘッダーの読み取り（任意）。スキャンで見つかった未読み取りのファイルをワーカーに渡す
+    if media_cache is not None:
+        media_extractor = MediaInfoExtractor(
+            str(scanner.base_path), media_cache, lambda results: apply_media_batch(results),
+            workers=MEDIA_INFO_WORKERS, flush_interval=MEDIA_INFO_FLUSH_SECONDS
+        )
+        scanner.add_scan_listener(
+            lambda changed, removed_paths, full_scan: queue_media_info(changed, removed_paths)
+        )
+
+    # 動画のローカルディスクキャッシュ（任意）
+    video_cache = VideoCache(VIDEO_CACHE_DIR, VIDEO_CACHE_MAX_BYTES) if VIDEO_CACHE_DIR else None
+
+    # サムネイル生成（ffmpeg がある場合のみ）
+    ffmpeg_path, ffprobe_path = find_ffmpeg(FFMPEG_COMMAND)
+    if THUMBNAIL_CACHE_DIR and ffmpeg_path:
+        thumbnail_service = ThumbnailService(THUMBNAIL_CACHE_DIR, ffmpeg_path, ffprobe_path, workers=THUMBNAIL_WORKERS)
+        scanner.add_scan_listener(
+            lambda changed, removed_paths, full_scan: prefetch_thumbnails(changed)
+        )
+    else:
+        logger.info(f"サムネイル生成は無効です (ffmpeg: {ffmpeg_path or '見つかりません'})")
+
 except Exception as e:
     logger.error(f"スキャナー初期化中にエラーが発生: {e}")
     logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
     raise
 
+# 動画ファイル読み込み用のスレッドプール（スキャン等と分けて、遅いNAS読み込みが他の処理を待たせないようにする）
+video_executor = ThreadPoolExecutor(max_workers=max(1, VIDEO_READ_WORKERS), thread_name_prefix="video-io")
+
+def prefetch_thumbnails(records: List[CatalogRecord]) -> None:
+    """スキャンで見つかった新着ファイルのサムネイルを新しい順に先行生成"""
+    if thumbnail_service is None or THUMBNAIL_PREFETCH_LIMIT <= 0 or not records:
+        return
+    newest = heapq.nlargest(THUMBNAIL_PREFETCH_LIMIT, records, key=NASDataScanner.sort_key)
+    base_path = str(scanner.base_path)
+    count = thumbnail_service.prefetch((record.file_path, record.full_path(base_path)) for record in newest)
+    logger.info(f"サムネイルの先行生成を登録: {count}件")
+
+def queue_media_info(records: List[CatalogRecord], removed_paths: set) -> None:
+    """ヘッダー情報がなく、まだ読み取っていないファイルをヘッダー読み取りのワーカーに渡す"""
+    media_cache = scanner.media_cache
+    if removed_paths:
+        media_cache.discard(removed_paths)
+    pending = [record for record in records
+               if record.media is None and not media_cache.known(record.file_path, record.size)]
+    if pending:
+        count = media_extractor.submit(pending)
+        logger.info(f"MP4ヘッダーの読み取りを登録: {count}件")
+
+def apply_media_batch(results: List[MediaInfoResult]) -> None:
+    """ヘッダー読み取りの結果をカタログへ反映（共有カタログには待ちがなくなったときにまとめて書き出す）"""
+    scanner.apply_media_info(results)
+    if scanner.shared_catalog is not None and not media_extractor.get_stats()["pending"]:
+        if scanner.share_media_info():
+            logger.info(f"MP4ヘッダー情報を共有カタログに書き出し: カタログ {scanner.catalog_version}")
+
+def observe_scan_metrics(stats: Dict) -> None:
+    """直近のスキャン統計を /metrics のカウンタ・ヒストグラムへ加算"""
+    scan_duration_histogram.observe(stats.get("duration_ms", 0) / 1000, mode=stats.get("mode", ""))
+    for phase in SCAN_PHASES:
+        if f"{phase}_ms" in stats:
+            scan_phase_histogram.observe(stats[f"{phase}_ms"] / 1000, phase=phase)
+    scan_files_counter.inc(stats.get("files", 0))
+    scan_directories_counter.inc(stats.get("listed_dirs", 0), result="listed")
+    scan_directories_counter.inc(stats.get("skipped_dirs", 0), result="skipped")
+    for change in ("added", "updated", "removed"):
+        scan_records_counter.inc(stats.get(change, 0), change=change)
+
+def video_read_observer(source: str):
+    """動画配信のチャンク読み込みごとに送信バイト数・読み込み時間を記録する関数を作成"""
+    def observe(size: int, seconds: float) -> None:
+        video_bytes_counter.inc(size, source=source)
+        video_read_histogram.observe(seconds, source=source)
+    return observe
+
+async def run_blocking(func, *args, **kwargs):
+    """ブロッキング処理をスレッドプールで実行（イベントループを止めない）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+async def scan_catalog(incremental: bool = True) -> List[CatalogRecord]:
+    """スキャンを要求して完了を待つ（実行中のスキャンがあれば相乗りし、待つ間スレッドを占有しない）"""
+    try:
+        if not scanner.base_path.exists():
+            logger.warning(f"NASパスが存在しません: {scanner.base_path}")
+            return []
+        snapshot = await asyncio.wrap_future(scanner.start_scan(incremental).future)
+        return snapshot.records
+    except Exception as e:
+        logger.error(f"ディレクトリスキャンエラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        return []
+
+async def load_catalog() -> List[Dict]:
+    """メモリ上のカタログを取得（未作成の場合はスキャン。同時に来たリクエストは1回のスキャンを共有する）"""
+    if scanner.last_scan_time is None:
+        if is_shared_reader():
+            # スキャンはスキャン担当のプロセスが行うため、最初のカタログが書き出されるまで待つ
+            deadline = time.monotonic() + SHARED_CATALOG_WAIT_SECONDS
+            while scanner.last_scan_time is None and time.monotonic() < deadline:
+                await asyncio.sleep(SHARED_CATALOG_POLL_SECONDS)
+            return scanner.cached_data
+        return await scan_catalog(incremental=False)
+    return scanner.cached_data
+
+def is_shared_reader() -> bool:
+    """共有カタログを読み取るだけのワーカーか（スキャンはスキャン担当のプロセスに任せる）"""
+    return shared_catalog is not None and not shared_catalog.is_scanner
+
+def cached_json_response(request: Request, route: str, version: int, key: Tuple, build) -> Response:
+    """検索系APIのレスポンスを (カタログ番号, 正規化した検索条件) でキャッシュし、ETag / 304 に対応して返す
+
+    build は catalog_age を除いたレスポンスの辞書を返す関数（キャッシュにない場合だけ呼び出す）。
+    catalog_age は返すたびに付け足す
+    """
+    etag = make_etag(scanner.catalog_epoch, version, key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.record_not_modified()
+        response_cache_counter.inc(route=route, result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(version, key)
+    if body is None:
+        response_cache_counter.inc(route=route, result="miss")
+        payload = build()
+        with stage(stage_duration_histogram, "response.encode"):
+            body = dump_json(payload)
+        if scanner.catalog_version == version:
+            response_cache.put(version, key, body)
+        else:
+            # 作成中にカタログが更新された（本文が新しいカタログのものかもしれない）場合は登録も ETag の付与もしない
+            del headers["ETag"]
+    else:
+        response_cache_counter.inc(route=route, result="hit")
+    return Response(with_catalog_age(body, scanner.get_catalog_age()), media_type="application/json", headers=headers)
+
+# 起動時のカタログ構築
+@app.on_event("startup")
+async def build_catalog_on_startup():
+    """起動時に一度だけスキャンしてカタログを構築し、必要なら定期再スキャンを開始
+
+    共有カタログを使う場合、スキャン担当になれなかったワーカーはスキャンせず、書き出されたカタログを割り当てる
+    """
+    event_broker.attach_loop(asyncio.get_running_loop())
+    if shared_catalog is not None and not await run_blocking(shared_catalog.try_acquire):
+        logger.info(f"共有カタログを読み取るワーカーとして起動: {SHARED_CATALOG_DIR} (pid={os.getpid()})")
+        await run_blocking(poll_shared_catalog)
+        asyncio.create_task(follow_shared_catalog())
+        return
+    await start_scanning()
+
+async def start_scanning():
+    """このプロセスでカタログのスキャンを担当する（起動時、または共有カタログのスキャン担当を引き継いだとき）"""
+    logger.info("カタログ構築を開始")
+    if shared_catalog is not None:
+        await run_blocking(take_over_shared_catalog)
+    # 永続インデックスがあれば復元してから差分スキャンで突き合わせる
+    restored = await run_blocking(scanner.load_index)
+    # 共有カタログから引き継いだだけ（差分スキャン用の状態がない）の場合はフルスキャンする
+    data = await scan_catalog(incremental=shared_catalog is None or restored > 0)
+    logger.info(f"カタログ構築完了: {len(data)}件")
+    if media_extractor is not None:
+        # インデックスから復元したレコードは差分スキャンで変更として通知されないため、ここでまとめて登録する
+        await run_blocking(queue_media_info, data, set())
+
+    global catalog_watcher
+    if WATCH_MODE:
+        catalog_watcher = create_watcher(WATCH_MODE, str(scanner.base_path), apply_watched_changes, WATCH_POLL_SECONDS)
+        if catalog_watcher is not None:
+            catalog_watcher.start()
+    if catalog_watcher is not None:
+        if SCAN_INTERVAL_SECONDS > 0:
+            logger.info("フォルダ監視が有効なため定期再スキャンは行いません")
+    elif SCAN_INTERVAL_SECONDS > 0:
+        asyncio.create_task(periodic_rescan())
+        logger.info(f"定期再スキャンを開始: {SCAN_INTERVAL_SECONDS}秒間隔")
+    if shared_catalog is not None:
+        asyncio.create_task(serve_refresh_requests())
+
+def take_over_shared_catalog() -> None:
+    """共有カタログのスキャン担当になったとき、書き出し済みのカタログを引き継いで番号を続ける"""
+    # 再起動直後でもスキャンの完了を待たずに前回のカタログで応答する
+    mapped = shared_catalog.open_latest(newer_than=scanner.catalog_version)
+    if mapped is not None:
+        adopt_shared_catalog(mapped)
+    latest = shared_catalog.latest_version()
+    if scanner.catalog_version < latest:
+        # 使えないカタログファイル（NASパスが違うなど）より小さい番号で書き出すと読み取り側が古いと判断するため、番号だけ進める
+        scanner.adopt_snapshot(CatalogQueryIndex([], version=latest), None, {})
+    scanner.shared_catalog = shared_catalog
+
+def adopt_shared_catalog(mapped) -> None:
+    """割り当てたカタログファイルを公開し、接続中のブラウザに一覧の取り直しを通知"""
+    scanner.adopt_snapshot(mapped.query_index(), mapped.scan_time, mapped.scan_stats, mapped.stats_state, mapped.epoch)
+    event_broker.publish([], set(), True, scanner.catalog_version, len(scanner.cached_data))
+    logger.info(f"共有カタログを割り当て: カタログ {mapped.version}, {mapped.size}件")
+
+def poll_shared_catalog() -> None:
+    """スキャン担当が書き出した新しいカタログ・更新したスキャン時刻を反映（読み取り側のワーカー）"""
+    mapped = shared_catalog.open_latest(newer_than=scanner.catalog_version)
+    if mapped is not None:
+        adopt_shared_catalog(mapped)
+    elif shared_catalog.current is not None:
+        scan_time = shared_catalog.current.scan_time
+        if scan_time != scanner.last_scan_time:
+            scanner.update_scan_time(scan_time)
+
+async def follow_shared_catalog():
+    """共有カタログの更新を確認し続け、スキャン担当のプロセスが終了していればスキャンを引き継ぐ"""
+    while True:
+        await asyncio.sleep(SHARED_CATALOG_POLL_SECONDS)
+        try:
+            if await run_blocking(shared_catalog.try_acquire):
+                logger.warning("スキャン担当のプロセスが見つからないため、このワーカーがスキャンを引き継ぎます")
+                await start_scanning()
+                return
+            await run_blocking(poll_shared_catalog)
+        except Exception as e:
+            logger.error(f"共有カタログの確認中にエラーが発生: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+async def serve_refresh_requests():
+    """他のワーカーが受けた再スキャン要求を実行（共有カタログのスキャン担当）"""
+    while True:
+        await asyncio.sleep(SHARED_CATALOG_POLL_SECONDS)
+        try:
+            full = await run_blocking(shared_catalog.take_refresh_request)
+            if full is not None:
+                job = scanner.start_scan(incremental=not full)
+                logger.info(f"他のワーカーからの再スキャン要求を受付: {job.id} ({'フル' if full else '差分'})")
+        except Exception as e:
+            logger.error(f"再スキャン要求の確認中にエラーが発生: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+@app.on_event("shutdown")
+async def stop_watcher_on_shutdown():
+    """フォルダ監視を停止し、キューに残ったログを書き出す"""
+    if catalog_watcher is not None:
+        await run_blocking(catalog_watcher.stop)
+    logging_pipeline.stop()
+
+def apply_watched_changes(day_rels, rescan: bool) -> None:
+    """フォルダ監視で検知した変更をカタログへ反映（監視スレッドから呼ばれる）"""
+    if rescan:
+        scanner.scan_directories(incremental=True)
+    elif day_rels:
+        scanner.scan_day_folders(day_rels)
+
+async def periodic_rescan():
+    """設定された間隔でカタログを再スキャン"""
+    while True:
+        await asyncio.sleep(SCAN_INTERVAL_SECONDS)
+        try:
+            data = await scan_catalog(incremental=True)
+            logger.info(f"定期再スキャン完了: {len(data)}件")
+        except Exception as e:
+            logger.error(f"定期再スキャン中にエラーが発生: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+
+def describe_scan_result(snapshot: CatalogSnapshot) -> Dict:
+    """スキャンジョブの結果（公開したカタログ）の要約"""
+    return {"count": len(snapshot.records), "catalog_version": snapshot.version, "scan_stats": snapshot.scan_stats}
+
 # リフレッシュエンドポイントの追加
 @app.post("/api/refresh")
-async def refresh_data():
-    """データを再スキャンして更新"""
+async def refresh_data(
+    full: bool = Query(False, description="trueの場合は差分ではなくフルスキャン"),
+    wait: bool = Query(True, description="falseの場合はスキャンの完了を待たずにジョブ番号を返す")
+):
+    """データを再スキャンして更新（既定はmtimeによる差分スキャン。実行中のスキャンがあれば相乗りする）"""
     try:
-        logger.info("データリフレッシュリクエストを受信")
+        logger.info(f"データリフレッシュリクエストを受信: full={full}, wait={wait}")
         if not scanner:
             raise HTTPException(status_code=500, detail="スキャナーが初期化されていません")
+        if not scanner.base_path.exists():
+            raise HTTPException(status_code=503, detail="NASパスが存在しません")
+        if is_shared_reader():
+            return await delegate_refresh(full, wait)
         
-        # データの再スキャン
-        data = scanner.scan_directories()
-        logger.info(f"リフレッシュ完了: {len(data)}件のデータを取得")
+        # データの再スキャン（同時に届いた要求は1回のスキャンにまとめる）
+        job = scanner.start_scan(incremental=not full)
+        if not wait:
+            return JSONResponse({"status": "accepted", **job.to_dict()}, status_code=202)
+
+        snapshot = await asyncio.wrap_future(job.future)
+        logger.info(f"リフレッシュ完了: {len(snapshot.records)}件のデータを取得 ({job.id}, 相乗り {job.callers - 1}件)")
         
-        return {"status": "success", "count": len(data)}
+        return {
+            "status": "success",
+            **job.to_dict(describe_scan_result),
+            "catalog_age": scanner.get_catalog_age()
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"リフレッシュ中にエラーが発生: {e}")
         logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def delegate_refresh(full: bool, wait: bool):
+    """スキャン担当のプロセスに再スキャンを依頼（共有カタログを読み取るワーカー）
+
+    wait=true の場合は、書き出されたカタログ（またはスキャン時刻の更新）をこのワーカーが反映するまで待つ
+    """
+    previous = scanner.last_scan_time
+    await run_blocking(shared_catalog.request_refresh, full)
+    info = {"mode": "full" if full else "incremental", "delegated": True}
+    if not wait:
+        return JSONResponse({"status": "accepted", **info}, status_code=202)
+    deadline = time.monotonic() + SHARED_CATALOG_WAIT_SECONDS
+    while scanner.last_scan_time == previous and time.monotonic() < deadline:
+        await asyncio.sleep(SHARED_CATALOG_POLL_SECONDS)
+    if scanner.last_scan_time == previous:
+        return JSONResponse({"status": "accepted", "state": "running", **info}, status_code=202)
+    logger.info(f"依頼した再スキャンの完了を確認: カタログ {scanner.catalog_version}")
+    return {
+        "status": "success",
+        "state": "done",
+        **info,
+        "count": len(scanner.cached_data),
+        "catalog_version": scanner.catalog_version,
+        "scan_stats": scanner.last_scan_stats,
+        "catalog_age": scanner.get_catalog_age()
+    }
+
+@app.get("/api/refresh/{job_id}")
+async def get_refresh_job(job_id: str):
+    """POST /api/refresh?wait=false で受け付けたスキャンの状態（完了後は件数とスキャン統計）を取得"""
+    job = scanner.scan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="指定されたスキャンジョブが見つかりません")
+    return {"status": "success", **job.to_dict(describe_scan_result), "catalog_age": scanner.get_catalog_age()}
+
+# ログレベルの取得・変更エンドポイント
+@app.get("/api/log-level")
+async def get_log_level():
+    """ロガーのレベルと、ログキューの状態（待ち件数・破棄件数・件数制限で省略した件数）を取得"""
+    return {"status": "success", **logging_pipeline.get_levels()}
+
+@app.post("/api/log-level")
+async def set_log_level(
+    level: str = Query(..., description="ログレベル (DEBUG / INFO / WARNING / ERROR / CRITICAL)"),
+    name: Optional[str] = Query(None, alias="logger", description="ロガー名（省略時はルートロガー）")
+):
+    """実行中にログレベルを変更（再起動すると NAS_LOG_LEVEL に戻る）"""
+    try:
+        logging_pipeline.set_level(level, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"ログレベルを変更: {name or 'root'} -> {level.upper()}")
+    return {"status": "success", **logging_pipeline.get_levels()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """計測値を Prometheus のテキスト形式で出力（スキャン・検索・動画配信）"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# スキャン統計取得エンドポイントの追加
+@app.get("/api/scan-stats")
+async def get_scan_stats():
+    """直近のスキャン統計（再列挙・スキップしたディレクトリ数など）を取得"""
+    return {
+        "status": "success",
+        "scan_stats": scanner.last_scan_stats,
+        "catalog_age": scanner.get_catalog_age(),
+        "watch_stats": catalog_watcher.get_stats() if catalog_watcher is not None else None,
+        "event_stats": event_broker.get_stats(),
+        "scan_jobs": scanner.scan_jobs.get_stats(),
+        "media_info_stats": media_extractor.get_stats() if media_extractor is not None else None,
+        "shared_catalog": shared_catalog.get_stats() if shared_catalog is not None else None,
+        "unparsed_files": scanner.unparsed_files.summary()
+    }
+
+# カタログ更新イベント（SSE）エンドポイントの追加
+@app.get("/api/events")
+async def catalog_events(request: Request):
+    """カタログの変更（追加・更新されたレコードと削除されたパス）を Server-Sent Events で配信"""
+    queue = event_broker.subscribe()
+    logger.info(f"カタログ更新イベントの購読を開始 (接続数: {event_broker.client_count()})")
+
+    async def stream():
+        try:
+            # 接続直後に現在のカタログ番号を送り、クライアントが取りこぼしを判断できるようにする
+            hello = json.dumps({
+                "type": "hello",
+                "catalog_version": scanner.catalog_version,
+                "total": len(scanner.cached_data),
+                "watching": catalog_watcher is not None
+            }, ensure_ascii=False)
+            yield format_sse(hello, event_id=scanner.catalog_version)
+            while not await request.is_disconnected():
+                try:
+                    version, payload = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(payload, event_id=version)
+        finally:
+            event_broker.unsubscribe(queue)
+            logger.info(f"カタログ更新イベントの購読を終了 (接続数: {event_broker.client_count()})")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# サムネイル取得エンドポイントの追加
+@app.get("/api/thumbnail")
+async def get_thumbnail(
+    path: str = Query(..., description="動画ファイルの相対パス"),
+    kind: str = Query("poster", description="画像の種類 (poster / sprite)")
+):
+    """録画のポスター画像、またはスクラブ用スプライト（横に SPRITE_FRAMES 枚並べた画像）を取得"""
+    try:
+        if kind not in THUMBNAIL_KINDS:
+            raise HTTPException(status_code=400, detail="kind は poster または sprite を指定してください")
+        if thumbnail_service is None:
+            raise HTTPException(status_code=503, detail="サムネイル生成は無効です（ffmpegが見つかりません）")
+
+        decoded_path = scanner.decode_path(path)
+        video_path = await run_blocking(scanner.get_video_file_path, decoded_path) if decoded_path else None
+        if not video_path:
+            raise HTTPException(status_code=404, detail="動画ファイルが見つかりません")
+        stat = await run_blocking(video_path.stat)
+
+        image_path = await run_blocking(thumbnail_service.lookup, decoded_path, stat, kind)
+        if image_path is None:
+            # 未生成の場合はワーカープールで優先的に生成して完了を待つ
+            future = thumbnail_service.submit(decoded_path, str(video_path), stat, kind, PRIORITY_REQUEST)
+            try:
+                image_path = await asyncio.wait_for(asyncio.wrap_future(future), timeout=thumbnail_service.timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="サムネイルの生成が混み合っています")
+            except Exception as e:
+                logger.error(f"サムネイル取得エラー: {decoded_path} ({kind}): {e}")
+                raise HTTPException(status_code=422, detail="サムネイルを生成できませんでした")
+
+        headers = {
+            # ファイル名が内容（元ファイルのサイズ・mtime）から決まるため長期間キャッシュしてよい
+            "Cache-Control": "public, max-age=86400",
+            "ETag": f'"{Path(image_path).stem}"'
+        }
+        if kind == "sprite":
+            headers["X-Sprite-Frames"] = str(SPRITE_FRAMES)
+        return FileResponse(image_path, media_type="image/jpeg", headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"サムネイル取得エラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="サムネイルの取得中にエラーが発生しました")
+
+# 動画キャッシュ統計取得エンドポイントの追加
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """動画のローカルディスクキャッシュ・サムネイル生成・検索系APIのレスポンスキャッシュの統計を取得"""
+    return {
+        "status": "success",
+        "enabled": video_cache is not None,
+        "cache_stats": video_cache.get_stats() if video_cache is not None else None,
+        "thumbnail_stats": thumbnail_service.get_stats() if thumbnail_service is not None else None,
+        "response_cache_stats": response_cache.get_stats(),
+        "clip_stats": clip_layouts.get_stats()
+    }
+
 # データ取得エンドポイントの追加
 @app.get("/api/data")
 async def get_data(
@@ -347,14 +1584,16 @@ async def get_data(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     page: int = Query(1, ge=1),
-    per_page: int = Query(50, ge=1, le=100)
+    per_page: int = Query(50, ge=1, le=CURSOR_MAX_PER_PAGE, description="1ページあたりの件数（ページ番号方式は100まで）"),
+    pagination: str = Query("offset", description="ページング方式 (offset / cursor)"),
+    cursor: Optional[str] = Query(None, description="前回のレスポンスの next_cursor / prev_cursor")
 ):
-    """データを取得（フィルタリングとページネーション対応）"""
+    """データを取得（フィルタリングとページ番号方式・カーソル方式のページネーション対応）"""
     try:
-        logger.info(f"データリクエスト受信: device={device}, category={category}, start_date={start_date}, end_date={end_date}, page={page}, per_page={per_page}")
+        logger.info(f"データリクエスト受信: device={device}, category={category}, start_date={start_date}, end_date={end_date}, page={page}, per_page={per_page}, pagination={pagination}, cursor={cursor}")
         
-        # データを取得
-        data = scanner.scan_directories()
+        # データを取得（メモリ上のカタログから）
+        data = await load_catalog()
         if not data:
             logger.warning("データが空です")
             return {
@@ -364,45 +1603,45 @@ async def get_data(
                 "per_page": per_page,
                 "total_pages": 0,
                 "devices": [],
-                "categories": []
+                "categories": [],
+                "catalog_age": scanner.get_catalog_age()
             }
+        cursor_mode, cursor_state, snapshot, expired = resolve_pagination(pagination, cursor, per_page)
         
-        # フィルタリング
-        filtered_data = data
-        if device:
-            filtered_data = [item for item in filtered_data if item["id"] == device]
-        if category:
-            filtered_data = [item for item in filtered_data if item["category"] == category]
-        if start_date:
-            filtered_data = [item for item in filtered_data if item["date"] >= start_date]
-        if end_date:
-            filtered_data = [item for item in filtered_data if item["date"] <= end_date]
+        # フィルタリング（列指向インデックスで評価。日付は YYYY-MM-DD / YYYY/MM/DD のどちらでも可）
+        start_timestamp, end_timestamp = parse_date_range(
+            start_date.replace("/", "-") if start_date else None,
+            end_date.replace("/", "-") if end_date else None
+        )
+        with stage(stage_duration_histogram, "query.filter"):
+            result = snapshot.query(
+                devices=[device] if device else None,
+                categories=[category] if category else None,
+                start_timestamp=start_timestamp,
+                end_timestamp=end_timestamp
+            )
         
         # ページネーション
-        total = len(filtered_data)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = min(start_idx + per_page, total)
-        
-        # 結果を取得
-        items = filtered_data[start_idx:end_idx]
+        total = result.total
+        items, paging = paginate_result(result, snapshot, page, per_page, cursor_mode, cursor_state, expired)
         
         # デバイスとカテゴリの一覧を取得
-        devices = sorted(list(set(item["id"] for item in data)))
-        categories = sorted(list(set(item["category"] for item in data)))
+        devices = sorted(snapshot.device_bitmaps)
+        categories = sorted(snapshot.category_bitmaps)
         
         logger.info(f"データ取得完了: {len(items)}件 (合計: {total}件)")
         
         return {
             "items": items,
             "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages,
+            **paging,
             "devices": devices,
-            "categories": categories
+            "categories": categories,
+            "catalog_age": scanner.get_catalog_age()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"データ取得エラー: {e}")
         logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
@@ -421,80 +1660,39 @@ async def get_video(request: Request, path: str = Query(..., description="動画
         
         # パスをデコードして正規化
         decoded_path = scanner.decode_path(path)
-        logger.debug(f"デコードされたパス: {decoded_path}")
+        logger.debug("デコードされたパス: %s", decoded_path)
         
         if not decoded_path:
             logger.error("動画リクエスト: パスのデコードに失敗しました")
             raise HTTPException(status_code=400, detail="無効な動画パスです")
         
-        # 動画ファイルのパスを取得
-        video_path = scanner.get_video_file_path(decoded_path)
+        # 動画ファイルのパスを取得（NASへのアクセスはスレッドプールで行う）
+        video_path = await run_blocking(scanner.get_video_file_path, decoded_path)
         if not video_path:
             logger.error(f"動画リクエスト: ファイルが見つかりません: {decoded_path}")
             raise HTTPException(status_code=404, detail="動画ファイルが見つかりません")
         
-        logger.info(f"動画ファイルを送信: {video_path}")
+        stat = await run_blocking(video_path.stat)
         
-        # ファイルサイズを取得
-        file_size = video_path.stat().st_size
-        
-        # 範囲リクエストのヘッダーを取得
-        range_header = request.headers.get('Range')
-        if range_header:
-            # 範囲リクエストの処理
-            try:
-                range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-                if range_match:
-                    start = int(range_match.group(1))
-                    end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-                    
-                    if start >= file_size:
-                        raise HTTPException(status_code=416, detail="要求された範囲が無効です")
-                    
-                    chunk_size = 1024 * 1024  # 1MB
-                    content_length = end - start + 1
-                    
-                    async def video_stream():
-                        with open(video_path, 'rb') as f:
-                            f.seek(start)
-                            remaining = content_length
-                            while remaining > 0:
-                                chunk = min(chunk_size, remaining)
-                                data = f.read(chunk)
-                                if not data:
-                                    break
-                                yield data
-                                remaining -= len(data)
-                    
-                    headers = {
-                        'Content-Range': f'bytes {start}-{end}/{file_size}',
-                        'Accept-Ranges': 'bytes',
-                        'Content-Length': str(content_length),
-                        'Content-Type': 'video/mp4'
-                    }
-                    return StreamingResponse(
-                        video_stream(),
-                        status_code=206,
-                        headers=headers
-                    )
-            except ValueError as e:
-                logger.error(f"範囲リクエストの処理エラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な範囲リクエストです")
-        
-        # 通常のストリーミング（範囲リクエストなし）
-        async def video_stream():
-            with open(video_path, 'rb') as f:
-                while chunk := f.read(1024 * 1024):  # 1MB chunks
-                    yield chunk
+        # ローカルキャッシュにあればそこから配信し、なければNASから配信しつつバックグラウンドでコピーする
+        serve_path = str(video_path)
+        cached_path = None
+        if video_cache is not None:
+            cached_path = await run_blocking(video_cache.lookup, decoded_path, stat)
+            if cached_path:
+                serve_path = cached_path
+            else:
+                video_cache.schedule_fill(decoded_path, stat, str(video_path))
+        logger.info(f"動画ファイルを送信: {serve_path} (Range: {request.headers.get('Range')}, キャッシュ: {'ヒット' if cached_path else 'なし'})")
         
-        return StreamingResponse(
-            video_stream(),
-            media_type='video/mp4',
-            headers={
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(file_size)
-            }
+        # Range / If-Range / ETag / Last-Modified に応じて 200・206・304・416 を返す
+        response = build_file_response(
+            serve_path, stat, request.headers, video_executor, VIDEO_CHUNK_SIZE, "video/mp4",
+            on_read=video_read_observer("cache" if cached_path else "nas")
         )
+        if video_cache is not None and response.status_code in (200, 206):
+            video_cache.record(cached_path is not None, int(response.headers.get("content-length", 0)))
+        return response
         
     except HTTPException as he:
         logger.error(f"動画リクエストエラー (HTTP {he.status_code}): {he.detail}")
@@ -504,6 +1702,66 @@ async def get_video(request: Request, path: str = Query(..., description="動画
         logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="動画の処理中にエラーが発生しました")
 
+# 切り出し（クリップ）エンドポイントの追加
+@app.get("/api/clip")
+async def get_clip(
+    request: Request,
+    path: str = Query(..., description="動画ファイルの相対パス"),
+    start: float = Query(..., ge=0, description="開始秒"),
+    end: float = Query(..., gt=0, description="終了秒"),
+    download: bool = Query(False, description="true でダウンロード（Content-Disposition: attachment）")
+):
+    """録画の start〜end 秒だけを再エンコードなしで切り出したMP4を返す（Range 対応）
+
+    開始は直前のキーフレームに合わせるため、実際の範囲はレスポンスヘッダー X-Clip-Start / X-Clip-End で返す
+    """
+    try:
+        logger.info(f"切り出しリクエスト受信: path={path}, start={start}, end={end}")
+        if end <= start:
+            raise HTTPException(status_code=400, detail="終了秒は開始秒より後にしてください")
+
+        decoded_path = scanner.decode_path(path) if path and path.strip() else None
+        if not decoded_path:
+            raise HTTPException(status_code=400, detail="無効な動画パスです")
+        video_path = await run_blocking(scanner.get_video_file_path, decoded_path)
+        if not video_path:
+            raise HTTPException(status_code=404, detail="動画ファイルが見つかりません")
+        stat = await run_blocking(video_path.stat)
+
+        # ローカルキャッシュにあればそこから読む（切り出しのために全体をコピーすることはしない）
+        serve_path = str(video_path)
+        cached_path = await run_blocking(video_cache.lookup, decoded_path, stat) if video_cache is not None else None
+        if cached_path:
+            serve_path = cached_path
+
+        try:
+            with stage(stage_duration_histogram, "clip.layout"):
+                layout = await run_blocking(clip_layouts.get, serve_path, stat, start, end)
+        except ClipOutOfRange as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ClipError as e:
+            raise HTTPException(status_code=422, detail=f"この動画は切り出せません: {e}")
+
+        filename = f"{Path(decoded_path).stem}_{layout.start:.0f}-{layout.end:.0f}s.mp4"
+        headers = {
+            "Content-Disposition": f"{'attachment' if download else 'inline'}; filename*=UTF-8''{quote(filename)}",
+            "X-Clip-Start": f"{layout.start:.3f}",
+            "X-Clip-End": f"{layout.end:.3f}"
+        }
+        logger.info(f"切り出しを送信: {serve_path} ({layout.start:.3f}-{layout.end:.3f}秒, {layout.size}バイト, Range: {request.headers.get('Range')})")
+        return build_clip_response(
+            serve_path, layout, stat, request.headers, video_executor, VIDEO_CHUNK_SIZE, headers,
+            on_read=video_read_observer("cache" if cached_path else "nas")
+        )
+
+    except HTTPException as he:
+        logger.error(f"切り出しリクエストエラー (HTTP {he.status_code}): {he.detail}")
+        raise
+    except Exception as e:
+        logger.error(f"切り出しリクエストエラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="動画の切り出し中にエラーが発生しました")
+
 # メインページのルートハンドラー
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -511,10 +1769,12 @@ async def read_root(request: Request):
     try:
         logger.info("メインページのリクエストを受信")
         
-        # データスキャン
-        logger.info("データスキャンを開始")
-        table_data = scanner.scan_directories()
-        logger.info(f"スキャン結果: {len(table_data)}件のデータを取得")
+        # メモリ上のカタログを取得（ページには先頭ブロックだけを埋め込み、全件は渡さない）
+        await load_catalog()
+        snapshot = scanner.get_query_index()
+        with stage(stage_duration_histogram, "index.first_page"):
+            first_page = scanner.serialize(snapshot.query().page(0, INDEX_FIRST_PAGE_SIZE))
+        logger.info(f"カタログ: {snapshot.size}件のデータ (先頭 {len(first_page)}件を埋め込み)")
         
         # デバイスとカテゴリの取得
         devices = scanner.get_devices()
@@ -524,11 +1784,10 @@ async def read_root(request: Request):
         current_time = datetime.now().strftime("%Y年%m月%d日 %H時%M分")
         
         # テンプレート用のコンテキストを作成
-        # 一番古い日付を取得
-        if table_data:
-            oldest_item = min(table_data, key=lambda x: x.get('sort_timestamp', float('inf')))
+        # 一番古い日付を取得（カタログは撮影時間順のため先頭のレコード）
+        if snapshot.size:
             try:
-                oldest_dt = datetime.fromtimestamp(oldest_item['sort_timestamp'])
+                oldest_dt = datetime.fromtimestamp(snapshot.records[0].timestamp)
                 oldest_date = oldest_dt.strftime('%Y年%m月%d日')
             except Exception:
                 oldest_date = None
@@ -537,14 +1796,23 @@ async def read_root(request: Request):
 
         context = {
             "request": request,
-            "table_data": table_data,
+            "initial_page": {
+                "items": first_page,
+                "total": snapshot.size,
+                "per_page": INDEX_FIRST_PAGE_SIZE,
+                "catalog_version": snapshot.version
+            },
             "devices": devices,
             "categories": categories,
             "current_time": current_time,
             "page_title": "NAS監視カメラデータ管理システム",
-            "data_count": len(table_data),
+            "data_count": snapshot.size,
             "last_scan": scanner.last_scan_time.strftime("%Y年%m月%d日 %H時%M分") if scanner.last_scan_time else "未実行",
-            "oldest_date": oldest_date
+            "catalog_age": scanner.get_catalog_age(),
+            "oldest_date": oldest_date,
+            "thumbnails_enabled": thumbnail_service is not None,
+            "sprite_frames": SPRITE_FRAMES,
+            "zip_max_files": ZIP_MAX_FILES
         }
         
         logger.info("テンプレートをレンダリング")
@@ -555,25 +1823,170 @@ async def read_root(request: Request):
         logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="システムエラーが発生しました")
 
+def parse_date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """開始日・終了日 (YYYY-MM-DD) を検索用のタイムスタンプ範囲に変換（終了日は23時59分59秒まで）"""
+    start_timestamp = None
+    end_timestamp = None
+    if start_date:
+        try:
+            start_timestamp = datetime.strptime(start_date, "%Y-%m-%d").timestamp()
+        except ValueError as e:
+            logger.error(f"開始日のパースエラー: {e}")
+            raise HTTPException(status_code=400, detail="無効な開始日形式です")
+    if end_date:
+        try:
+            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
+            end_datetime = datetime.combine(
+                end_date_obj.date(),
+                datetime.max.time().replace(microsecond=0)
+            )
+            end_timestamp = end_datetime.timestamp()
+        except ValueError as e:
+            logger.error(f"終了日のパースエラー: {e}")
+            raise HTTPException(status_code=400, detail="無効な終了日形式です")
+    return start_timestamp, end_timestamp
+
+def parse_search_conditions(start_date: Optional[str], end_date: Optional[str], start_time: Optional[str],
+                            end_time: Optional[str], category: Optional[str], device: Optional[str],
+                            min_duration: Optional[float] = None, max_duration: Optional[float] = None) -> Dict:
+    """検索パラメータを列指向インデックスの検索条件（CatalogQueryIndex.query の引数）に変換"""
+    if min_duration is not None and max_duration is not None and min_duration > max_duration:
+        raise HTTPException(status_code=400, detail="最短の長さが最長の長さを超えています")
+
+    # 時間オブジェクトの作成（時間指定がある場合のみ）
+    start_time_obj = None
+    end_time_obj = None
+    
+    if start_time:
+        try:
+            start_time_obj = datetime.strptime(start_time, "%H:%M").time()
+            logger.debug(f"開始時間: {start_time_obj}")
+        except ValueError as e:
+            logger.error(f"開始時間のパースエラー: {e}")
+            raise HTTPException(status_code=400, detail="無効な開始時間形式です")
+    
+    if end_time:
+        try:
+            end_time_obj = datetime.strptime(end_time, "%H:%M").time()
+            logger.debug(f"終了時間: {end_time_obj}")
+        except ValueError as e:
+            logger.error(f"終了時間のパースエラー: {e}")
+            raise HTTPException(status_code=400, detail="無効な終了時間形式です")
+    
+    # 日付範囲・時間帯を列指向インデックスの検索条件に変換（終了日は23時59分59秒までを含める）
+    start_timestamp, end_timestamp = parse_date_range(start_date, end_date)
+    start_seconds, end_seconds = time_bounds(start_time_obj, end_time_obj)
+    categories = [cat.strip() for cat in category.split(',') if cat.strip()] if category else None
+    devices = [dev.strip() for dev in device.split(',') if dev.strip()] if device else None
+    return {
+        "devices": devices,
+        "categories": categories,
+        "start_timestamp": start_timestamp,
+        "end_timestamp": end_timestamp,
+        "start_seconds": start_seconds,
+        "end_seconds": end_seconds,
+        "min_duration": min_duration,
+        "max_duration": max_duration
+    }
+
+def encode_cursor(version: int, key: Tuple, backward: bool) -> str:
+    """スナップショット番号と並び順キーを不透明なカーソル文字列に変換"""
+    payload = {"v": version, "k": list(key), "d": "prev" if backward else "next"}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict:
+    """カーソル文字列を {"v": スナップショット番号, "k": 並び順キー, "d": "next"/"prev"} に戻す"""
+    try:
+        raw = base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode("ascii"))
+        payload = json.loads(raw.decode("utf-8"))
+        timestamp, device, file_path = payload["k"]
+        if payload["d"] not in ("next", "prev"):
+            raise ValueError(f"不明な方向: {payload['d']}")
+        return {"v": int(payload["v"]), "k": (float(timestamp), str(device), str(file_path)), "d": payload["d"]}
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"カーソルのパースエラー: {e}")
+        raise HTTPException(status_code=400, detail="無効なカーソルです")
+
+def resolve_pagination(pagination: str, cursor: Optional[str], per_page: int):
+    """ページング方式を判定し、(カーソル方式か, カーソル内容, 検索に使うスナップショット, スナップショット失効) を返す
+
+    カーソルが指すスナップショットを保持していればそれを使い、破棄済みなら最新のカタログで
+    キーの位置から続ける（キーセット方式のため、変化のない範囲で重複・取りこぼしは起きない）
+    """
+    if pagination not in ("offset", "cursor"):
+        raise HTTPException(status_code=400, detail="pagination は offset または cursor を指定してください")
+    cursor_mode = pagination == "cursor" or cursor is not None
+    if not cursor_mode and per_page > MAX_PER_PAGE:
+        raise HTTPException(status_code=400, detail=f"per_page は{MAX_PER_PAGE}以下で指定してください（カーソル方式は{CURSOR_MAX_PER_PAGE}まで）")
+
+    snapshot = scanner.get_query_index()
+    cursor_state = decode_cursor(cursor) if cursor else None
+    expired = False
+    if cursor_state is not None and cursor_state["v"] != snapshot.version:
+        retained = scanner.get_snapshot(cursor_state["v"])
+        if retained is not None:
+            snapshot = retained
+        else:
+            expired = True
+            logger.info(f"カーソルのスナップショット {cursor_state['v']} は破棄済みのため最新のカタログ {snapshot.version} で続行")
+    return cursor_mode, cursor_state, snapshot, expired
+
+def paginate_result(result, snapshot: CatalogQueryIndex, page: int, per_page: int,
+                    cursor_mode: bool, cursor_state: Optional[Dict], expired: bool) -> Tuple[List[Dict], Dict]:
+    """検索結果から1ページ分を取り出し、(レスポンス用のレコード, ページング情報) を返す"""
+    if not cursor_mode:
+        total_pages = (result.total + per_page - 1) // per_page
+        with stage(stage_duration_histogram, "query.page"):
+            items = result.page((page - 1) * per_page, per_page)
+        with stage(stage_duration_histogram, "query.serialize"):
+            items = scanner.serialize(items)
+        return items, {"page": page, "per_page": per_page, "total_pages": total_pages, "catalog_version": snapshot.version}
+
+    anchor = cursor_state["k"] if cursor_state else None
+    with stage(stage_duration_histogram, "query.page"):
+        rows, has_prev, has_next = result.keyset_rows(
+            per_page,
+            after=anchor if cursor_state and cursor_state["d"] == "next" else None,
+            before=anchor if cursor_state and cursor_state["d"] == "prev" else None
+        )
+        items = [snapshot.records[i] for i in rows]
+    first_key = record_key(items[0]) if items else anchor
+    last_key = record_key(items[-1]) if items else anchor
+    with stage(stage_duration_histogram, "query.serialize"):
+        items = scanner.serialize(items)
+    return items, {
+        "per_page": per_page,
+        "next_cursor": encode_cursor(snapshot.version, last_key, backward=False) if has_next and last_key else None,
+        "prev_cursor": encode_cursor(snapshot.version, first_key, backward=True) if has_prev and first_key else None,
+        "catalog_version": snapshot.version,
+        "snapshot_expired": expired
+    }
+
 # 検索エンドポイントの追加
 @app.get("/api/search")
 async def search_data(
+    request: Request,
     start_date: Optional[str] = Query(None, description="開始日 (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="終了日 (YYYY-MM-DD)"),
     start_time: Optional[str] = Query(None, description="開始時間 (HH:MM)"),
     end_time: Optional[str] = Query(None, description="終了時間 (HH:MM)"),
     category: Optional[str] = Query(None, description="カテゴリ（カンマ区切り）"),
     device: Optional[str] = Query(None, description="機器名（カンマ区切り）"),
+    min_duration: Optional[float] = Query(None, ge=0, description="録画の長さの下限（秒、ヘッダー読み取り済みのもののみ一致）"),
+    max_duration: Optional[float] = Query(None, ge=0, description="録画の長さの上限（秒、ヘッダー読み取り済みのもののみ一致）"),
     page: int = Query(1, ge=1, description="ページ番号"),
-    per_page: int = Query(50, ge=1, le=100, description="1ページあたりの件数")
+    per_page: int = Query(50, ge=1, le=CURSOR_MAX_PER_PAGE, description="1ページあたりの件数（ページ番号方式は100まで）"),
+    pagination: str = Query("offset", description="ページング方式 (offset / cursor)"),
+    cursor: Optional[str] = Query(None, description="前回のレスポンスの next_cursor / prev_cursor")
 ):
-    """日付と時間による検索API（ページネーション対応）"""
+    """日付と時間による検索API（ページ番号方式・カーソル方式のページネーション対応、ETag / 304 対応）"""
     try:
-        logger.info(f"検索リクエスト受信: start_date={start_date}, end_date={end_date}, start_time={start_time}, end_time={end_time}, category={category}, device={device}, page={page}, per_page={per_page}")
+        logger.info(f"検索リクエスト受信: start_date={start_date}, end_date={end_date}, start_time={start_time}, end_time={end_time}, category={category}, device={device}, min_duration={min_duration}, max_duration={max_duration}, page={page}, per_page={per_page}, pagination={pagination}, cursor={cursor}")
         
-        # データを取得
-        data = scanner.scan_directories()
-        logger.debug(f"取得したデータ件数: {len(data)}")
+        # データを取得（メモリ上のカタログから）
+        data = await load_catalog()
+        logger.debug("取得したデータ件数: %d", len(data))
         
         if not data:
             logger.warning("データが空です")
@@ -583,143 +1996,57 @@ async def search_data(
                 "count": 0,
                 "page": page,
                 "per_page": per_page,
-                "total_pages": 0
+                "total_pages": 0,
+                "catalog_age": scanner.get_catalog_age()
             }
         
-        # 時間オブジェクトの作成（時間指定がある場合のみ）
-        start_time_obj = None
-        end_time_obj = None
-        
-        if start_time:
-            try:
-                start_time_obj = datetime.strptime(start_time, "%H:%M").time()
-                logger.debug(f"開始時間: {start_time_obj}")
-            except ValueError as e:
-                logger.error(f"開始時間のパースエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な開始時間形式です")
-        
-        if end_time:
-            try:
-                end_time_obj = datetime.strptime(end_time, "%H:%M").time()
-                logger.debug(f"終了時間: {end_time_obj}")
-            except ValueError as e:
-                logger.error(f"終了時間のパースエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な終了時間形式です")
-        
-        # フィルタリング
-        filtered_data = data
-        
-        # カテゴリフィルタリング
-        if category:
-            try:
-                categories = [cat.strip() for cat in category.split(',') if cat.strip()]
-                filtered_data = [item for item in filtered_data if item.get("category") in categories]
-                logger.debug(f"カテゴリでフィルタリング後: {len(filtered_data)}件")
-            except Exception as e:
-                logger.error(f"カテゴリフィルタリングエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効なカテゴリ形式です")
-        
-        # 機器名フィルタリング
-        if device:
-            try:
-                devices = [dev.strip() for dev in device.split(',') if dev.strip()]
-                filtered_data = [item for item in filtered_data if item.get("id") in devices]
-                logger.debug(f"機器名でフィルタリング後: {len(filtered_data)}件")
-            except Exception as e:
-                logger.error(f"機器名フィルタリングエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な機器名形式です")
-        
-        # 日付フィルタリング（開始日と終了日）
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-                start_timestamp = start_date_obj.timestamp()
-                filtered_data = [item for item in filtered_data if item.get("sort_timestamp", 0) >= start_timestamp]
-                logger.debug(f"開始日でフィルタリング後: {len(filtered_data)}件")
-            except ValueError as e:
-                logger.error(f"開始日のパースエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な開始日形式です")
-        
-        if end_date:
-            try:
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
-                # 終了日の23時59分59秒までを含める
-                end_datetime = datetime.combine(
-                    end_date_obj.date(),
-                    datetime.max.time().replace(microsecond=0)
-                )
-                end_timestamp = end_datetime.timestamp()
-                filtered_data = [item for item in filtered_data if item.get("sort_timestamp", 0) <= end_timestamp]
-                logger.debug(f"終了日でフィルタリング後: {len(filtered_data)}件")
-            except ValueError as e:
-                logger.error(f"終了日のパースエラー: {e}")
-                raise HTTPException(status_code=400, detail="無効な終了日形式です")
-        
-        # 時間フィルタリング（各日ごとに個別に適用）
-        if start_time_obj is not None or end_time_obj is not None:
-            time_filtered_data = []
+        # 同じ検索条件・同じカタログなら前回のレスポンスを返す（表記の違う同じ条件も同じキーになるよう正規化）
+        query_index = scanner.get_query_index()
+        version = query_index.version
+        conditions = parse_search_conditions(start_date, end_date, start_time, end_time, category, device,
+                                             min_duration, max_duration)
+        cursor_mode = pagination == "cursor" or cursor is not None
+        key = (
+            "search",
+            tuple(sorted(set(conditions["devices"]))) if conditions["devices"] else None,
+            tuple(sorted(set(conditions["categories"]))) if conditions["categories"] else None,
+            conditions["start_timestamp"], conditions["end_timestamp"],
+            conditions["start_seconds"], conditions["end_seconds"],
+            conditions["min_duration"], conditions["max_duration"],
+            pagination, cursor if cursor_mode else page, per_page,
+            # MP4ヘッダー情報の反映（番号を進めない更新）で結果の長さ・解像度が変わるため区別する
+            query_index.revision
+        )
+
+        def build() -> Dict:
+            cursor_mode, cursor_state, snapshot, expired = resolve_pagination(pagination, cursor, per_page)
+
+            # 列指向インデックスで絞り込み、必要なページ分だけ取り出す（カタログは撮影時間順で整列済み）
+            with stage(stage_duration_histogram, "query.filter"):
+                result = snapshot.query(**conditions)
+            total = result.total
+            results, paging = paginate_result(result, snapshot, page, per_page, cursor_mode, cursor_state, expired)
             
-            for item in filtered_data:
-                try:
-                    # アイテムのタイムスタンプから日時を取得
-                    item_datetime = datetime.fromtimestamp(item.get("sort_timestamp", 0))
-                    item_time = item_datetime.time()
-                    
-                    # 時間範囲チェック
-                    time_in_range = True
-                    
-                    # 開始時間チェック
-                    if start_time_obj is not None:
-                        if item_time < start_time_obj:
-                            time_in_range = False
-                    
-                    # 終了時間チェック
-                    if end_time_obj is not None:
-                        if item_time > end_time_obj:
-                            time_in_range = False
-                    
-                    if time_in_range:
-                        time_filtered_data.append(item)
-                        
-                except Exception as e:
-                    logger.warning(f"アイテムの時間処理エラー: {item.get('datetime')}, エラー: {e}")
-                    continue
+            # フィルタリング後のデータサンプルをログ出力（DEBUG のときだけ組み立てる）
+            if results and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("フィルタリング後のデータサンプル（最初の5件）:")
+                for i, item in enumerate(results[:5]):
+                    logger.debug(f"フィルタリング後データ {i+1}:")
+                    logger.debug(f"  datetime: {item.get('datetime')}")
+                    logger.debug(f"  sort_timestamp: {item.get('sort_timestamp')}")
+                    logger.debug(f"  date: {item.get('date')}")
             
-            filtered_data = time_filtered_data
-            logger.debug(f"時間フィルタリング後: {len(filtered_data)}件")
-        
-        # 日時でソート（古い順）
-        filtered_data.sort(key=lambda x: x.get("sort_timestamp", 0), reverse=False)
-        
-        # ページネーション
-        total = len(filtered_data)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = min(start_idx + per_page, total)
-        
-        # 結果を取得
-        results = filtered_data[start_idx:end_idx]
-        
-        # フィルタリング後のデータサンプルをログ出力
-        if results:
-            logger.debug("フィルタリング後のデータサンプル（最初の5件）:")
-            for i, item in enumerate(results[:5]):
-                logger.debug(f"フィルタリング後データ {i+1}:")
-                logger.debug(f"  datetime: {item.get('datetime')}")
-                logger.debug(f"  sort_timestamp: {item.get('sort_timestamp')}")
-                logger.debug(f"  date: {item.get('date')}")
-        
-        logger.info(f"検索完了: {len(results)}件のデータを取得 (合計: {total}件, ページ: {page}/{total_pages})")
-        
-        return {
-            "status": "success",
-            "results": results,
-            "count": len(results),
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages
-        }
+            logger.info(f"検索完了: {len(results)}件のデータを取得 (合計: {total}件, ページング: {paging})")
+            
+            return {
+                "status": "success",
+                "results": results,
+                "count": len(results),
+                "total": total,
+                **paging
+            }
+
+        return cached_json_response(request, "/api/search", version, key, build)
         
     except HTTPException as he:
         raise
@@ -728,30 +2055,231 @@ async def search_data(
         logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="検索中にエラーが発生しました")
 
+def iter_export_lines(snapshot: CatalogQueryIndex, result, export_format: str):
+    """検索結果をNDJSON/CSVの行として EXPORT_BATCH_SIZE 件ずつ生成（全件のリストは作らない）"""
+    records = snapshot.records
+    base_path = str(scanner.base_path)
+    batch = []
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\r\n")
+        # Excelで文字化けしないようBOM付きで出力
+        writer.writerow(EXPORT_CSV_FIELDS)
+        yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+        for i in result.row_numbers():
+            record = records[i].to_dict(base_path)
+            batch.append([record[field] for field in EXPORT_CSV_FIELDS])
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(batch)
+                batch = []
+                yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        return
+
+    for i in result.row_numbers():
+        batch.append(json.dumps(records[i].to_dict(base_path), ensure_ascii=False))
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode("utf-8")
+
+# エクスポートエンドポイントの追加
+@app.get("/api/export")
+async def export_data(
+    start_date: Optional[str] = Query(None, description="開始日 (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="終了日 (YYYY-MM-DD)"),
+    start_time: Optional[str] = Query(None, description="開始時間 (HH:MM)"),
+    end_time: Optional[str] = Query(None, description="終了時間 (HH:MM)"),
+    category: Optional[str] = Query(None, description="カテゴリ（カンマ区切り）"),
+    device: Optional[str] = Query(None, description="機器名（カンマ区切り）"),
+    min_duration: Optional[float] = Query(None, ge=0, description="録画の長さの下限（秒、ヘッダー読み取り済みのもののみ一致）"),
+    max_duration: Optional[float] = Query(None, ge=0, description="録画の長さの上限（秒、ヘッダー読み取り済みのもののみ一致）"),
+    export_format: str = Query("ndjson", alias="format", description="出力形式 (ndjson / csv)")
+):
+    """検索条件に一致するレコードをNDJSONまたはCSVでストリーミング出力"""
+    try:
+        logger.info(f"エクスポートリクエスト受信: start_date={start_date}, end_date={end_date}, start_time={start_time}, end_time={end_time}, category={category}, device={device}, min_duration={min_duration}, max_duration={max_duration}, format={export_format}")
+        if export_format not in ("ndjson", "csv"):
+            raise HTTPException(status_code=400, detail="format は ndjson または csv を指定してください")
+
+        await load_catalog()
+        conditions = parse_search_conditions(start_date, end_date, start_time, end_time, category, device,
+                                             min_duration, max_duration)
+        # 出力中に再スキャンが入っても、開始時点のカタログ（スナップショット）から書き出す
+        snapshot = scanner.get_query_index()
+        result = snapshot.query(**conditions)
+        logger.info(f"エクスポート開始: {result.total}件 ({export_format}, カタログ {snapshot.version})")
+
+        filename = f"nas_data_{datetime.now():%Y-%m-%d}.{export_format}"
+        media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            iter_export_lines(snapshot, result, export_format),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "X-Total-Count": str(result.total),
+                "X-Catalog-Version": str(snapshot.version)
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"エクスポートエラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="エクスポート中にエラーが発生しました")
+
+def build_zip_entries(records: List[CatalogRecord]) -> Tuple[List[ZipEntry], int]:
+    """レコードのファイルを stat して (ZIPのエントリ一覧, 見つからなかった件数) を返す（先頭は manifest.csv）
+
+    stat は動画読み込み用のスレッドプールで並行して行う。manifest.csv には実際に入れたファイルだけを書く
+    """
+    base_path = str(scanner.base_path)
+
+    def stat_record(record: CatalogRecord) -> Optional[os.stat_result]:
+        try:
+            return os.stat(record.full_path(base_path))
+        except OSError as e:
+            logger.warning(f"ZIP作成: ファイルを読めません {record.file_path}: {e}")
+            return None
+
+    entries = []
+    rows = []
+    skipped = 0
+    for record, stat in zip(records, video_executor.map(stat_record, records)):
+        if stat is None:
+            skipped += 1
+            continue
+        entries.append(ZipEntry(record.file_path, stat.st_size, stat.st_mtime, path=record.full_path(base_path)))
+        item = record.to_dict(base_path)
+        item["size"] = stat.st_size
+        rows.append([item[field] for field in EXPORT_CSV_FIELDS])
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(EXPORT_CSV_FIELDS)
+    writer.writerows(rows)
+    manifest = ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    return [ZipEntry("manifest.csv", len(manifest), time.time(), data=manifest)] + entries, skipped
+
+# ZIP一括ダウンロードエンドポイントの追加
+@app.get("/api/zip")
+async def download_zip(
+    start_date: Optional[str] = Query(None, description="開始日 (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="終了日 (YYYY-MM-DD)"),
+    start_time: Optional[str] = Query(None, description="開始時間 (HH:MM)"),
+    end_time: Optional[str] = Query(None, description="終了時間 (HH:MM)"),
+    category: Optional[str] = Query(None, description="カテゴリ（カンマ区切り）"),
+    device: Optional[str] = Query(None, description="機器名（カンマ区切り）"),
+    min_duration: Optional[float] = Query(None, ge=0, description="録画の長さの下限（秒、ヘッダー読み取り済みのもののみ一致）"),
+    max_duration: Optional[float] = Query(None, ge=0, description="録画の長さの上限（秒、ヘッダー読み取り済みのもののみ一致）"),
+    path: Optional[List[str]] = Query(None, description="ファイルの相対パス（複数指定可。指定した場合は検索条件を使わない）")
+):
+    """検索条件に一致する録画（または path で指定した録画）を manifest.csv 付きのZIP（無圧縮）でストリーミング出力
+
+    一時ファイルは作らず、各ファイルを VIDEO_CHUNK_SIZE ずつ読みながら送る。4GBを超える場合は ZIP64 になる
+    """
+    try:
+        logger.info(f"ZIPリクエスト受信: start_date={start_date}, end_date={end_date}, start_time={start_time}, end_time={end_time}, category={category}, device={device}, min_duration={min_duration}, max_duration={max_duration}, path={len(path) if path else 0}件")
+        await load_catalog()
+
+        if path:
+            # 指定されたパスのうちカタログにあるものだけを入れる（NAS上の任意のファイルは読ませない）
+            file_paths = list(dict.fromkeys(scanner.decode_path(p) for p in path if p and p.strip()))
+            if len(file_paths) > ZIP_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"ZIPに入れられるのは{ZIP_MAX_FILES}件までです")
+            records = scanner.find_records(file_paths)
+            skipped = len(file_paths) - len(records)
+        else:
+            conditions = parse_search_conditions(start_date, end_date, start_time, end_time, category, device,
+                                                 min_duration, max_duration)
+            snapshot = scanner.get_query_index()
+            result = snapshot.query(**conditions)
+            if result.total > ZIP_MAX_FILES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"該当が{result.total}件あります。ZIPに入れられるのは{ZIP_MAX_FILES}件までです。条件を絞り込んでください"
+                )
+            records = [snapshot.records[i] for i in result.row_numbers()]
+            skipped = 0
+        if not records:
+            raise HTTPException(status_code=404, detail="ZIPに入れるファイルがありません")
+
+        with stage(stage_duration_histogram, "zip.stat"):
+            entries, missing = await run_blocking(build_zip_entries, records)
+        skipped += missing
+        archive = ZipStream(entries)
+        logger.info(f"ZIP送信開始: {len(entries) - 1}件, {archive.size}バイト (スキップ: {skipped}件)")
+
+        filename = f"nas_videos_{datetime.now():%Y-%m-%d}.zip"
+        return StreamingResponse(
+            archive.iter_bytes(video_executor, VIDEO_CHUNK_SIZE, on_read=video_read_observer("nas")),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(archive.size),
+                "X-Total-Count": str(len(entries) - 1),
+                "X-Zip-Skipped": str(skipped)
+            }
+        )
+
+    except HTTPException as he:
+        logger.error(f"ZIPリクエストエラー (HTTP {he.status_code}): {he.detail}")
+        raise
+    except Exception as e:
+        logger.error(f"ZIP作成エラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="ZIPの作成中にエラーが発生しました")
+
+# 集計エンドポイントの追加
+@app.get("/api/stats")
+async def get_stats(request: Request):
+    """機器名 × カテゴリ × 日付ごとの件数・合計バイト数と、撮影時刻（0〜23時）ごとの件数を取得"""
+    try:
+        await load_catalog()
+        # カウンタとカタログ番号は公開時に一緒に更新されるため、要約の番号をそのままETagに使う
+        summary = scanner.catalog_stats.summary()
+        version = summary["catalog_version"]
+        return cached_json_response(request, "/api/stats", version, ("stats",), lambda: {
+            "status": "success",
+            **summary
+        })
+    except Exception as e:
+        logger.error(f"集計取得エラー: {e}")
+        logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="集計の取得中にエラーが発生しました")
+
 # 存在する日付の一覧を取得するAPIエンドポイント
 @app.get("/api/available-dates")
-async def get_available_dates():
-    """存在する日付の一覧を取得"""
+async def get_available_dates(request: Request):
+    """存在する日付の一覧を取得（ETag / 304 対応）"""
     try:
         logger.info("利用可能な日付の一覧を取得")
         
-        # データを取得
-        data = scanner.scan_directories()
+        # データを取得（メモリ上のカタログから）
+        data = await load_catalog()
         if not data:
             logger.warning("データが空です")
             return {
                 "status": "success",
-                "dates": []
+                "dates": [],
+                "catalog_age": scanner.get_catalog_age()
             }
         
-        # 日付の一覧を取得（重複を除去）
-        available_dates = sorted(list(set(item["date"] for item in data)))
-        
-        logger.info(f"利用可能な日付: {len(available_dates)}件")
-        return {
-            "status": "success",
-            "dates": available_dates
-        }
+        # 日付の一覧を取得（集計済みのカウンタから。カタログ全件は走査しない）
+        version, available_dates = scanner.catalog_stats.dates()
+
+        def build() -> Dict:
+            logger.info(f"利用可能な日付: {len(available_dates)}件")
+            return {"status": "success", "dates": available_dates}
+
+        return cached_json_response(request, "/api/available-dates", version, ("available-dates",), build)
         
     except Exception as e:
         logger.error(f"日付一覧取得エラー: {e}")
@@ -0,0 +1,331 @@
+"""
+MP4のヘッダー（moov ボックス）からの長さ・解像度・コーデックの取得
+
+- ファイル先頭からボックスの見出し（8〜16バイト）だけを読んでシークで読み飛ばし、moov 内の
+  mvhd（長さ）・tkhd（表示サイズ）・hdlr（トラック種別）・mdhd・stsd（コーデック）だけを
+  MAX_BOX_READ バイトまで読む。mdat（映像本体）は読まない
+- 結果は (相対パス, サイズ, mtime) をキーにキャッシュし、同じファイルは一度だけ読む
+  （読めない・MP4として解釈できないファイルも「情報なし」として覚える。読み込みエラーは覚えず次回に再試行）
+- 読み取りはワーカースレッドで行い、結果は一定間隔でまとめて on_batch に渡す（スキャン本体は待たない）
+"""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ボックス1個あたりに読むバイト数の上限（mvhd/tkhd/stsd の先頭は100バイト程度）
+MAX_BOX_READ = 256
+
+# 1階層あたりにたどるボックス数の上限（壊れたファイルで延々と読み進めないように）
+MAX_BOXES = 1024
+
+# moov の中で子ボックスをたどるボックス
+_CONTAINERS = {b"trak", b"mdia", b"minf", b"stbl"}
+
+# 結果をまとめて反映する間隔（秒）。待ちがなくなった時点でも反映する
+FLUSH_INTERVAL = 30.0
+
+
+class MediaInfo(NamedTuple):
+    """MP4ヘッダーから読み取った情報（読み取れなかった値は None）"""
+    duration: Optional[float]
+    width: Optional[int]
+    height: Optional[int]
+    codec: Optional[str]
+
+
+class MediaInfoResult(NamedTuple):
+    """1ファイル分の読み取り結果（info が None なら情報なし）"""
+    file_path: str
+    size: int
+    mtime_ns: int
+    info: Optional[MediaInfo]
+
+
+def iter_boxes(f, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """start〜end のボックスを (種類, 本体の開始位置, 終了位置) で順に返す（見出しだけを読む）"""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            # 64ビットのサイズ
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            header_size = 16
+        elif size == 0:
+            # ファイル末尾まで
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield kind, offset + header_size, offset + size
+        offset += size
+
+
+def _read_box(f, start: int, end: int) -> bytes:
+    f.seek(start)
+    return f.read(min(end - start, MAX_BOX_READ))
+
+
+def _parse_duration(data: bytes) -> Optional[float]:
+    """mvhd / mdhd の timescale と duration から秒数を求める"""
+    try:
+        if data[0] == 1:
+            timescale, duration = struct.unpack_from(">IQ", data, 20)
+            unknown = 0xFFFFFFFFFFFFFFFF
+        else:
+            timescale, duration = struct.unpack_from(">II", data, 12)
+            unknown = 0xFFFFFFFF
+    except (IndexError, struct.error):
+        return None
+    if not timescale or duration == unknown:
+        return None
+    return round(duration / timescale, 3)
+
+
+def _parse_tkhd_size(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """tkhd の表示サイズ（16.16 固定小数点）"""
+    try:
+        width, height = struct.unpack_from(">II", data, 88 if data[0] == 1 else 76)
+    except (IndexError, struct.error):
+        return None, None
+    return (width >> 16) or None, (height >> 16) or None
+
+
+def _parse_stsd(data: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """stsd の最初のエントリから (コーデック, 幅, 高さ) を取り出す"""
+    try:
+        entry_count, _, fourcc = struct.unpack_from(">I I 4s", data, 4)
+    except struct.error:
+        return None, None, None
+    if not entry_count:
+        return None, None, None
+    codec = fourcc.decode("ascii", "replace").strip() or None
+    try:
+        # VisualSampleEntry の width/height（エントリ先頭から32バイト目）
+        width, height = struct.unpack_from(">HH", data, 40)
+    except struct.error:
+        return codec, None, None
+    return codec, width or None, height or None
+
+
+def _parse_track(f, start: int, end: int) -> Optional[Tuple]:
+    """映像トラックなら (長さ, 幅, 高さ, コーデック)、それ以外は None"""
+    handler = None
+    duration = None
+    width = height = None
+    codec = None
+    sample_width = sample_height = None
+    stack = [(start, end)]
+    while stack:
+        box_start, box_end = stack.pop()
+        for kind, body_start, body_end in iter_boxes(f, box_start, box_end):
+            if kind in _CONTAINERS:
+                stack.append((body_start, body_end))
+            elif kind == b"tkhd":
+                width, height = _parse_tkhd_size(_read_box(f, body_start, body_end))
+            elif kind == b"mdhd":
+                duration = _parse_duration(_read_box(f, body_start, body_end))
+            elif kind == b"hdlr":
+                handler = _read_box(f, body_start, body_end)[8:12]
+            elif kind == b"stsd":
+                codec, sample_width, sample_height = _parse_stsd(_read_box(f, body_start, body_end))
+    if handler != b"vide":
+        return None
+    return duration, width or sample_width, height or sample_height, codec
+
+
+def read_mp4_metadata(path: str) -> Optional[MediaInfo]:
+    """MP4の長さ・解像度・コーデックを読み取る（moov がない・解釈できない場合は None、読み込みエラーは OSError）"""
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        for kind, start, end in iter_boxes(f, 0, file_size):
+            if kind != b"moov":
+                continue
+            duration = None
+            video = None
+            for child, child_start, child_end in iter_boxes(f, start, end):
+                if child == b"mvhd":
+                    duration = _parse_duration(_read_box(f, child_start, child_end))
+                elif child == b"trak" and video is None:
+                    video = _parse_track(f, child_start, child_end)
+            if video is None:
+                return MediaInfo(duration, None, None, None) if duration is not None else None
+            track_duration, width, height, codec = video
+            return MediaInfo(duration if duration is not None else track_duration, width, height, codec)
+    return None
+
+
+class MediaInfoCache:
+    """相対パス → (サイズ, mtime, 読み取り結果) のキャッシュ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, int, Optional[MediaInfo]]] = {}
+
+    def get(self, file_path: str, size: int, mtime_ns: int) -> Tuple[bool, Optional[MediaInfo]]:
+        """(読み取り済みか, 読み取り結果) を返す（サイズか mtime が違えば未読み取り扱い）"""
+        entry = self._entries.get(file_path)
+        if entry is None or entry[0] != size or entry[1] != mtime_ns:
+            return False, None
+        return True, entry[2]
+
+    def known(self, file_path: str, size: int) -> bool:
+        """サイズが同じ読み取り結果があるか（mtime を持たないレコードから判定する場合）"""
+        entry = self._entries.get(file_path)
+        return entry is not None and entry[0] == size
+
+    def put(self, file_path: str, size: int, mtime_ns: int, info: Optional[MediaInfo]) -> None:
+        with self._lock:
+            self._entries[file_path] = (size, mtime_ns, info)
+
+    def load(self, results: Iterable[MediaInfoResult]) -> None:
+        """永続インデックスに保存していた結果をまとめて登録"""
+        with self._lock:
+            for result in results:
+                self._entries[result.file_path] = (result.size, result.mtime_ns, result.info)
+
+    def discard(self, file_paths: Iterable[str]) -> None:
+        with self._lock:
+            for file_path in file_paths:
+                self._entries.pop(file_path, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MediaInfoExtractor:
+    """MP4ヘッダーの読み取りワーカープール
+
+    submit したレコードをワーカースレッドで読み取り、結果（MediaInfoResult の一覧）を
+    flush_interval 秒ごと、または待ちがなくなった時点でまとめて on_batch に渡す
+    """
+
+    def __init__(self, base_path: str, cache: MediaInfoCache,
+                 on_batch: Callable[[List[MediaInfoResult]], None],
+                 workers: int = 2, flush_interval: float = FLUSH_INTERVAL):
+        self.base_path = base_path
+        self.cache = cache
+        self.on_batch = on_batch
+        self.flush_interval = flush_interval
+        # レコードへの参照だけを積む（100万件でもキューの大きさはポインタ分）
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._results: List[MediaInfoResult] = []
+        self._wake = threading.Event()
+        self.counters = {"queued": 0, "parsed": 0, "cache_hits": 0, "no_info": 0, "errors": 0,
+                         "batches": 0, "read_ms": 0.0}
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, name=f"media-info-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        flusher = threading.Thread(target=self._flusher, name="media-info-flush", daemon=True)
+        flusher.start()
+        self._threads.append(flusher)
+        logger.info(f"MP4ヘッダーの読み取りを開始: workers={workers}, 反映間隔={flush_interval}秒")
+
+    def submit(self, records: Iterable) -> int:
+        """レコードのヘッダー読み取りを登録（待ち中のものは除く。登録件数を返す）"""
+        count = 0
+        for record in records:
+            with self._lock:
+                if record.file_path in self._queued:
+                    continue
+                self._queued.add(record.file_path)
+                self.counters["queued"] += 1
+            self._queue.put(record)
+            count += 1
+        return count
+
+    def _worker(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                self._read(record)
+            except Exception as e:
+                logger.error(f"MP4ヘッダーの読み取り中にエラーが発生 {record.file_path}: {e}")
+                logger.debug(traceback.format_exc())
+            finally:
+                with self._lock:
+                    self._queued.discard(record.file_path)
+                    idle = not self._queued
+                if idle:
+                    self._wake.set()
+
+    def _read(self, record) -> None:
+        full_path = record.full_path(self.base_path)
+        try:
+            stat = os.stat(full_path)
+            found, info = self.cache.get(record.file_path, stat.st_size, stat.st_mtime_ns)
+            if found:
+                hit = True
+            else:
+                hit = False
+                started = time.perf_counter()
+                info = read_mp4_metadata(full_path)
+                elapsed = (time.perf_counter() - started) * 1000
+                self.cache.put(record.file_path, stat.st_size, stat.st_mtime_ns, info)
+        except OSError as e:
+            # NASの一時的なエラーかもしれないため結果は覚えない（次のスキャンで再試行）
+            with self._lock:
+                self.counters["errors"] += 1
+            logger.debug(f"MP4ヘッダーを読めません {full_path}: {e}")
+            return
+        with self._lock:
+            if hit:
+                self.counters["cache_hits"] += 1
+            else:
+                self.counters["parsed"] += 1
+                self.counters["read_ms"] += elapsed
+            if info is None:
+                self.counters["no_info"] += 1
+            self._results.append(MediaInfoResult(record.file_path, stat.st_size, stat.st_mtime_ns, info))
+
+    def _flusher(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """溜まった結果を on_batch に渡す（渡した件数を返す）"""
+        with self._lock:
+            batch, self._results = self._results, []
+        if not batch:
+            return 0
+        try:
+            self.on_batch(batch)
+            with self._lock:
+                self.counters["batches"] += 1
+        except Exception as e:
+            logger.error(f"MP4ヘッダー情報の反映中にエラーが発生: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+        return len(batch)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "read_ms": round(self.counters["read_ms"], 1),
+                "pending": len(self._queued),
+                "buffered": len(self._results),
+                "cached": len(self.cache),
+                "workers": len(self._threads) - 1
+            }
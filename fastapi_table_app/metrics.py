@@ -0,0 +1,211 @@
+"""
+計測値の収集と Prometheus 形式での出力（/metrics）
+
+外部ライブラリを使わずに、カウンタ・ヒストグラム・ゲージ（出力時に値を求める関数）を持つ。
+処理の区間ごとの所要時間は stage() で計測し、ヒストグラムに加えて、
+プロファイル対象のリクエスト（X-Profile ヘッダー付き）では Server-Timing ヘッダー用に記録する。
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 応答時間など（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# スキャン時間（秒）
+SCAN_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """増える一方の値（件数・バイト数）"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """観測値の分布（区間ごとの累積件数・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # ラベル → [区間ごとの件数..., 合計, 件数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = self.header()
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """出力時に関数を呼んで値を求める現在値（カタログ件数など）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, func: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.func = func
+
+    def render(self) -> List[str]:
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return self.header() + [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """計測値の一覧（登録順に出力する）"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, func: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help_text, func))
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestProfile:
+    """1リクエスト分の区間ごとの所要時間（Server-Timing ヘッダー用）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages.append((name, seconds))
+
+    def server_timing(self) -> str:
+        entries = [f"{name.replace('.', '-')};dur={seconds * 1000:.2f}" for name, seconds in self.stages]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("request_profile", default=None)
+
+
+def start_profile() -> Tuple[RequestProfile, contextvars.Token]:
+    """このリクエストのプロファイルを開始（以降の stage() の計測結果を記録する）"""
+    profile = RequestProfile()
+    return profile, _current_profile.set(profile)
+
+
+def end_profile(token: contextvars.Token) -> None:
+    _current_profile.reset(token)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextmanager
+def stage(histogram: Histogram, name: str) -> Iterator[None]:
+    """区間の所要時間を histogram（stage ラベル）に記録し、プロファイル中なら Server-Timing にも加える"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, stage=name)
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.add(name, elapsed)
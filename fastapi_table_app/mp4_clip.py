@@ -0,0 +1,519 @@
+"""
+MP4の時間範囲の切り出し（再エンコードなし）
+
+元ファイルの moov だけを読み、各トラックのサンプル表（stts/ctts/stss/stsc/stsz/stco）から
+指定した時間範囲のサンプルを選んで新しい moov を組み立てる。映像本体は元ファイルの mdat から
+該当サンプルのバイト範囲だけをそのままコピーする。
+
+- 出力は ftyp → moov → mdat の順（moov が先頭にあるためブラウザはダウンロード途中から再生できる）
+- 映像トラックは開始位置より前の直近のキーフレームから切り出す（実際の開始秒は ClipLayout.start）
+- 音声トラックは映像の実際の開始〜終了秒に含まれるサンプルを使い、ずれは編集リスト（elst）の空白で合わせる
+- 元の編集リスト（edts）・サンプル単位の補助情報（sdtp/sbgp など）・映像と音声以外のトラックは出力しない
+- フラグメント化されたMP4（moof）・stz2 は対象外（ClipError）
+"""
+
+import io
+import itertools
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+from media_info import iter_boxes
+from video_serving import RangeNotSatisfiable, if_range_matches, is_not_modified, iter_file_ranges, parse_range_header
+
+# 読み込む moov の大きさの上限（30分の録画で数MB程度）
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# 1トラックあたりのサンプル数の上限（壊れたファイルで巨大な表を展開しないように）
+MAX_SAMPLES = 10_000_000
+
+# 作成した切り出しの構成を保持しておく数（シークのたびに moov を読み直さないように）
+LAYOUT_CACHE_SIZE = 32
+
+# 切り出しに含めるトラックの種類（映像・音声）
+_TRACK_HANDLERS = (b"vide", b"soun")
+
+
+class ClipError(Exception):
+    """切り出せないファイル（MP4として解釈できない・対応していない形式）の例外"""
+
+
+class ClipOutOfRange(ClipError):
+    """指定した時間範囲に映像がない場合の例外"""
+
+
+class ClipLayout:
+    """切り出したMP4の構成（先頭の ftyp+moov+mdat ヘッダーと、続けてコピーする元ファイルの範囲）"""
+
+    __slots__ = ("head", "ranges", "size", "start", "end")
+
+    def __init__(self, head: bytes, ranges: List[Tuple[int, int]], start: float, end: float):
+        self.head = head
+        # (元ファイルの開始位置, バイト数) の一覧
+        self.ranges = ranges
+        self.size = len(head) + sum(length for _, length in ranges)
+        # 実際に切り出した範囲（秒）。開始はキーフレームに合わせるため指定より前になることがある
+        self.start = start
+        self.end = end
+
+    def slice(self, first: int, last: int) -> List[Tuple[bytes, int, int]]:
+        """出力の first〜last バイト目（両端を含む）を iter_file_ranges の parts 形式に変換"""
+        parts = []
+        pending = self.head[first:last + 1] if first < len(self.head) else b""
+        position = len(self.head)
+        for source, length in self.ranges:
+            if position > last:
+                break
+            segment_last = position + length - 1
+            if segment_last >= first:
+                start = source + max(first, position) - position
+                end = source + min(last, segment_last) - position
+                parts.append((pending, start, end))
+                pending = b""
+            position += length
+        if pending:
+            # 範囲のない部分（先頭のヘッダーだけを返す場合）
+            parts.append((pending, 1, 0))
+        return parts
+
+
+def _box(kind: bytes, *payloads: bytes) -> bytes:
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def _full_box(kind: bytes, version: int, flags: int, *payloads: bytes) -> bytes:
+    return _box(kind, struct.pack(">I", (version << 24) | flags), *payloads)
+
+
+def _table(data: bytes, offset: int, count: int, typecode: str = "I") -> array:
+    """ビッグエンディアンの整数の表を array に読み込む"""
+    values = array(typecode)
+    size = values.itemsize * count
+    if count < 0 or offset + size > len(data):
+        raise ClipError("サンプルテーブルが壊れています")
+    values.frombytes(data[offset:offset + size])
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    values = array(values.typecode, values)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _runs(values) -> List[Tuple[int, int]]:
+    """連続する同じ値を (個数, 値) にまとめる"""
+    return [(len(list(group)), value) for value, group in itertools.groupby(values)]
+
+
+def _replace_uint(data: bytes, offset: int, value: int, wide: bool) -> bytes:
+    fmt = ">Q" if wide else ">I"
+    if not wide:
+        value = min(value, 0xFFFFFFFF)
+    return data[:offset] + struct.pack(fmt, value) + data[offset + struct.calcsize(fmt):]
+
+
+class _Track:
+    """切り出し用に展開したトラック1本分のボックスとサンプル表"""
+
+    def __init__(self, data: bytes, buf: io.BytesIO, start: int, end: int):
+        self.tkhd = self.mdhd = self.stsd = None
+        self.handler = None
+        mdia = minf = stbl = None
+        for kind, s, e in iter_boxes(buf, start, end):
+            if kind == b"tkhd":
+                self.tkhd = data[s:e]
+            elif kind == b"mdia":
+                mdia = (s, e)
+        # mdia・minf の中の、書き換えないボックス（hdlr・vmhd・dinf など）
+        self.mdia_boxes: List[bytes] = []
+        self.minf_boxes: List[bytes] = []
+        if mdia is not None:
+            for kind, s, e in iter_boxes(buf, *mdia):
+                if kind == b"mdhd":
+                    self.mdhd = data[s:e]
+                elif kind == b"minf":
+                    minf = (s, e)
+                else:
+                    if kind == b"hdlr":
+                        self.handler = data[s + 8:s + 12]
+                    self.mdia_boxes.append(_box(kind, data[s:e]))
+        if minf is not None:
+            for kind, s, e in iter_boxes(buf, *minf):
+                if kind == b"stbl":
+                    stbl = (s, e)
+                else:
+                    self.minf_boxes.append(_box(kind, data[s:e]))
+        self.count = 0
+        if self.handler not in _TRACK_HANDLERS:
+            # 映像・音声以外のトラック（タイムコードなど）は出力しないためサンプル表を読まない
+            return
+        if self.tkhd is None or self.mdhd is None or stbl is None or len(self.mdhd) < 24:
+            raise ClipError("トラックの構成が不完全です")
+        self.timescale = struct.unpack_from(">I", self.mdhd, 20 if self.mdhd[0] == 1 else 12)[0]
+        if not self.timescale:
+            raise ClipError("トラックの timescale が 0 です")
+        self._load_samples(data, buf, stbl)
+
+    def _load_samples(self, data: bytes, buf: io.BytesIO, stbl: Tuple[int, int]) -> None:
+        tables: Dict[bytes, Tuple[int, int]] = {}
+        for kind, s, e in iter_boxes(buf, *stbl):
+            tables.setdefault(kind, (s, e))
+        if b"stz2" in tables:
+            raise ClipError("stz2 形式のサンプルサイズには対応していません")
+        for kind in (b"stsd", b"stts", b"stsc", b"stsz"):
+            if kind not in tables:
+                raise ClipError(f"{kind.decode()} がありません")
+        if b"stco" not in tables and b"co64" not in tables:
+            raise ClipError("stco / co64 がありません")
+        s, e = tables[b"stsd"]
+        self.stsd = _box(b"stsd", data[s:e])
+
+        # サンプルサイズ
+        s, _ = tables[b"stsz"]
+        self.uniform_size, count = struct.unpack_from(">II", data, s + 4)
+        if count > MAX_SAMPLES:
+            raise ClipError("サンプル数が多すぎます")
+        self.count = count
+        self.sizes = None if self.uniform_size else _table(data, s + 12, count)
+
+        # 各サンプルの長さ（stts）と、デコード時刻（先頭からの累積。末尾にトラックの長さが入る）
+        s, _ = tables[b"stts"]
+        entries = _table(data, s + 8, 2 * struct.unpack_from(">I", data, s + 4)[0])
+        self.deltas = array("I")
+        for i in range(0, len(entries), 2):
+            self.deltas.extend(itertools.repeat(entries[i + 1], min(entries[i], count - len(self.deltas))))
+            if len(self.deltas) >= count:
+                break
+        if len(self.deltas) < count:
+            self.deltas.extend(itertools.repeat(self.deltas[-1] if self.deltas else 0, count - len(self.deltas)))
+        self.dts = array("q", itertools.accumulate(self.deltas, initial=0))
+
+        # 表示時刻のずれ（ctts、任意）
+        self.composition = None
+        self.ctts_version = 0
+        if b"ctts" in tables:
+            s, _ = tables[b"ctts"]
+            self.ctts_version = data[s]
+            entries = _table(data, s + 8, 2 * struct.unpack_from(">I", data, s + 4)[0], "i")
+            self.composition = array("i")
+            for i in range(0, len(entries), 2):
+                self.composition.extend(itertools.repeat(entries[i + 1], min(entries[i], count - len(self.composition))))
+                if len(self.composition) >= count:
+                    break
+            if len(self.composition) < count:
+                self.composition.extend(itertools.repeat(0, count - len(self.composition)))
+
+        # キーフレーム（stss がなければ全サンプルがキーフレーム。番号は1始まり）
+        self.sync = None
+        if b"stss" in tables:
+            s, _ = tables[b"stss"]
+            self.sync = _table(data, s + 8, struct.unpack_from(">I", data, s + 4)[0])
+
+        # チャンクの位置と、サンプルごとのファイル上の位置・所属チャンク
+        if b"co64" in tables:
+            s, _ = tables[b"co64"]
+            chunk_offsets = _table(data, s + 8, struct.unpack_from(">I", data, s + 4)[0], "Q")
+        else:
+            s, _ = tables[b"stco"]
+            chunk_offsets = _table(data, s + 8, struct.unpack_from(">I", data, s + 4)[0])
+        s, _ = tables[b"stsc"]
+        stsc = _table(data, s + 8, 3 * struct.unpack_from(">I", data, s + 4)[0])
+        self.offsets = array("Q")
+        self.chunks = array("I")
+        self.chunk_descriptions = array("I", itertools.repeat(1, len(chunk_offsets)))
+        sample = 0
+        for i in range(0, len(stsc), 3):
+            first_chunk, per_chunk, description = stsc[i], stsc[i + 1], stsc[i + 2]
+            next_chunk = stsc[i + 3] if i + 3 < len(stsc) else len(chunk_offsets) + 1
+            for chunk in range(max(0, first_chunk - 1), min(next_chunk - 1, len(chunk_offsets))):
+                self.chunk_descriptions[chunk] = description
+                offset = chunk_offsets[chunk]
+                for _ in range(min(per_chunk, count - sample)):
+                    self.offsets.append(offset)
+                    self.chunks.append(chunk)
+                    offset += self.size(sample)
+                    sample += 1
+        if sample < count:
+            raise ClipError("チャンクとサンプル数が一致しません")
+
+    def size(self, sample: int) -> int:
+        return self.uniform_size if self.sizes is None else self.sizes[sample]
+
+    @property
+    def duration(self) -> int:
+        return self.dts[-1]
+
+    def select(self, start: float, end: float, snap: bool) -> Tuple[int, int]:
+        """start〜end 秒に含まれるサンプルの範囲 [a, b)（snap=True なら開始を直前のキーフレームに合わせる）"""
+        start_ts = round(start * self.timescale)
+        end_ts = round(end * self.timescale)
+        if snap:
+            a = max(0, bisect_right(self.dts, start_ts, 0, self.count) - 1)
+            if self.sync is not None:
+                position = bisect_right(self.sync, a + 1) - 1
+                a = self.sync[position] - 1 if position >= 0 else 0
+        else:
+            a = bisect_left(self.dts, start_ts, 0, self.count)
+        b = bisect_left(self.dts, end_ts, 0, self.count)
+        # キーフレームに合わせる基準のトラックは少なくとも1サンプルを含める
+        return a, max(a + 1, b) if snap else max(a, b)
+
+    def new_chunks(self, a: int, b: int) -> List[List[int]]:
+        """サンプル a〜b-1 を元のチャンク単位にまとめる（[元の位置, バイト数, サンプル数, サンプル記述番号]）"""
+        chunks: List[List[int]] = []
+        current = None
+        for sample in range(a, b):
+            chunk = self.chunks[sample]
+            if current is None or chunk != current:
+                current = chunk
+                chunks.append([self.offsets[sample], 0, 0, self.chunk_descriptions[chunk]])
+            chunks[-1][1] += self.size(sample)
+            chunks[-1][2] += 1
+        return chunks
+
+    def build(self, a: int, b: int, chunks: List[List[int]], chunk_offsets: List[int], wide_offsets: bool,
+              movie_timescale: int, lead: float) -> Tuple[bytes, int]:
+        """サンプル a〜b-1 だけのトラック（trak）を作成し、(trak, ムービー timescale での長さ) を返す"""
+        media_duration = self.dts[b] - self.dts[a]
+        duration = media_duration * movie_timescale // self.timescale
+        lead_duration = round(lead * movie_timescale)
+
+        tables = [self.stsd]
+        stts = _runs(self.deltas[a:b])
+        tables.append(_full_box(b"stts", 0, 0, struct.pack(">I", len(stts)),
+                                b"".join(struct.pack(">II", n, value) for n, value in stts)))
+        if self.composition is not None:
+            ctts = _runs(self.composition[a:b])
+            tables.append(_full_box(b"ctts", self.ctts_version, 0, struct.pack(">I", len(ctts)),
+                                    b"".join(struct.pack(">Ii", n, value) for n, value in ctts)))
+        if self.sync is not None:
+            sync = array("I", (number - a for number in self.sync[bisect_left(self.sync, a + 1):bisect_left(self.sync, b + 1)]))
+            tables.append(_full_box(b"stss", 0, 0, struct.pack(">I", len(sync)), _to_bytes(sync)))
+        stsc = []
+        for i, (_, _, count, description) in enumerate(chunks):
+            if not stsc or stsc[-1][1:] != (count, description):
+                stsc.append((i + 1, count, description))
+        tables.append(_full_box(b"stsc", 0, 0, struct.pack(">I", len(stsc)),
+                                b"".join(struct.pack(">III", *entry) for entry in stsc)))
+        if self.sizes is None:
+            tables.append(_full_box(b"stsz", 0, 0, struct.pack(">II", self.uniform_size, b - a)))
+        else:
+            tables.append(_full_box(b"stsz", 0, 0, struct.pack(">II", 0, b - a), _to_bytes(self.sizes[a:b])))
+        if wide_offsets:
+            tables.append(_full_box(b"co64", 0, 0, struct.pack(">I", len(chunk_offsets)),
+                                    _to_bytes(array("Q", chunk_offsets))))
+        else:
+            tables.append(_full_box(b"stco", 0, 0, struct.pack(">I", len(chunk_offsets)),
+                                    _to_bytes(array("I", chunk_offsets))))
+
+        # 編集リスト: 音声の開始が映像より遅い分は空白、B フレームの表示時刻のずれは media_time で詰める
+        edits = []
+        if lead_duration > 0:
+            edits.append(struct.pack(">IiI", lead_duration, -1, 0x00010000))
+        media_time = self.composition[a] if self.composition is not None else 0
+        edits.append(struct.pack(">IiI", duration, media_time, 0x00010000))
+        edts = _box(b"edts", _full_box(b"elst", 0, 0, struct.pack(">I", len(edits)), *edits))
+
+        mdhd_wide = self.mdhd[0] == 1
+        mdhd = _replace_uint(self.mdhd, 24 if mdhd_wide else 16, media_duration, mdhd_wide)
+        tkhd_wide = self.tkhd[0] == 1
+        tkhd = _replace_uint(self.tkhd, 28 if tkhd_wide else 20, lead_duration + duration, tkhd_wide)
+        minf = _box(b"minf", *self.minf_boxes, _box(b"stbl", *tables))
+        mdia = _box(b"mdia", _box(b"mdhd", mdhd), *self.mdia_boxes, minf)
+        return _box(b"trak", _box(b"tkhd", tkhd), edts, mdia), lead_duration + duration
+
+
+def _read_header_boxes(path: str) -> Tuple[Optional[bytes], bytes]:
+    """ftyp（元のまま）と moov の本体を読み込む"""
+    ftyp = None
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        for kind, start, end in iter_boxes(f, 0, file_size):
+            if kind == b"ftyp" and end - start <= 1024:
+                f.seek(start)
+                ftyp = _box(b"ftyp", f.read(end - start))
+            elif kind == b"moof":
+                raise ClipError("フラグメント化されたMP4には対応していません")
+            elif kind == b"moov":
+                if end - start > MAX_MOOV_BYTES:
+                    raise ClipError("moov が大きすぎます")
+                f.seek(start)
+                moov = f.read(end - start)
+                if len(moov) < end - start:
+                    raise ClipError("moov を読み込めません")
+                return ftyp, moov
+    raise ClipError("moov がありません（MP4ではないか、書き込み中のファイルです）")
+
+
+def build_clip_layout(path: str, start: float, end: float) -> ClipLayout:
+    """path の start〜end 秒を切り出したMP4の構成を作成（読み込むのは ftyp と moov だけ）"""
+    if end <= start:
+        raise ClipOutOfRange("終了秒は開始秒より後にしてください")
+    ftyp, moov = _read_header_boxes(path)
+    try:
+        return _build_layout(ftyp, moov, start, end)
+    except (struct.error, IndexError) as e:
+        raise ClipError(f"moov が壊れています: {e}") from e
+
+
+def _build_layout(ftyp: Optional[bytes], moov: bytes, start: float, end: float) -> ClipLayout:
+    buf = io.BytesIO(moov)
+    mvhd = None
+    tracks: List[_Track] = []
+    other_boxes: List[bytes] = []
+    for kind, s, e in iter_boxes(buf, 0, len(moov)):
+        if kind == b"mvhd":
+            mvhd = moov[s:e]
+        elif kind == b"trak":
+            track = _Track(moov, buf, s, e)
+            if track.count:
+                tracks.append(track)
+        elif kind == b"mvex":
+            raise ClipError("フラグメント化されたMP4には対応していません")
+        else:
+            other_boxes.append(_box(kind, moov[s:e]))
+    if mvhd is None or len(mvhd) < 24 or not tracks:
+        raise ClipError("映像・音声のトラックがありません")
+    movie_timescale = struct.unpack_from(">I", mvhd, 20 if mvhd[0] == 1 else 12)[0] or 1000
+
+    # 基準のトラック（映像、なければ先頭のトラック）でキーフレームに合わせた範囲を決め、他のトラックはその時間に合わせる
+    primary = next((track for track in tracks if track.handler == b"vide"), tracks[0])
+    if start * primary.timescale >= primary.duration:
+        raise ClipOutOfRange("開始秒が録画の長さを超えています")
+    a, b = primary.select(start, end, snap=True)
+    clip_start = primary.dts[a] / primary.timescale
+    clip_end = primary.dts[b] / primary.timescale
+    selections = []
+    for track in tracks:
+        if track is primary:
+            selections.append((track, a, b, 0.0))
+            continue
+        ta, tb = track.select(clip_start, clip_end, snap=False)
+        if tb > ta:
+            selections.append((track, ta, tb, max(0.0, track.dts[ta] / track.timescale - clip_start)))
+
+    # 元ファイルでの位置順にチャンクを並べ（元の映像・音声の交互配置を保つ）、出力の mdat 内の位置を決める
+    track_chunks = [track.new_chunks(ta, tb) for track, ta, tb, _ in selections]
+    order = sorted(((chunk[0], i, j) for i, chunks in enumerate(track_chunks) for j, chunk in enumerate(chunks)))
+    relative_offsets = [[0] * len(chunks) for chunks in track_chunks]
+    ranges: List[List[int]] = []
+    position = 0
+    for source, i, j in order:
+        length = track_chunks[i][j][1]
+        relative_offsets[i][j] = position
+        if ranges and ranges[-1][0] + ranges[-1][1] == source:
+            ranges[-1][1] += length
+        else:
+            ranges.append([source, length])
+        position += length
+    mdat_size = position
+    mdat_header = struct.pack(">I4s", 8 + mdat_size, b"mdat") if 8 + mdat_size <= 0xFFFFFFFF \
+        else struct.pack(">I4sQ", 1, b"mdat", 16 + mdat_size)
+    ftyp = ftyp or _box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41")
+
+    def build_moov(base: int, wide_offsets: bool) -> bytes:
+        traks = []
+        movie_duration = 0
+        for (track, ta, tb, lead), chunks, offsets in zip(selections, track_chunks, relative_offsets):
+            trak, duration = track.build(ta, tb, chunks, [base + offset for offset in offsets], wide_offsets,
+                                         movie_timescale, lead)
+            traks.append(trak)
+            movie_duration = max(movie_duration, duration)
+        mvhd_wide = mvhd[0] == 1
+        header = _replace_uint(mvhd, 24 if mvhd_wide else 16, movie_duration, mvhd_wide)
+        return _box(b"moov", _box(b"mvhd", header), *traks, *other_boxes)
+
+    # moov の大きさはチャンク位置の値によらないため、一度作って大きさを求めてから位置を確定する
+    # （mdat の末尾が4GBを超える場合だけ64ビットの co64 を使う）
+    wide_offsets = False
+    base = len(ftyp) + len(build_moov(0, wide_offsets)) + len(mdat_header)
+    if base + mdat_size > 0xFFFFFFFF:
+        wide_offsets = True
+        base = len(ftyp) + len(build_moov(0, wide_offsets)) + len(mdat_header)
+    head = ftyp + build_moov(base, wide_offsets) + mdat_header
+    return ClipLayout(head, [(source, length) for source, length in ranges], clip_start, clip_end)
+
+
+class ClipLayoutCache:
+    """(パス, サイズ, mtime, 開始秒, 終了秒) → ClipLayout のLRU（同じ切り出しへの Range リクエスト用）"""
+
+    def __init__(self, max_entries: int = LAYOUT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, ClipLayout]" = OrderedDict()
+        self.stats = {"hits": 0, "builds": 0, "errors": 0}
+
+    def get(self, path: str, stat: os.stat_result, start: float, end: float) -> ClipLayout:
+        """切り出しの構成を取得（なければ作成。ブロッキング処理のためスレッドプールで呼び出す）"""
+        key = (path, stat.st_size, stat.st_mtime_ns, start, end)
+        with self._lock:
+            layout = self._entries.get(key)
+            if layout is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return layout
+        try:
+            layout = build_clip_layout(path, start, end)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        with self._lock:
+            self.stats["builds"] += 1
+            self._entries[key] = layout
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return layout
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+
+def build_clip_response(path: str, layout: ClipLayout, stat: os.stat_result, request_headers: Mapping[str, str],
+                        executor: Executor, chunk_size: int, headers: Dict[str, str],
+                        on_read: Optional[Callable[[int, float], None]] = None) -> Response:
+    """切り出したMP4を 200 / 206 / 304 / 416 で返す（Range は単一範囲のみ。複数範囲の場合は全体を返す）
+
+    headers には Content-Disposition など追加のヘッダーを渡す
+    """
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}-{layout.start:g}-{layout.end:g}"'
+    headers = {**headers, "Accept-Ranges": "bytes", "ETag": etag}
+    if is_not_modified(request_headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request_headers.get("range")
+    if range_header:
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range_matches(if_range, etag, stat.st_mtime):
+            try:
+                ranges = parse_range_header(range_header, layout.size)
+            except RangeNotSatisfiable:
+                headers["Content-Range"] = f"bytes */{layout.size}"
+                return Response(status_code=416, headers=headers)
+    if ranges is None or len(ranges) != 1:
+        first, last, status_code = 0, layout.size - 1, 200
+    else:
+        (first, last), status_code = ranges[0], 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{layout.size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(
+        iter_file_ranges(path, layout.slice(first, last), b"", executor, chunk_size, on_read),
+        status_code=status_code,
+        media_type="video/mp4",
+        headers=headers
+    )
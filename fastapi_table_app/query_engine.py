@@ -0,0 +1,452 @@
+"""
+カタログ検索用の列指向インデックス
+
+撮影時間順に並んだカタログを列（タイムスタンプ配列・機器/カテゴリのビットマップ・
+0時からの経過秒数）に分解して保持し、/api/search の絞り込みを全件走査なしで行う。
+
+- 日付範囲: ソート済みタイムスタンプ配列への二分探索
+- 機器名・カテゴリ: 値ごとのビットマップ（Pythonのintをビット列として使用）のOR/AND
+- 時間帯 (HH:MM): 1時間・10分・1分単位のビットマップの組み合わせ（10分・1分単位は必要時に作成してキャッシュ）
+- 録画の長さ: 長さ順に並べた (長さ, 行番号) への二分探索（長さが分からない行は長さを指定した検索に一致しない）
+- ページ切り出し: ブロック単位のビット数集計で読み飛ばし、必要な件数だけ取り出す
+- カーソル（キーセット）ページング: (撮影時間, 機器名, ファイルパス) のキーから行位置を二分探索で求める
+"""
+
+import copy
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from catalog_record import CatalogRecord
+
+# ページ切り出し時に1度に扱うビット数（8192バイト分）
+_BLOCK_BITS = 65536
+_BLOCK_BYTES = _BLOCK_BITS // 8
+_BLOCK_MASK = (1 << _BLOCK_BITS) - 1
+
+# バイト値 → 立っているビット位置の表と、0以外のバイトの検索パターン
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+# 10分・1分単位ビットマップのキャッシュ上限
+_BUCKET_CACHE_SIZE = 256
+
+# 時間帯条件・長さ条件ごとに組み立てたビットマップのキャッシュ上限
+_TIME_MASK_CACHE_SIZE = 32
+_DURATION_MASK_CACHE_SIZE = 32
+
+if hasattr(int, "bit_count"):
+    def _popcount(value: int) -> int:
+        return value.bit_count()
+else:  # Python 3.9以前
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def record_key(record: CatalogRecord) -> Tuple[float, str, str]:
+    """カタログの並び順を決めるキー（撮影時間 → 機器名 → ファイルパス）"""
+    return (record.timestamp, record.device, record.file_path)
+
+
+def _bitmap_from_indices(indices: Sequence[int], size: int) -> int:
+    """行番号の列からビットマップを作成"""
+    buffer = bytearray((size + 7) // 8)
+    for i in indices:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _range_mask(lo: int, hi: int) -> int:
+    """行番号 lo 以上 hi 未満のビットを立てたマスク"""
+    if hi <= lo:
+        return 0
+    return ((1 << (hi - lo)) - 1) << lo
+
+
+def _select(chunk: int, k: int, width: int) -> int:
+    """chunk の下位から k 番目（0始まり）の立っているビットの位置を二分探索で求める"""
+    lo, hi = 0, width
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _popcount(chunk & ((1 << (mid + 1)) - 1)) > k:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class CatalogQueryIndex:
+    """撮影時間順カタログの列指向インデックス（構築後は読み取り専用）
+
+    version はカタログのスナップショット番号で、カーソルがどのカタログを基準にしているかの判定に使う。
+    revision は同じ番号のままMP4ヘッダー情報を反映した回数（with_media で進める）
+    """
+
+    def __init__(self, records: List[CatalogRecord], version: int = 0):
+        started = time.perf_counter()
+        self.records = records
+        self.version = version
+        self.revision = 0
+        self.size = len(records)
+        self.timestamps = array("d")
+        self.seconds_of_day = array("l")
+        device_rows: Dict[str, List[int]] = {}
+        category_rows: Dict[str, List[int]] = {}
+        hour_rows: List[List[int]] = [[] for _ in range(24)]
+        self._minute_rows: List[array] = [array("l") for _ in range(1440)]
+        duration_rows: List[Tuple[float, int]] = []
+
+        for i, record in enumerate(records):
+            timestamp = record.timestamp
+            self.timestamps.append(timestamp)
+            local = time.localtime(timestamp)
+            seconds = local.tm_hour * 3600 + local.tm_min * 60 + min(local.tm_sec, 59)
+            self.seconds_of_day.append(seconds)
+            device_rows.setdefault(record.device, []).append(i)
+            category_rows.setdefault(record.category, []).append(i)
+            hour_rows[seconds // 3600].append(i)
+            self._minute_rows[seconds // 60].append(i)
+            media = record.media
+            if media is not None and media.duration is not None:
+                duration_rows.append((media.duration, i))
+
+        self.device_bitmaps = {key: _bitmap_from_indices(rows, self.size) for key, rows in device_rows.items()}
+        self.category_bitmaps = {key: _bitmap_from_indices(rows, self.size) for key, rows in category_rows.items()}
+        self.hour_bitmaps = [_bitmap_from_indices(rows, self.size) for rows in hour_rows]
+        # 長さが分かっている行を長さ順に並べたもの（長さの配列と、対応する行番号の配列）
+        duration_rows.sort()
+        self.durations = array("d", (duration for duration, _ in duration_rows))
+        self._duration_rows = array("l", (i for _, i in duration_rows))
+        self._init_caches()
+        self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _init_caches(self) -> None:
+        self._bucket_cache: Dict[Tuple[int, int], int] = {}
+        self._time_mask_cache: Dict[Tuple[int, int], int] = {}
+        self._duration_mask_cache: Dict[Tuple[Optional[float], Optional[float]], int] = {}
+
+    @classmethod
+    def from_columns(cls, records: Sequence[CatalogRecord], version: int, columns: Dict) -> "CatalogQueryIndex":
+        """columns() で取り出した列からインデックスを作成（レコードを1件ずつたどらない）
+
+        共有カタログファイルを割り当てたワーカーで使う。配列の列は array の代わりに memoryview でもよい
+        """
+        started = time.perf_counter()
+        index = cls.__new__(cls)
+        index.records = records
+        index.version = version
+        index.revision = 0
+        index.size = len(records)
+        index.timestamps = columns["timestamps"]
+        index.seconds_of_day = columns["seconds_of_day"]
+        index._minute_rows = columns["minute_rows"]
+        index.device_bitmaps = columns["device_bitmaps"]
+        index.category_bitmaps = columns["category_bitmaps"]
+        index.hour_bitmaps = columns["hour_bitmaps"]
+        index.durations = columns["durations"]
+        index._duration_rows = columns["duration_rows"]
+        index._init_caches()
+        index.build_ms = round((time.perf_counter() - started) * 1000, 1)
+        return index
+
+    def with_media(self, replacements: Dict[int, CatalogRecord]) -> "CatalogQueryIndex":
+        """行番号 → MP4ヘッダー情報を反映したレコード で差し替えたインデックス（番号はそのまま、revision を1進める）
+
+        並び順・機器/カテゴリ/時刻の列は変わらないため共有し、レコードの一覧と長さの列だけを作り直す。
+        長さの列は差し替える行の分だけ二分探索で位置を求め、残りは配列の切り出しでそのまま写す
+        """
+        started = time.perf_counter()
+        durations = self.durations
+        duration_rows = self._duration_rows
+        # (位置, 0=挿入/1=削除, 長さ, 行番号)。同じ位置では挿入を先に行う
+        edits = []
+        for i, record in replacements.items():
+            media = self.records[i].media
+            if media is not None and media.duration is not None:
+                position = bisect_left(durations, media.duration)
+                while duration_rows[position] != i:
+                    position += 1
+                edits.append((position, 1, 0.0, i))
+            media = record.media
+            if media is not None and media.duration is not None:
+                position = bisect_left(durations, media.duration)
+                while (position < len(durations) and durations[position] == media.duration
+                       and duration_rows[position] < i):
+                    position += 1
+                edits.append((position, 0, media.duration, i))
+        edits.sort()
+
+        new_durations = array("d")
+        new_rows = array("l")
+        start = 0
+        for position, removal, duration, i in edits:
+            new_durations.extend(durations[start:position])
+            new_rows.extend(duration_rows[start:position])
+            if removal:
+                start = position + 1
+            else:
+                start = position
+                new_durations.append(duration)
+                new_rows.append(i)
+        new_durations.extend(durations[start:])
+        new_rows.extend(duration_rows[start:])
+
+        records = list(self.records)
+        for i, record in replacements.items():
+            records[i] = record
+        index = copy.copy(self)
+        index.records = records
+        index.revision = self.revision + 1
+        index.durations = new_durations
+        index._duration_rows = new_rows
+        # 時間帯のビットマップのキャッシュは変わらない列から作ったものなので引き継ぐ
+        index._duration_mask_cache = {}
+        index.build_ms = round((time.perf_counter() - started) * 1000, 1)
+        return index
+
+    def columns(self) -> Dict:
+        """from_columns に渡せる形の列（共有カタログファイルへの書き出し用）"""
+        return {
+            "timestamps": self.timestamps,
+            "seconds_of_day": self.seconds_of_day,
+            "minute_rows": self._minute_rows,
+            "device_bitmaps": self.device_bitmaps,
+            "category_bitmaps": self.category_bitmaps,
+            "hour_bitmaps": self.hour_bitmaps,
+            "durations": self.durations,
+            "duration_rows": self._duration_rows
+        }
+
+    def _bucket_bitmap(self, width: int, start: int) -> int:
+        """start秒から width秒（600 または 60）の区間に属する行のビットマップ"""
+        key = (width, start)
+        bitmap = self._bucket_cache.get(key)
+        if bitmap is None:
+            first_minute = start // 60
+            rows = [i for minute in range(first_minute, first_minute + width // 60) for i in self._minute_rows[minute]]
+            bitmap = _bitmap_from_indices(rows, self.size)
+            if len(self._bucket_cache) >= _BUCKET_CACHE_SIZE:
+                self._bucket_cache.pop(next(iter(self._bucket_cache)))
+            self._bucket_cache[key] = bitmap
+        return bitmap
+
+    def _time_mask(self, start_seconds: int, end_seconds: int) -> int:
+        """0時からの経過秒数が start_seconds 以上 end_seconds 以下の行のビットマップ"""
+        key = (start_seconds, end_seconds)
+        mask = self._time_mask_cache.get(key)
+        if mask is None:
+            mask = self._build_time_mask(start_seconds, end_seconds)
+            if len(self._time_mask_cache) >= _TIME_MASK_CACHE_SIZE:
+                self._time_mask_cache.pop(next(iter(self._time_mask_cache)))
+            self._time_mask_cache[key] = mask
+        return mask
+
+    def _build_time_mask(self, start_seconds: int, end_seconds: int) -> int:
+        mask = 0
+        second = start_seconds
+        while second <= end_seconds:
+            if second % 3600 == 0 and second + 3599 <= end_seconds:
+                mask |= self.hour_bitmaps[second // 3600]
+                second += 3600
+            elif second % 600 == 0 and second + 599 <= end_seconds:
+                mask |= self._bucket_bitmap(600, second)
+                second += 600
+            elif second % 60 == 0 and second + 59 <= end_seconds:
+                mask |= self._bucket_bitmap(60, second)
+                second += 60
+            else:
+                # 分の途中で区切られる場合はその分に属する行だけを秒単位で判定
+                minute_end = min(second - second % 60 + 59, end_seconds)
+                rows = [i for i in self._minute_rows[second // 60]
+                        if second <= self.seconds_of_day[i] <= minute_end]
+                mask |= _bitmap_from_indices(rows, self.size)
+                second = minute_end + 1
+        return mask
+
+    def _duration_mask(self, min_duration: Optional[float], max_duration: Optional[float]) -> int:
+        """長さ（秒）が min_duration 以上 max_duration 以下の行のビットマップ"""
+        key = (min_duration, max_duration)
+        mask = self._duration_mask_cache.get(key)
+        if mask is None:
+            lo = bisect_left(self.durations, min_duration) if min_duration is not None else 0
+            hi = bisect_right(self.durations, max_duration) if max_duration is not None else len(self.durations)
+            mask = _bitmap_from_indices(self._duration_rows[lo:hi], self.size)
+            if len(self._duration_mask_cache) >= _DURATION_MASK_CACHE_SIZE:
+                self._duration_mask_cache.pop(next(iter(self._duration_mask_cache)))
+            self._duration_mask_cache[key] = mask
+        return mask
+
+    def key_position(self, key: Sequence, after: bool) -> int:
+        """並び順キーの挿入位置を求める
+
+        after=True ならキーより後ろの最初の行、False ならキー以上の最初の行の行番号
+        """
+        timestamp, device, file_path = key
+        key = (timestamp, device, file_path)
+        # 撮影時間で二分探索し、同時刻の行だけを順に比較する
+        position = bisect_left(self.timestamps, timestamp)
+        records = self.records
+        while position < self.size:
+            current = record_key(records[position])
+            if current > key or (not after and current == key):
+                break
+            position += 1
+        return position
+
+    def query(self, devices: Optional[List[str]] = None, categories: Optional[List[str]] = None,
+              start_timestamp: Optional[float] = None, end_timestamp: Optional[float] = None,
+              start_seconds: Optional[int] = None, end_seconds: Optional[int] = None,
+              min_duration: Optional[float] = None, max_duration: Optional[float] = None) -> "QueryResult":
+        """検索条件に一致する行の集合を求める
+
+        start_seconds/end_seconds は0時からの経過秒数による時間帯指定（両端を含む）。
+        min_duration/max_duration は録画の長さ（秒）の範囲（両端を含む）
+        """
+        lo = bisect_left(self.timestamps, start_timestamp) if start_timestamp is not None else 0
+        hi = bisect_right(self.timestamps, end_timestamp) if end_timestamp is not None else self.size
+
+        mask = None
+        if devices:
+            bitmap = 0
+            for device in devices:
+                bitmap |= self.device_bitmaps.get(device, 0)
+            mask = bitmap
+        if categories:
+            bitmap = 0
+            for category in categories:
+                bitmap |= self.category_bitmaps.get(category, 0)
+            mask = bitmap if mask is None else mask & bitmap
+        if start_seconds is not None or end_seconds is not None:
+            bitmap = self._time_mask(start_seconds or 0, 86399 if end_seconds is None else end_seconds)
+            mask = bitmap if mask is None else mask & bitmap
+        if min_duration is not None or max_duration is not None:
+            bitmap = self._duration_mask(min_duration, max_duration)
+            mask = bitmap if mask is None else mask & bitmap
+
+        if mask is not None and (lo > 0 or hi < self.size):
+            mask &= _range_mask(lo, hi)
+        return QueryResult(self, lo, hi, mask)
+
+
+class QueryResult:
+    """検索結果（行番号の集合）。件数の取得とページ単位の取り出しを行う"""
+
+    def __init__(self, index: CatalogQueryIndex, lo: int, hi: int, mask: Optional[int]):
+        self.index = index
+        self.lo = lo
+        self.hi = hi
+        # mask が None の場合は lo〜hi の連続した範囲がそのまま結果
+        self.mask = mask
+        self._total = None
+
+    @property
+    def total(self) -> int:
+        if self._total is None:
+            self._total = max(0, self.hi - self.lo) if self.mask is None else _popcount(self.mask)
+        return self._total
+
+    def row_numbers(self, offset: int = 0, limit: Optional[int] = None, start: int = 0) -> Iterator[int]:
+        """行番号 start 以降の結果のうち offset 件目から最大 limit 件の行番号を昇順で返す（必要な分だけ計算する）"""
+        if limit is not None and limit <= 0:
+            return
+        first = max(self.lo, start)
+        if self.mask is None:
+            stop = self.hi if limit is None else min(self.hi, first + offset + limit)
+            yield from range(first + offset, stop)
+            return
+
+        # 開始行より前のブロックは飛ばしてから、ブロック単位で切り出す
+        first_block = first // _BLOCK_BITS
+        rest = self.mask >> (first_block * _BLOCK_BITS)
+        base = first_block * _BLOCK_BITS
+        # 最初のブロック内の開始行より前のビットを落とす
+        rest &= ~((1 << (first - base)) - 1)
+        remaining = limit
+        while rest:
+            chunk = rest & _BLOCK_MASK
+            rest >>= _BLOCK_BITS
+            block_base = base
+            base += _BLOCK_BITS
+            if not chunk:
+                continue
+            if offset:
+                count = _popcount(chunk)
+                if offset >= count:
+                    # ブロックごと読み飛ばす
+                    offset -= count
+                    continue
+                # ブロック内で offset 件目のビットまで一気に進める
+                chunk &= ~((1 << _select(chunk, offset, _BLOCK_BITS)) - 1)
+                offset = 0
+
+            # 0以外のバイトだけを正規表現（C実装）で探し、バイト内のビット位置は表引きする
+            data = chunk.to_bytes(_BLOCK_BYTES, "little")
+            for match in _NONZERO_BYTE.finditer(data):
+                byte_base = block_base + match.start() * 8
+                for bit in _BYTE_BITS[data[match.start()]]:
+                    yield byte_base + bit
+                    if remaining is not None:
+                        remaining -= 1
+                        if remaining == 0:
+                            return
+
+    def rows_before(self, stop: int, limit: int) -> List[int]:
+        """行番号 stop より前の結果のうち、末尾から最大 limit 件の行番号を昇順で返す"""
+        stop = min(stop, self.hi)
+        if limit <= 0 or stop <= self.lo:
+            return []
+        if self.mask is None:
+            return list(range(max(self.lo, stop - limit), stop))
+
+        rows: List[int] = []
+        first_block = self.lo // _BLOCK_BITS
+        block = (stop - 1) // _BLOCK_BITS
+        while block >= first_block and len(rows) < limit:
+            block_base = block * _BLOCK_BITS
+            chunk = (self.mask >> block_base) & _BLOCK_MASK
+            if stop - block_base < _BLOCK_BITS:
+                chunk &= (1 << (stop - block_base)) - 1
+            # 上位ビットから順に取り出す
+            while chunk and len(rows) < limit:
+                top = chunk.bit_length() - 1
+                rows.append(block_base + top)
+                chunk ^= 1 << top
+            block -= 1
+        rows.reverse()
+        return rows
+
+    def keyset_rows(self, limit: int, after: Optional[Sequence] = None,
+                    before: Optional[Sequence] = None) -> Tuple[List[int], bool, bool]:
+        """並び順キーを基準に1ページ分の行番号を取得
+
+        after を指定するとそのキーより後ろの先頭 limit 件、before を指定するとそのキーより前の末尾 limit 件
+        （どちらもなければ先頭から limit 件）を昇順で返す。戻り値は (行番号, 前にまだあるか, 後ろにまだあるか)
+        """
+        if before is not None:
+            stop = self.index.key_position(before, after=False)
+            rows = self.rows_before(stop, limit + 1)
+            has_prev = len(rows) > limit
+            rows = rows[-limit:] if has_prev else rows
+            has_next = any(True for _ in self.row_numbers(0, 1, start=rows[-1] + 1 if rows else stop))
+            return rows, has_prev, has_next
+
+        start = self.index.key_position(after, after=True) if after is not None else 0
+        rows = list(self.row_numbers(0, limit + 1, start=start))
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = bool(self.rows_before(rows[0] if rows else start, 1))
+        return rows, has_prev, has_next
+
+    def page(self, offset: int, limit: int) -> List[Dict]:
+        """offset 件目から limit 件のレコードを取得"""
+        records = self.index.records
+        return [records[i] for i in self.row_numbers(offset, limit)]
+
+
+def time_bounds(start_time, end_time) -> Tuple[Optional[int], Optional[int]]:
+    """datetime.time の開始・終了時間を0時からの経過秒数に変換"""
+    start_seconds = start_time.hour * 3600 + start_time.minute * 60 + start_time.second if start_time else None
+    end_seconds = end_time.hour * 3600 + end_time.minute * 60 + end_time.second if end_time else None
+    return start_seconds, end_seconds
@@ -0,0 +1,122 @@
+"""
+検索系APIのレスポンスキャッシュ（ETag / 304 と、シリアライズ済みJSONのLRU）
+
+- キーは (カタログ番号, 正規化した検索条件)。カタログが変わるとスキャン側で番号が進むため、
+  番号が進んだ時点で古いエントリはまとめて破棄する
+- ETag は (カタログ番号, 検索条件) から求めるため、キャッシュから追い出されたあとでも 304 を返せる
+- 本文は catalog_age（最終スキャンからの経過秒数）を除いたJSONのバイト列で保持し、返すときに末尾へ付け足す。
+  catalog_age だけが違うレスポンスは同じ内容とみなすため、ETag は弱いもの（W/）にする
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+# キャッシュするレスポンスの件数と合計バイト数の上限
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def dumps(payload: Dict) -> bytes:
+    """レスポンス用のJSON（FastAPI の JSONResponse と同じ形式）"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(epoch: int, version: int, key: Hashable) -> str:
+    """カタログの系列番号・カタログ番号と正規化した検索条件から ETag を作成
+
+    カタログ番号はプロセスごとに1から数えるため、再起動後や別のワーカーの同じ番号と区別できるよう系列番号を含める
+    """
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{epoch:x}.{version:x}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match のいずれかが ETag と一致するか（弱い比較。W/ の有無は無視）"""
+    if not if_none_match:
+        return False
+    target = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == target:
+            return True
+    return False
+
+
+def with_catalog_age(body: bytes, catalog_age: Optional[float]) -> bytes:
+    """catalog_age を除いたJSONの末尾に catalog_age を付け足す"""
+    return body[:-1] + b',"catalog_age":' + dumps(catalog_age) + b"}"
+
+
+class ResponseCache:
+    """(カタログ番号, 検索条件) → catalog_age を除いたJSON本文 のLRU"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._version = 0
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "invalidations": 0}
+
+    def _advance(self, version: int) -> None:
+        # カタログ番号が進んだら古い番号のエントリをまとめて破棄（_lock 取得済みで呼び出す）
+        if version > self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, version: int, key: Hashable) -> Optional[bytes]:
+        """キャッシュ済みの本文（catalog_age を除いたJSON）を取得"""
+        with self._lock:
+            self._advance(version)
+            body = self._entries.get(key) if version == self._version else None
+            if body is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return body
+
+    def put(self, version: int, key: Hashable, body: bytes) -> None:
+        """本文を登録（古いカタログ番号のもの・上限を超える大きさのものは登録しない）"""
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._advance(version)
+            if version != self._version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def record_not_modified(self) -> None:
+        with self._lock:
+            self.stats["not_modified"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "catalog_version": self._version
+            }
@@ -0,0 +1,154 @@
+"""
+スキャンの相乗りとカタログのスナップショット
+
+- 同時に届いたスキャン要求は実行中（または実行待ち）の1回のスキャンに相乗りし、同じ結果を受け取る。
+  フルスキャンの要求はフルスキャンにだけ、差分スキャンの要求はどちらにも相乗りする
+- スキャン結果は CatalogSnapshot（レコード一覧・列指向インデックス・スキャン時刻・統計）として作り、
+  完成したものを1回の代入で差し替える。読み取り側は取り出したスナップショットだけを見るため、
+  スキャン中でも一貫した内容を読める（公開後のスナップショットとレコードは書き換えない）
+- スキャンはジョブ番号付きで実行し、完了を待たずに返した呼び出し元は番号で状態を確認できる
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# 状態を確認できるように保持しておく完了済みジョブの数
+JOB_HISTORY = 50
+
+
+class CatalogSnapshot:
+    """公開済みのカタログ（構築後は読み取り専用）"""
+
+    __slots__ = ("query_index", "scan_time", "scan_stats")
+
+    def __init__(self, query_index, scan_time: Optional[datetime], scan_stats: Dict):
+        self.query_index = query_index
+        self.scan_time = scan_time
+        self.scan_stats = scan_stats
+
+    @property
+    def records(self) -> List:
+        return self.query_index.records
+
+    @property
+    def version(self) -> int:
+        return self.query_index.version
+
+
+class ScanJob:
+    """1回分のスキャン（相乗りした呼び出し元で共有する）"""
+
+    def __init__(self, job_id: str, incremental: bool):
+        self.id = job_id
+        self.incremental = incremental
+        self.requested_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 相乗りした呼び出し元の数（最初の1件を含む）
+        self.callers = 1
+        self.future: Future = Future()
+
+    @property
+    def state(self) -> str:
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        return "running" if self.started_at is not None else "queued"
+
+    def wait(self, timeout: Optional[float] = None):
+        """完了を待って結果を返す（スキャンが失敗した場合は例外を送出）"""
+        return self.future.result(timeout)
+
+    def to_dict(self, describe: Optional[Callable[[object], Dict]] = None) -> Dict:
+        info = {
+            "job_id": self.id,
+            "mode": "incremental" if self.incremental else "full",
+            "state": self.state,
+            "callers": self.callers,
+            "requested_at": datetime.fromtimestamp(self.requested_at).isoformat(timespec="seconds"),
+            "duration_ms": round((self.finished_at - self.started_at) * 1000, 1)
+            if self.finished_at is not None and self.started_at is not None else None,
+        }
+        if self.future.done():
+            error = self.future.exception()
+            if error is not None:
+                info["error"] = str(error)
+            elif describe is not None:
+                info.update(describe(self.future.result()))
+        return info
+
+
+class ScanCoordinator:
+    """スキャン要求を実行中・実行待ちのスキャンにまとめる
+
+    run_scan(incremental) は別スレッドで呼び出す。同じスキャンの並行実行を防ぐロックは run_scan 側で取る
+    """
+
+    def __init__(self, run_scan: Callable[[bool], object], history: int = JOB_HISTORY):
+        self._run_scan = run_scan
+        self.history = history
+        self._lock = threading.Lock()
+        # 差分スキャンか → 未完了のジョブ
+        self._pending: Dict[bool, ScanJob] = {}
+        self._jobs: "OrderedDict[str, ScanJob]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self.stats = {"requested": 0, "started": 0, "joined": 0, "failed": 0}
+
+    def request(self, incremental: bool) -> ScanJob:
+        """スキャンを要求（相乗りできる未完了のスキャンがあればそのジョブを返す）"""
+        with self._lock:
+            self.stats["requested"] += 1
+            job = self._pending.get(False)
+            if job is None and incremental:
+                job = self._pending.get(True)
+            if job is not None:
+                job.callers += 1
+                self.stats["joined"] += 1
+                return job
+            job = ScanJob(f"scan-{next(self._ids)}", incremental)
+            self._pending[incremental] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.future.done():
+                    break
+                self._jobs.popitem(last=False)
+            self.stats["started"] += 1
+        threading.Thread(target=self._execute, args=(job,), name=f"nas-{job.id}", daemon=True).start()
+        return job
+
+    def run(self, incremental: bool):
+        """スキャンを要求して完了を待つ"""
+        return self.request(incremental).wait()
+
+    def _execute(self, job: ScanJob) -> None:
+        job.started_at = time.time()
+        try:
+            result = self._run_scan(job.incremental)
+        except BaseException as e:
+            error = e
+        else:
+            error = None
+        job.finished_at = time.time()
+        with self._lock:
+            # 完了したジョブには以降の要求を相乗りさせない（結果を設定する前に外す）
+            if self._pending.get(job.incremental) is job:
+                del self._pending[job.incremental]
+            if error is not None:
+                self.stats["failed"] += 1
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "pending": [job.id for job in self._pending.values()]}
@@ -0,0 +1,450 @@
+"""
+複数ワーカーで共有するカタログファイル（メモリマップ）
+
+uvicorn を複数ワーカーで動かす場合に、NASのスキャンは1プロセス（スキャン担当）だけが行い、
+他のワーカーはスキャン担当が書き出したカタログファイルを読み取り専用でメモリマップして使う。
+ファイルのページはOSのページキャッシュを全ワーカーで共有するため、ワーカーを増やしてもNASへの負荷と
+カタログのメモリは増えない。
+
+- ファイルはレコードの列（撮影時間・サイズ・機器/カテゴリ番号・MP4ヘッダー情報・パスの連結バイト列）と、
+  列指向インデックスの列（0時からの経過秒数・分ごとの行番号・長さ順の行番号・機器/カテゴリ/時刻のビットマップ）からなる。
+  読み取り側は配列を memoryview としてそのまま参照し、レコードは応答に必要な分だけその場で作る
+- カタログ番号ごとに別のファイル（catalog-<番号>.snap）へ書き、書き終えてから名前を付ける。読み取り側は
+  番号が最も大きいファイルを割り当てる。公開したファイルは書き換えない（差分のないスキャンでスキャン時刻だけを上書きする）。
+  書き込み中のファイルを他のプロセスが割り当てていても差し替えられるため、Windows でも使える
+- 古いファイルは新しいものを retention 件残して削除する（割り当て中で削除できない場合は次回に再試行）
+- スキャン担当はディレクトリ内のロックファイルの排他ロックで決める。スキャン担当のプロセスが終了すると
+  ロックが外れ、他のワーカーが引き継ぐ
+- スキャン担当でないワーカーが受けた再スキャン要求は、ディレクトリに要求ファイルを置いてスキャン担当に渡す
+"""
+
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from catalog_record import CatalogRecord
+from media_info import MediaInfo
+from query_engine import CatalogQueryIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NASCAT02"
+# マジック, カタログ番号, スキャン時刻（UNIX時刻、未スキャンは0）, メタ情報の位置, メタ情報の長さ, カタログ番号の系列
+_HEADER = struct.Struct("<8sQdQQQ")
+_SCAN_TIME_OFFSET = 16
+
+_SNAPSHOT_NAME = re.compile(r"^catalog-(\d+)\.snap$")
+_LOCK_NAME = "catalog.lock"
+_REFRESH_PREFIX = "refresh-"
+
+# コーデック番号の「なし」
+_NO_CODEC = 0
+
+
+def _snapshot_name(version: int) -> str:
+    return f"catalog-{version:012d}.snap"
+
+
+def _try_lock(f) -> bool:
+    """ファイルの排他ロックを待たずに取得（取得できなければ False）"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class _SectionWriter:
+    """配列・バイト列を8バイト境界に揃えて書き、(位置, バイト数, 型コード) を返す"""
+
+    def __init__(self, f, offset: int):
+        self.f = f
+        self.offset = offset
+
+    def add(self, data, typecode: str = "B") -> List:
+        padding = -self.offset % 8
+        if padding:
+            self.f.write(b"\0" * padding)
+            self.offset += padding
+        view = memoryview(data).cast("B")
+        self.f.write(view)
+        entry = [self.offset, view.nbytes, typecode]
+        self.offset += view.nbytes
+        return entry
+
+
+def write_snapshot(path: str, query_index: CatalogQueryIndex, base_path: str, scan_time: Optional[datetime],
+                   scan_stats: Dict, stats_state: Dict, epoch: int = 0) -> int:
+    """カタログ（レコードと列指向インデックス）をファイルに書き出す（書き出したバイト数を返す）"""
+    records = query_index.records
+    columns = query_index.columns()
+    size = len(records)
+
+    # 機器名・カテゴリは番号で持つ（名前の一覧は列指向インデックスのビットマップのキーと同じ）
+    devices = {name: i for i, name in enumerate(columns["device_bitmaps"])}
+    categories = {name: i for i, name in enumerate(columns["category_bitmaps"])}
+    device_ids = array("H", [devices[record.device] for record in records])
+    category_ids = array("H", [categories[record.category] for record in records])
+    txt = bytes([record.txt for record in records])
+    sizes = array("q", [record.size for record in records])
+
+    # MP4ヘッダー情報（値がないものは長さ NaN・幅/高さ 0・コーデック番号 0）
+    medias = [record.media for record in records]
+    codecs: Dict[str, int] = {}
+    has_media = bytes([media is not None for media in medias])
+    media_durations = array("d", [media.duration if media is not None and media.duration is not None else math.nan
+                                  for media in medias])
+    media_widths = array("I", [(media.width or 0) if media is not None else 0 for media in medias])
+    media_heights = array("I", [(media.height or 0) if media is not None else 0 for media in medias])
+    media_codecs = array("H", [codecs.setdefault(media.codec, len(codecs) + 1)
+                               if media is not None and media.codec else _NO_CODEC for media in medias])
+
+    encoded_paths = [record.file_path.encode("utf-8") for record in records]
+    path_offsets = array("q", [0])
+    path_offsets.extend(itertools.accumulate(map(len, encoded_paths)))
+    # パスで探すための行番号の並び（UTF-8のバイト列順）
+    path_order = array("i", sorted(range(size), key=encoded_paths.__getitem__))
+
+    minute_rows = array("i")
+    minute_offsets = array("q", [0])
+    for rows in columns["minute_rows"]:
+        minute_rows.extend(array("i", rows))
+        minute_offsets.append(len(minute_rows))
+
+    bitmap_bytes = (size + 7) // 8
+    with open(path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        writer = _SectionWriter(f, _HEADER.size)
+        sections = {
+            "timestamps": writer.add(array("d", columns["timestamps"]), "d"),
+            "seconds_of_day": writer.add(array("i", columns["seconds_of_day"]), "i"),
+            "minute_rows": writer.add(minute_rows, "i"),
+            "minute_offsets": writer.add(minute_offsets, "q"),
+            "durations": writer.add(array("d", columns["durations"]), "d"),
+            "duration_rows": writer.add(array("i", columns["duration_rows"]), "i"),
+            "device_ids": writer.add(device_ids, "H"),
+            "category_ids": writer.add(category_ids, "H"),
+            "txt": writer.add(txt),
+            "sizes": writer.add(sizes, "q"),
+            "has_media": writer.add(has_media),
+            "media_durations": writer.add(media_durations, "d"),
+            "media_widths": writer.add(media_widths, "I"),
+            "media_heights": writer.add(media_heights, "I"),
+            "media_codecs": writer.add(media_codecs, "H"),
+            "path_offsets": writer.add(path_offsets, "q"),
+            "paths": writer.add(b"".join(encoded_paths)),
+            "path_order": writer.add(path_order, "i"),
+        }
+        bitmaps = {
+            "device": {key: writer.add(value.to_bytes(bitmap_bytes, "little"))
+                       for key, value in columns["device_bitmaps"].items()},
+            "category": {key: writer.add(value.to_bytes(bitmap_bytes, "little"))
+                         for key, value in columns["category_bitmaps"].items()},
+            "hour": [writer.add(value.to_bytes(bitmap_bytes, "little")) for value in columns["hour_bitmaps"]],
+        }
+        meta = json.dumps({
+            "size": size,
+            "base_path": base_path,
+            "devices": list(devices),
+            "categories": list(categories),
+            "codecs": list(codecs),
+            "sections": sections,
+            "bitmaps": bitmaps,
+            "scan_stats": scan_stats,
+            "stats_state": stats_state,
+        }, ensure_ascii=False).encode("utf-8")
+        meta_entry = writer.add(meta)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, query_index.version, scan_time.timestamp() if scan_time else 0.0,
+                             meta_entry[0], meta_entry[1], epoch))
+        return writer.offset
+
+
+class MappedCatalog:
+    """読み取り専用で割り当てたカタログファイル"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"カタログファイルの形式が違います: {path}")
+        _, self.version, _, meta_offset, meta_length, self.epoch = _HEADER.unpack_from(self._mmap, 0)
+        self._view = memoryview(self._mmap)
+        meta = json.loads(bytes(self._view[meta_offset:meta_offset + meta_length]).decode("utf-8"))
+        self.size = meta["size"]
+        self.base_path = meta["base_path"]
+        self.scan_stats = meta["scan_stats"]
+        self.stats_state = meta["stats_state"]
+        self._meta = meta
+        self.records = MappedRecords(self)
+
+    @property
+    def scan_time(self) -> Optional[datetime]:
+        """スキャン時刻（スキャン担当が上書きするため、参照するたびにファイルから読む）"""
+        timestamp = struct.unpack_from("<d", self._mmap, _SCAN_TIME_OFFSET)[0]
+        return datetime.fromtimestamp(timestamp) if timestamp else None
+
+    def column(self, name: str) -> memoryview:
+        offset, length, typecode = self._meta["sections"][name]
+        return self._view[offset:offset + length].cast(typecode)
+
+    def _bitmap(self, entry: List) -> int:
+        offset, length, _ = entry
+        return int.from_bytes(self._view[offset:offset + length], "little")
+
+    def query_index(self) -> CatalogQueryIndex:
+        """ファイルの列をそのまま参照する列指向インデックス（ビットマップだけは int に読み込む）"""
+        minute_rows = self.column("minute_rows")
+        minute_offsets = self.column("minute_offsets")
+        bitmaps = self._meta["bitmaps"]
+        return CatalogQueryIndex.from_columns(self.records, self.version, {
+            "timestamps": self.column("timestamps"),
+            "seconds_of_day": self.column("seconds_of_day"),
+            "minute_rows": [minute_rows[minute_offsets[m]:minute_offsets[m + 1]] for m in range(1440)],
+            "device_bitmaps": {key: self._bitmap(entry) for key, entry in bitmaps["device"].items()},
+            "category_bitmaps": {key: self._bitmap(entry) for key, entry in bitmaps["category"].items()},
+            "hour_bitmaps": [self._bitmap(entry) for entry in bitmaps["hour"]],
+            "durations": self.column("durations"),
+            "duration_rows": self.column("duration_rows"),
+        })
+
+
+class MappedRecords:
+    """カタログファイルのレコード列（添字で参照したときに CatalogRecord を作る）"""
+
+    def __init__(self, catalog: MappedCatalog):
+        meta = catalog._meta
+        self._size = catalog.size
+        self._devices = meta["devices"]
+        self._categories = meta["categories"]
+        self._codecs = [None] + meta["codecs"]
+        self._timestamps = catalog.column("timestamps")
+        self._device_ids = catalog.column("device_ids")
+        self._category_ids = catalog.column("category_ids")
+        self._txt = catalog.column("txt")
+        self._sizes = catalog.column("sizes")
+        self._has_media = catalog.column("has_media")
+        self._media_durations = catalog.column("media_durations")
+        self._media_widths = catalog.column("media_widths")
+        self._media_heights = catalog.column("media_heights")
+        self._media_codecs = catalog.column("media_codecs")
+        self._path_offsets = catalog.column("path_offsets")
+        self._paths = catalog.column("paths")
+        self._path_order = catalog.column("path_order")
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _path(self, i: int) -> bytes:
+        return bytes(self._paths[self._path_offsets[i]:self._path_offsets[i + 1]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("カタログの範囲外です")
+        media = None
+        if self._has_media[i]:
+            duration = self._media_durations[i]
+            media = MediaInfo(None if math.isnan(duration) else duration, self._media_widths[i] or None,
+                              self._media_heights[i] or None, self._codecs[self._media_codecs[i]])
+        return CatalogRecord(self._devices[self._device_ids[i]], self._categories[self._category_ids[i]],
+                             self._path(i).decode("utf-8"), self._timestamps[i], self._txt[i],
+                             self._sizes[i], media)
+
+    def __iter__(self) -> Iterator[CatalogRecord]:
+        for i in range(self._size):
+            yield self[i]
+
+    def find(self, file_path: str) -> Optional[CatalogRecord]:
+        """相対パスでレコードを探す（パス順の行番号を二分探索）"""
+        target = file_path.encode("utf-8")
+        order = self._path_order
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._path(order[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._size and self._path(order[lo]) == target:
+            return self[order[lo]]
+        return None
+
+
+class SharedCatalog:
+    """共有カタログのディレクトリ（ファイルの書き出し・割り当て、スキャン担当の決定、再スキャン要求の受け渡し）
+
+    role が "reader" のプロセスはスキャン担当にならない（スキャン担当を別プロセスで動かす場合）
+    """
+
+    def __init__(self, directory: str, base_path: str, role: str = "auto", retention: int = 4):
+        self.directory = directory
+        self.base_path = base_path
+        self.role = role
+        self.retention = max(1, retention)
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = None
+        # 割り当て中の最新のカタログ（読み取り側）
+        self.current: Optional[MappedCatalog] = None
+        self._written_path: Optional[str] = None
+        self._mismatch_logged = set()
+        self.counters = {"writes": 0, "write_ms": 0.0, "bytes": 0, "touches": 0, "maps": 0,
+                         "refresh_requests": 0, "cleanup_errors": 0}
+
+    @property
+    def is_scanner(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire(self) -> bool:
+        """スキャン担当のロックを取得（取得済みなら True。他のプロセスが持っていれば False）"""
+        if self._lock_file is not None:
+            return True
+        if self.role == "reader":
+            return False
+        f = open(os.path.join(self.directory, _LOCK_NAME), "a+b")
+        if not _try_lock(f):
+            f.close()
+            return False
+        self._lock_file = f
+        logger.info(f"共有カタログのスキャン担当になりました: {self.directory} (pid={os.getpid()})")
+        return True
+
+    def _snapshots(self) -> List[Tuple[int, str]]:
+        """ディレクトリ内のカタログファイルの (番号, パス) を番号順に返す"""
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = _SNAPSHOT_NAME.match(entry.name)
+                if match:
+                    found.append((int(match.group(1)), entry.path))
+        found.sort()
+        return found
+
+    def latest_version(self) -> int:
+        snapshots = self._snapshots()
+        return snapshots[-1][0] if snapshots else 0
+
+    def open_latest(self, newer_than: int = -1) -> Optional[MappedCatalog]:
+        """newer_than より新しい番号のカタログファイルがあれば割り当てて返す（NASパスが違うものは使わない）"""
+        snapshots = self._snapshots()
+        if not snapshots or snapshots[-1][0] <= newer_than:
+            return None
+        version, path = snapshots[-1]
+        try:
+            mapped = MappedCatalog(path)
+        except FileNotFoundError:
+            # 割り当てる前に削除された（次の確認で新しいファイルを割り当てる）
+            return None
+        except ValueError as e:
+            # 以前の形式のファイルなど。スキャン担当が次に書き出すファイルを使う
+            if path not in self._mismatch_logged:
+                self._mismatch_logged.add(path)
+                logger.warning(str(e))
+            return None
+        if mapped.base_path != self.base_path:
+            if path not in self._mismatch_logged:
+                self._mismatch_logged.add(path)
+                logger.warning(f"NASパスが違うため共有カタログを使いません: {path} ({mapped.base_path})")
+            return None
+        self.current = mapped
+        self.counters["maps"] += 1
+        return mapped
+
+    def write(self, query_index: CatalogQueryIndex, scan_time: Optional[datetime], scan_stats: Dict,
+              stats_state: Dict, epoch: int = 0) -> int:
+        """カタログを新しい番号のファイルとして書き出し、古いファイルを削除（書き出したバイト数を返す）"""
+        started = time.perf_counter()
+        path = os.path.join(self.directory, _snapshot_name(query_index.version))
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            written = write_snapshot(temp_path, query_index, self.base_path, scan_time, scan_stats, stats_state, epoch)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._written_path = path
+        self.counters["writes"] += 1
+        self.counters["bytes"] = written
+        self.counters["write_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self._remove_old(query_index.version)
+        return written
+
+    def touch(self, scan_time: datetime) -> None:
+        """最新のカタログファイルのスキャン時刻だけを書き換える（差分がなかったスキャン）"""
+        if self._written_path is None:
+            return
+        with open(self._written_path, "r+b") as f:
+            f.seek(_SCAN_TIME_OFFSET)
+            f.write(struct.pack("<d", scan_time.timestamp()))
+        self.counters["touches"] += 1
+
+    def _remove_old(self, version: int) -> None:
+        for old_version, path in self._snapshots():
+            if old_version > version - self.retention:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # 他のプロセスが割り当て中（Windows）。次の書き出しで再試行する
+                self.counters["cleanup_errors"] += 1
+
+    def request_refresh(self, full: bool) -> None:
+        """スキャン担当に再スキャンを依頼する要求ファイルを置く"""
+        name = f"{_REFRESH_PREFIX}{'full' if full else 'incremental'}-{os.getpid()}-{time.time_ns()}.req"
+        with open(os.path.join(self.directory, name), "x"):
+            pass
+        self.counters["refresh_requests"] += 1
+
+    def take_refresh_request(self) -> Optional[bool]:
+        """届いている再スキャン要求を取り出す（なければ None、フルスキャンの要求が1件でもあれば True）"""
+        full = None
+        with os.scandir(self.directory) as entries:
+            requests = [entry for entry in entries
+                        if entry.name.startswith(_REFRESH_PREFIX) and entry.name.endswith(".req")]
+        for entry in requests:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            full = bool(full) or entry.name.startswith(f"{_REFRESH_PREFIX}full-")
+        return full
+
+    def get_stats(self) -> Dict:
+        current = self.current
+        return {
+            **self.counters,
+            "directory": self.directory,
+            "role": "scanner" if self.is_scanner else "reader",
+            "pid": os.getpid(),
+            "mapped_version": current.version if current is not None else None,
+            "files": [os.path.basename(path) for _, path in self._snapshots()]
+        }
@@ -1,27 +1,44 @@
 /**
  * エクスポート機能管理ファイル
- * データのCSVエクスポート、ファイルダウンロード機能を管理
- * テーブルデータの変換とファイル生成処理を含む
+ * データのCSV/NDJSONエクスポート、ファイルダウンロード機能を管理
+ * 絞り込み条件に一致する全件をサーバー側（/api/export・/api/zip）でストリーミング出力する
  */
 
-// ==================== エクスポート機能（将来の拡張用） ====================
-function exportToCSV() {
-    const table = document.querySelector('.data-table');
-    if (!table) return;
+// ==================== エクスポート機能 ====================
+function buildExportParams(filters = {}) {
+    // /api/search と同じ検索条件をそのまま渡す（表示中のページに限らず全件が対象）
+    const params = new URLSearchParams();
+    if (filters.startDate) params.append('start_date', filters.startDate);
+    if (filters.endDate) params.append('end_date', filters.endDate);
+    if (filters.startTime) params.append('start_time', filters.startTime);
+    if (filters.endTime) params.append('end_time', filters.endTime);
+    if (filters.minDuration) params.append('min_duration', filters.minDuration);
+    if (filters.maxDuration) params.append('max_duration', filters.maxDuration);
+    if (filters.categories && filters.categories.length > 0) params.append('category', filters.categories.join(','));
+    if (filters.devices && filters.devices.length > 0) params.append('device', filters.devices.join(','));
+    return params;
+}
 
-    const rows = Array.from(table.querySelectorAll('tr'));
-    const csvContent = rows.map(row => {
-        const cells = Array.from(row.querySelectorAll('th, td'));
-        return cells.map(cell => `"${cell.textContent.trim()}"`).join(',');
-    }).join('\n');
-
-    const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
+function startDownload(url, filename) {
+    // ブラウザのダウンロードとして受け取るため、レスポンスをメモリに溜めずにリンクで開く
     const link = document.createElement('a');
-    const url = URL.createObjectURL(blob);
     link.setAttribute('href', url);
-    link.setAttribute('download', `nas_data_${new Date().toISOString().split('T')[0]}.csv`);
+    link.setAttribute('download', filename);
     link.style.visibility = 'hidden';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
-}
\ No newline at end of file
+}
+
+function exportToCSV(filters = {}, format = 'csv') {
+    const params = buildExportParams(filters);
+    params.append('format', format);
+    startDownload(`/api/export?${params.toString()}`, `nas_data_${new Date().toISOString().split('T')[0]}.${format}`);
+}
+
+// ==================== ZIP一括ダウンロード ====================
+function downloadZip(filters = {}) {
+    // 検索条件に一致する動画と manifest.csv を1つのZIPとして受け取る（サーバー側で作りながら送る）
+    const params = buildExportParams(filters);
+    startDownload(`/api/zip?${params.toString()}`, `nas_videos_${new Date().toISOString().split('T')[0]}.zip`);
+}
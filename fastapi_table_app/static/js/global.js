@@ -33,4 +33,5 @@ window.closeModal = closeModal;
 window.playVideo = playVideo;
 window.closeVideoModal = closeVideoModal;
 window.applyFilters = applyFilters;
-window.exportToCSV = exportToCSV;
\ No newline at end of file
+window.exportToCSV = exportToCSV;
+window.downloadZip = downloadZip;
\ No newline at end of file
@@ -0,0 +1,178 @@
+/**
+ * 仮想スクロールテーブル管理ファイル
+ * 検索結果を /api/search からブロック単位（blockSize 件）で必要な分だけ取得し、
+ * スクロール位置に見えている行（＋前後の余白分）だけをDOMに描画する
+ * 件数が増えても描画する行数は一定のため、初期表示とスクロールの重さは変わらない
+ */
+
+class VirtualTable {
+    constructor(options) {
+        this.scroller = options.scroller;          // スクロールするコンテナ
+        this.tbody = options.tbody;
+        this.rowHeight = options.rowHeight;        // 1行の高さ（px、全行で固定）
+        this.columnCount = options.columnCount;
+        this.renderRow = options.renderRow;        // (item, index) => 行内の <td> のHTML
+        this.rowAttributes = options.rowAttributes || (() => ({}));
+        this.onRangeChange = options.onRangeChange || (() => {});
+        this.onError = options.onError || (() => {});
+        this.blockSize = options.blockSize || 100;
+        this.overscan = options.overscan || 10;    // 画面外に余分に描画する行数
+
+        this.params = {};
+        this.total = 0;
+        this.catalogVersion = null;
+        this.blocks = new Map();                   // ブロック番号 → レコード配列
+        this.pending = new Map();                  // ブロック番号 → 取得中のPromise
+        this.generation = 0;                       // 条件変更前の古いレスポンスを捨てるための番号
+        this.renderQueued = false;
+        this.lastRange = null;
+
+        this.scroller.addEventListener('scroll', () => this.scheduleRender(), { passive: true });
+        window.addEventListener('resize', () => this.scheduleRender());
+    }
+
+    // 検索条件を切り替え、先頭ブロックを取得して件数を確定する
+    async reset(params) {
+        this.clear(params);
+        await this.loadBlock(0, this.generation);
+        this.render();
+        return this.total;
+    }
+
+    // サーバーで描画済みの先頭ブロックから表示を始める（初期表示で追加のリクエストを出さない）
+    seed(params, total, catalogVersion, items) {
+        this.clear(params);
+        this.total = total;
+        this.catalogVersion = catalogVersion;
+        this.blocks.set(0, items);
+        this.render();
+    }
+
+    // 検索条件とスクロール位置はそのままで取り直す（カタログが更新されたとき）
+    async refresh() {
+        this.generation += 1;
+        this.blocks.clear();
+        this.pending.clear();
+        this.lastRange = null;
+        const first = Math.floor(this.scroller.scrollTop / this.rowHeight);
+        await this.loadBlock(Math.floor(first / this.blockSize), this.generation);
+        this.render();
+        return this.total;
+    }
+
+    clear(params) {
+        this.generation += 1;
+        this.params = { ...params };
+        this.total = 0;
+        this.catalogVersion = null;
+        this.blocks.clear();
+        this.pending.clear();
+        this.lastRange = null;
+        this.scroller.scrollTop = 0;
+    }
+
+    // 表示中の行番号（0始まり）のレコードを取得（未取得なら null）
+    getItem(index) {
+        const block = this.blocks.get(Math.floor(index / this.blockSize));
+        return block ? block[index % this.blockSize] || null : null;
+    }
+
+    loadBlock(blockIndex, generation) {
+        if (this.blocks.has(blockIndex)) return Promise.resolve();
+        if (this.pending.has(blockIndex)) return this.pending.get(blockIndex);
+
+        const params = new URLSearchParams(this.params);
+        params.set('page', blockIndex + 1);
+        params.set('per_page', this.blockSize);
+        const promise = fetch(`/api/search?${params.toString()}`)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                if (generation !== this.generation) return;
+                // 取得中に再スキャンでカタログが変わった場合は取得済みのブロックを捨てて取り直す
+                if (this.catalogVersion !== null && data.catalog_version !== this.catalogVersion) {
+                    this.blocks.clear();
+                    this.pending.clear();
+                }
+                this.catalogVersion = data.catalog_version;
+                this.total = data.total || 0;
+                this.blocks.set(blockIndex, data.results);
+            })
+            .catch(error => {
+                if (generation === this.generation) this.onError(error);
+            })
+            .finally(() => {
+                if (this.pending.get(blockIndex) === promise) this.pending.delete(blockIndex);
+            });
+        this.pending.set(blockIndex, promise);
+        return promise;
+    }
+
+    scheduleRender() {
+        if (this.renderQueued) return;
+        this.renderQueued = true;
+        requestAnimationFrame(() => {
+            this.renderQueued = false;
+            this.render();
+        });
+    }
+
+    render() {
+        const visibleRows = Math.ceil(this.scroller.clientHeight / this.rowHeight) || 1;
+        const first = Math.max(0, Math.floor(this.scroller.scrollTop / this.rowHeight) - this.overscan);
+        const last = Math.min(this.total, first + visibleRows + this.overscan * 2);
+
+        // 表示範囲のうち未取得のブロックを取得し、届いたら描き直す
+        const generation = this.generation;
+        for (let block = Math.floor(first / this.blockSize); block * this.blockSize < last; block++) {
+            if (!this.blocks.has(block) && !this.pending.has(block)) {
+                this.loadBlock(block, generation).then(() => {
+                    if (generation === this.generation) {
+                        this.lastRange = null;
+                        this.scheduleRender();
+                    }
+                });
+            }
+        }
+
+        const rangeKey = `${first}:${last}:${this.total}`;
+        if (rangeKey === this.lastRange) return;
+        this.lastRange = rangeKey;
+
+        const html = [this.spacerHtml(first * this.rowHeight)];
+        for (let i = first; i < last; i++) {
+            const item = this.getItem(i);
+            if (item) {
+                const attributes = Object.entries({ 'data-index': i, ...this.rowAttributes(item, i) })
+                    .map(([name, value]) => `${name}="${escapeHtml(value)}"`)
+                    .join(' ');
+                html.push(`<tr class="virtual-row" ${attributes}>${this.renderRow(item, i)}</tr>`);
+            } else {
+                html.push(`<tr class="virtual-row loading-row"><td colspan="${this.columnCount}">読み込み中...</td></tr>`);
+            }
+        }
+        html.push(this.spacerHtml((this.total - last) * this.rowHeight));
+        this.tbody.innerHTML = html.join('');
+
+        const visibleFirst = Math.min(this.total, Math.floor(this.scroller.scrollTop / this.rowHeight) + 1);
+        const visibleLast = Math.min(this.total, visibleFirst + visibleRows - 1);
+        this.onRangeChange(visibleFirst, visibleLast, this.total);
+    }
+
+    spacerHtml(height) {
+        if (height <= 0) return '';
+        return `<tr class="virtual-spacer" aria-hidden="true"><td colspan="${this.columnCount}" style="height:${height}px"></td></tr>`;
+    }
+}
+
+// innerHTML に埋め込む文字列のエスケープ
+function escapeHtml(value) {
+    return String(value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
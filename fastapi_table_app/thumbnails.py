@@ -0,0 +1,252 @@
+"""
+サムネイル（ポスター画像・スクラブ用スプライト）の生成とディスクキャッシュ
+
+ローカルの ffmpeg で録画からJPEGを切り出し、キャッシュディレクトリに保存する。
+生成はワーカースレッドのプールで行い、画面からの要求を新着ファイルの先行生成より優先する。
+
+- poster: 動画の先頭付近の1フレーム（幅 POSTER_WIDTH）
+- sprite: 動画全体から等間隔に SPRITE_FRAMES 枚を切り出して横に並べた画像（マウスオーバーでのスクラブ用）
+
+キャッシュのファイル名は 相対パス + サイズ + mtime + 種類 のハッシュで、NAS側のファイルが
+変わると別のファイル名になる（古い画像は使われない）。
+"""
+
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+POSTER_WIDTH = 320
+SPRITE_FRAMES = 10
+SPRITE_FRAME_WIDTH = 160
+KINDS = ("poster", "sprite")
+
+# 画面からの要求と先行生成の優先度（小さいほど先に処理）
+PRIORITY_REQUEST = 0
+PRIORITY_PREFETCH = 1
+
+# 生成に失敗したファイルを再試行しない秒数
+FAILURE_RETRY_SECONDS = 600
+# 覚えておく失敗の件数の上限（超えたら古いものから忘れる）
+FAILURE_MAX_ENTRIES = 10000
+
+# 生成に使うパラメータを変えたときに古いキャッシュを使わないためのバージョン
+THUMBNAIL_VERSION = "1"
+
+
+def find_ffmpeg(command: str = "ffmpeg") -> Tuple[Optional[str], Optional[str]]:
+    """ffmpeg と ffprobe の実行ファイルを探す（見つからなければ None）"""
+    ffmpeg = shutil.which(command)
+    if ffmpeg is None:
+        return None, None
+    ffprobe = shutil.which(os.path.join(os.path.dirname(ffmpeg), "ffprobe")) or shutil.which("ffprobe")
+    return ffmpeg, ffprobe
+
+
+class ThumbnailService:
+    """ffmpeg によるサムネイル生成ワーカープールとディスクキャッシュ"""
+
+    def __init__(self, cache_dir: str, ffmpeg_path: str, ffprobe_path: Optional[str] = None,
+                 workers: int = 2, timeout: float = 30.0, prefetch_queue_size: int = 1000):
+        self.cache_dir = cache_dir
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.timeout = timeout
+        self.prefetch_queue_size = prefetch_queue_size
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # 生成中のキー → Future（同じ画像の生成を重複させない）
+        self._pending: Dict[str, Future] = {}
+        # 生成に失敗したキー → 失敗した時刻（古い順。再試行を控える間だけ覚えておく）
+        self._failures: Dict[str, float] = {}
+        self._queued_prefetch = 0
+        self.counters = {"generated": 0, "failed": 0, "prefetch_queued": 0, "prefetch_skipped": 0, "generate_ms": 0.0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._workers = []
+        for i in range(max(1, workers)):
+            worker = threading.Thread(target=self._worker, name=f"thumbnail-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"サムネイル生成を開始: ffmpeg={ffmpeg_path}, ffprobe={ffprobe_path}, キャッシュ={cache_dir}, workers={workers}")
+
+    @staticmethod
+    def cache_key(relative_path: str, stat: os.stat_result, kind: str) -> str:
+        raw = f"{THUMBNAIL_VERSION}\0{kind}\0{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def cache_path(self, key: str) -> str:
+        # 1ディレクトリのファイル数が増えすぎないよう先頭2文字で振り分ける
+        return os.path.join(self.cache_dir, key[:2], key + ".jpg")
+
+    def lookup(self, relative_path: str, stat: os.stat_result, kind: str) -> Optional[str]:
+        """生成済みの画像があればそのパスを返す"""
+        path = self.cache_path(self.cache_key(relative_path, stat, kind))
+        return path if os.path.exists(path) else None
+
+    def submit(self, relative_path: str, source_path: str, stat: os.stat_result, kind: str,
+               priority: int = PRIORITY_REQUEST) -> Future:
+        """画像の生成を依頼し、完了時に画像のパス（失敗時は例外）を返す Future を返す"""
+        key = self.cache_key(relative_path, stat, kind)
+        path = self.cache_path(key)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            if self._recently_failed(key):
+                future.set_exception(RuntimeError("前回の生成に失敗したため再試行を控えています"))
+                return future
+            if os.path.exists(path):
+                future.set_result(path)
+                return future
+            self._pending[key] = future
+        self._queue.put((priority, next(self._sequence), self._run_job, (key, source_path, kind, path)))
+        return future
+
+    def prefetch(self, items: Iterable[Tuple[str, str]]) -> int:
+        """新着ファイルのポスター画像・スプライトを先行生成（(相対パス, フルパス) の一覧、登録件数を返す）"""
+        count = 0
+        for relative_path, source_path in items:
+            with self._lock:
+                if self._queued_prefetch >= self.prefetch_queue_size:
+                    self.counters["prefetch_skipped"] += 1
+                    continue
+                self._queued_prefetch += 1
+            self._queue.put((PRIORITY_PREFETCH, next(self._sequence), self._prefetch_one, (relative_path, source_path)))
+            count += 1
+        with self._lock:
+            self.counters["prefetch_queued"] += count
+        return count
+
+    def _worker(self) -> None:
+        while True:
+            _, _, job, args = self._queue.get()
+            try:
+                job(*args)
+            except Exception as e:
+                logger.error(f"サムネイル生成ワーカーでエラーが発生: {e}")
+                logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+            finally:
+                self._queue.task_done()
+
+    def _prefetch_one(self, relative_path: str, source_path: str) -> None:
+        """先行生成: 対象ファイルの stat を取り、未生成の種類だけ生成する"""
+        with self._lock:
+            self._queued_prefetch -= 1
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return
+        for kind in KINDS:
+            key = self.cache_key(relative_path, stat, kind)
+            path = self.cache_path(key)
+            with self._lock:
+                if key in self._pending or self._recently_failed(key) or os.path.exists(path):
+                    continue
+                self._pending[key] = Future()
+            self._run_job(key, source_path, kind, path)
+
+    def _recently_failed(self, key: str) -> bool:
+        """再試行を控える間に失敗したキーか（期限の過ぎた記録はここで消す。_lock 取得済みで呼び出す）"""
+        failed_at = self._failures.get(key)
+        if failed_at is None:
+            return False
+        if time.time() - failed_at < FAILURE_RETRY_SECONDS:
+            return True
+        del self._failures[key]
+        return False
+
+    def _record_failure(self, key: str) -> None:
+        """失敗を記録し、期限の過ぎたもの・上限を超えた分を古い順に消す（_lock 取得済みで呼び出す）"""
+        failures = self._failures
+        failures.pop(key, None)
+        now = time.time()
+        failures[key] = now
+        while len(failures) > 1:
+            oldest = next(iter(failures))
+            if now - failures[oldest] < FAILURE_RETRY_SECONDS and len(failures) <= FAILURE_MAX_ENTRIES:
+                break
+            del failures[oldest]
+
+    def _run_job(self, key: str, source_path: str, kind: str, output_path: str) -> None:
+        with self._lock:
+            future = self._pending[key]
+        try:
+            started = time.perf_counter()
+            if not os.path.exists(output_path):
+                self._generate(source_path, kind, output_path)
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.counters["generated"] += 1
+                self.counters["generate_ms"] += elapsed
+            logger.debug(f"サムネイルを生成: {source_path} ({kind}, {elapsed:.1f}ms)")
+            future.set_result(output_path)
+        except Exception as e:
+            with self._lock:
+                self.counters["failed"] += 1
+                self._record_failure(key)
+            logger.error(f"サムネイル生成エラー: {source_path} ({kind}): {e}")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _probe_duration(self, source_path: str) -> Optional[float]:
+        if not self.ffprobe_path:
+            return None
+        try:
+            result = subprocess.run(
+                [self.ffprobe_path, "-v", "error", "-show_entries", "format=duration",
+                 "-of", "default=noprint_wrappers=1:nokey=1", source_path],
+                capture_output=True, text=True, timeout=self.timeout
+            )
+            return float(result.stdout.strip())
+        except (ValueError, OSError, subprocess.SubprocessError):
+            return None
+
+    def _generate(self, source_path: str, kind: str, output_path: str) -> None:
+        """ffmpeg で画像を生成し、一時ファイルから置き換えて保存"""
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        partial_path = output_path + ".part.jpg"
+        duration = self._probe_duration(source_path)
+        if kind == "poster":
+            # 真っ黒な先頭フレームを避けて少し進めた位置（短い動画は先頭）
+            seek = min(1.0, duration / 2) if duration else 0.0
+            args = ["-ss", f"{seek:.3f}", "-i", source_path, "-frames:v", "1",
+                    "-vf", f"scale={POSTER_WIDTH}:-2", "-q:v", "4"]
+        else:
+            interval = duration / SPRITE_FRAMES if duration else 3.0
+            args = ["-i", source_path, "-frames:v", "1",
+                    "-vf", f"fps=1/{interval:.3f},scale={SPRITE_FRAME_WIDTH}:-2,tile={SPRITE_FRAMES}x1", "-q:v", "5"]
+        command = [self.ffmpeg_path, "-v", "error", "-nostdin", "-y", *args, partial_path]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+            if result.returncode != 0 or not os.path.exists(partial_path) or os.path.getsize(partial_path) == 0:
+                raise RuntimeError(f"ffmpeg が失敗しました (code={result.returncode}): {result.stderr.strip()[:500]}")
+            os.replace(partial_path, output_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            generated = self.counters["generated"]
+            return {
+                **self.counters,
+                "generate_ms": round(self.counters["generate_ms"], 1),
+                "average_ms": round(self.counters["generate_ms"] / generated, 1) if generated else None,
+                "pending": len(self._pending),
+                "prefetch_waiting": self._queued_prefetch,
+                "failures": len(self._failures),
+            }
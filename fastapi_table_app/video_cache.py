@@ -0,0 +1,183 @@
+"""
+動画ファイルのローカルディスク（SSD）キャッシュ
+
+NAS上の動画を再生したときにファイル全体をローカルディスクへコピーしておき、以降の
+（Range）リクエストはローカルのコピーから配信する。
+
+- キーは 相対パス + ファイルサイズ + mtime。NAS側のファイルが変わればキーが変わり、古いコピーは使われない
+- 容量の上限を超えたら最後に使われてから最も時間が経ったものから削除（LRU）
+- コピーはバックグラウンドのスレッドで行い、コピー中のリクエストはNASから配信する
+- ヒット/ミス件数とキャッシュから配信したバイト数（NAS転送の削減量）を集計する
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".mp4"
+PARTIAL_SUFFIX = ".part"
+
+
+class VideoCache:
+    """動画ファイルのLRUディスクキャッシュ"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, fill_workers: int = 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # キー → ファイルサイズ（先頭ほど長く使われていない）
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._filling = set()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, fill_workers), thread_name_prefix="video-cache")
+        self.total_bytes = 0
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "hit_bytes": 0,
+            "miss_bytes": 0,
+            "fills": 0,
+            "fill_bytes": 0,
+            "fill_errors": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+        logger.info(f"動画キャッシュを開きました: {cache_dir} ({len(self._entries)}件, {self.total_bytes}バイト, 上限 {max_bytes}バイト)")
+
+    def _load_existing(self) -> None:
+        """既存のキャッシュファイルを最終利用時刻順に登録（書きかけのファイルは削除）"""
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(PARTIAL_SUFFIX):
+                    self._remove(entry.path)
+                elif entry.name.endswith(CACHE_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-len(CACHE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def cache_key(relative_path: str, stat: os.stat_result) -> str:
+        raw = f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"キャッシュファイルを削除できませんでした: {path}: {e}")
+
+    def lookup(self, relative_path: str, stat: os.stat_result) -> Optional[str]:
+        """キャッシュ済みならローカルのファイルパスを返す（最終利用時刻を更新）"""
+        key = self.cache_key(relative_path, stat)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            # 再起動後もLRUの順序を引き継げるよう、最終利用時刻をmtimeに記録する
+            os.utime(path)
+        except OSError:
+            # 外部から削除された場合は登録を外してNASから配信する
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+        return path
+
+    def record(self, hit: bool, served_bytes: int) -> None:
+        """配信結果を集計（served_bytes はレスポンスのバイト数）"""
+        with self._lock:
+            if hit:
+                self.counters["hits"] += 1
+                self.counters["hit_bytes"] += served_bytes
+            else:
+                self.counters["misses"] += 1
+                self.counters["miss_bytes"] += served_bytes
+
+    def schedule_fill(self, relative_path: str, stat: os.stat_result, source_path: str) -> None:
+        """ファイル全体のコピーをバックグラウンドで開始（コピー中・上限超過のファイルは何もしない）"""
+        if stat.st_size > self.max_bytes:
+            return
+        key = self.cache_key(relative_path, stat)
+        with self._lock:
+            if key in self._entries or key in self._filling:
+                return
+            self._filling.add(key)
+        self._executor.submit(self._fill, key, stat.st_size, source_path)
+
+    def _fill(self, key: str, expected_size: int, source_path: str) -> None:
+        partial_path = self._path(key) + PARTIAL_SUFFIX
+        try:
+            started = time.perf_counter()
+            with open(source_path, "rb") as src, open(partial_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            size = os.path.getsize(partial_path)
+            if size != expected_size:
+                # コピー中にNAS側のファイルが変わった
+                logger.warning(f"キャッシュへのコピー中にファイルが変更されました: {source_path}")
+                self._remove(partial_path)
+                return
+            os.replace(partial_path, self._path(key))
+            with self._lock:
+                self._entries[key] = size
+                self.total_bytes += size
+                self.counters["fills"] += 1
+                self.counters["fill_bytes"] += size
+            self._evict()
+            logger.info(f"動画をキャッシュしました: {source_path} ({size}バイト, {(time.perf_counter() - started) * 1000:.1f}ms)")
+        except Exception as e:
+            with self._lock:
+                self.counters["fill_errors"] += 1
+            logger.error(f"動画キャッシュへのコピーエラー: {e}")
+            logger.error(f"詳細なエラー情報:\n{traceback.format_exc()}")
+            if os.path.exists(partial_path):
+                self._remove(partial_path)
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def _evict(self) -> None:
+        """上限を超えている間、最も長く使われていないファイルから削除"""
+        while True:
+            with self._lock:
+                if self.total_bytes <= self.max_bytes or not self._entries:
+                    return
+                key, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                self.counters["evictions"] += 1
+                self.counters["evicted_bytes"] += size
+            self._remove(self._path(key))
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            requests = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / requests, 3) if requests else None,
+                # キャッシュから配信した分だけNASからの転送が減っている
+                "bytes_saved": self.counters["hit_bytes"],
+                "files": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "filling": len(self._filling),
+            }
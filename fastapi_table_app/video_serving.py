@@ -0,0 +1,210 @@
+"""
+動画ファイルの範囲配信（HTTP Range / 条件付きリクエスト）
+
+- Range: 単一範囲（bytes=a-b / a- / -N）と複数範囲（multipart/byteranges）に対応し、終端はファイルサイズに丸める
+- If-Range: ETag または Last-Modified が一致する場合のみ範囲配信し、一致しなければ全体を返す
+- If-None-Match / If-Modified-Since: 変更がなければ 304 を返す
+- ファイルの読み込みは専用スレッドプールで行い、イベントループを止めない
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from concurrent.futures import Executor
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, List, Mapping, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+# 1リクエストで受け付ける範囲の最大数（超えた場合は Range を無視して全体を返す）
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """要求された範囲がすべてファイルの外側にある場合の例外"""
+
+
+def parse_range_header(header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """Range ヘッダーを (開始, 終了) の一覧に変換（両端を含む）
+
+    書式が不正な場合や範囲が多すぎる場合は None（Range を無視して全体を返す）。
+    満たせる範囲が1つもない場合は RangeNotSatisfiable を送出する
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not first.isdigit()) or (last and not last.isdigit()) or (not first and not last):
+            return None
+        if not first:
+            # 末尾から N バイト（bytes=-N）
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(0, file_size - length), file_size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= file_size:
+            continue
+        end = int(last) if last else file_size - 1
+        ranges.append((start, min(end, file_size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable(header)
+    return ranges
+
+
+def file_validators(stat: os.stat_result) -> Tuple[str, str]:
+    """ファイルの stat から (ETag, Last-Modified) を作成"""
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    return etag, formatdate(stat.st_mtime, usegmt=True)
+
+
+def _http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def if_range_matches(if_range: str, etag: str, mtime: float) -> bool:
+    """If-Range の値が現在のファイルと一致するか（ETag は強い比較、日付は秒単位で一致）"""
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    timestamp = _http_date(if_range)
+    return timestamp is not None and int(timestamp) == int(mtime)
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    """条件付きリクエスト（If-None-Match 優先、なければ If-Modified-Since）で変更なしと判定できるか"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # 弱い比較（W/ の有無は無視）
+        return "*" in candidates or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        timestamp = _http_date(if_modified_since)
+        return timestamp is not None and int(mtime) <= int(timestamp)
+    return False
+
+
+def _read_at(f, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+async def iter_file_ranges(path: str, parts: List[Tuple[bytes, int, int]], trailer: bytes,
+                           executor: Executor, chunk_size: int,
+                           on_read: Optional[Callable[[int, float], None]] = None) -> AsyncIterator[bytes]:
+    """ファイルの指定範囲を順に読み出す（読み込みはスレッドプールで実行）
+
+    parts は (範囲の前に送るバイト列, 開始, 終了) の一覧、trailer は最後に送るバイト列。
+    on_read はチャンクを読み込むたびに (バイト数, 読み込み秒数) で呼び出す
+    """
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(executor, open, path, "rb")
+    try:
+        for prefix, start, end in parts:
+            if prefix:
+                yield prefix
+            offset = start
+            while offset <= end:
+                started = time.perf_counter()
+                data = await loop.run_in_executor(executor, _read_at, f, offset, min(chunk_size, end - offset + 1))
+                if not data:
+                    return
+                if on_read is not None:
+                    on_read(len(data), time.perf_counter() - started)
+                yield data
+                offset += len(data)
+        if trailer:
+            yield trailer
+    finally:
+        await loop.run_in_executor(executor, f.close)
+
+
+def build_file_response(path: str, stat: os.stat_result, request_headers: Mapping[str, str],
+                        executor: Executor, chunk_size: int, media_type: str,
+                        on_read: Optional[Callable[[int, float], None]] = None) -> Response:
+    """リクエストヘッダーに応じて 200 / 206 / 304 / 416 のレスポンスを作成
+
+    on_read は本文のチャンクを読み込むたびに (バイト数, 読み込み秒数) で呼び出す（計測用）
+    """
+    file_size = stat.st_size
+    etag, last_modified = file_validators(stat)
+    headers: Dict[str, str] = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+    }
+
+    if is_not_modified(request_headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request_headers.get("range")
+    if range_header and file_size > 0:
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range_matches(if_range, etag, stat.st_mtime):
+            try:
+                ranges = parse_range_header(range_header, file_size)
+            except RangeNotSatisfiable:
+                headers["Content-Range"] = f"bytes */{file_size}"
+                return Response(status_code=416, headers=headers)
+
+    if ranges is None:
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(
+            iter_file_ranges(path, [(b"", 0, file_size - 1)], b"", executor, chunk_size, on_read),
+            media_type=media_type,
+            headers=headers
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter_file_ranges(path, [(b"", start, end)], b"", executor, chunk_size, on_read),
+            status_code=206,
+            media_type=media_type,
+            headers=headers
+        )
+
+    # 複数範囲は multipart/byteranges で返す
+    boundary = secrets.token_hex(16)
+    parts = []
+    content_length = 0
+    for start, end in ranges:
+        prefix = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode("ascii")
+        if parts:
+            prefix = b"\r\n" + prefix
+        parts.append((prefix, start, end))
+        content_length += len(prefix) + end - start + 1
+    trailer = f"\r\n--{boundary}--\r\n".encode("ascii")
+    content_length += len(trailer)
+    headers["Content-Length"] = str(content_length)
+    return StreamingResponse(
+        iter_file_ranges(path, parts, trailer, executor, chunk_size, on_read),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
@@ -0,0 +1,151 @@
+"""
+ZIPのストリーミング作成（無圧縮・ZIP64対応）
+
+一時ファイルもメモリ上のバッファも使わず、ローカルヘッダー → ファイル本体 → データ記述子 の順に
+そのまま送り、最後にセントラルディレクトリを送る。CRC-32 は送りながら求めてデータ記述子に書く。
+
+- 圧縮はしない（MP4は圧縮済みのため効果がなく、CPUを使わずに済む）
+- サイズは送る前の stat で決める。送信中にファイルが伸びても stat 時点の大きさまでしか送らない
+  （縮んだ場合は続けられないため例外で打ち切る）
+- サイズ・位置が分かっているため、全体の大きさ（Content-Length）も送る前に求められる
+- 4GB以上のファイル・4GB以降の位置・65535件以上のエントリは ZIP64 の拡張フィールド・終端レコードで表す
+- ファイル名は UTF-8（汎用フラグの bit 11）
+"""
+
+import struct
+import time
+import zlib
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
+
+from video_serving import iter_file_ranges
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<IHHHHIIH")
+_ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+
+# 汎用フラグ: bit 3（サイズ・CRCはデータ記述子に書く）と bit 11（ファイル名はUTF-8）
+_FLAGS = 0x0008 | 0x0800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+# 作成システム（UNIX）と、外部属性に入れる通常ファイルのパーミッション
+_MADE_BY_UNIX = 3 << 8
+_EXTERNAL_ATTR = 0o100644 << 16
+_LIMIT = 0xFFFFFFFF
+
+
+class ZipEntry(NamedTuple):
+    """ZIPに入れる1件（path のファイル、または data のバイト列）"""
+    name: str
+    size: int
+    mtime: float
+    path: Optional[str] = None
+    data: Optional[bytes] = None
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    """更新時刻を MS-DOS 形式の (時刻, 日付) に変換（1980年より前は1980年1月1日）"""
+    local = time.localtime(mtime)
+    if local.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((local.tm_hour << 11) | (local.tm_min << 5) | (local.tm_sec // 2),
+            ((local.tm_year - 1980) << 9) | (local.tm_mon << 5) | local.tm_mday)
+
+
+class ZipStream:
+    """エントリの一覧からZIPを順に生成する（全体の大きさは size）"""
+
+    def __init__(self, entries: List[ZipEntry]):
+        self.entries = entries
+        self._names = [entry.name.encode("utf-8") for entry in entries]
+        self._offsets: List[int] = []
+        position = 0
+        for entry, name in zip(entries, self._names):
+            self._offsets.append(position)
+            position += len(self._local_header(entry, name)) + entry.size + self._descriptor_size(entry)
+        self._central_offset = position
+        self._central_size = sum(
+            len(self._central_header(entry, name, 0, offset))
+            for entry, name, offset in zip(entries, self._names, self._offsets)
+        )
+        self.size = position + self._central_size + len(self._end_records())
+
+    @staticmethod
+    def _is_zip64(entry: ZipEntry) -> bool:
+        return entry.size >= _LIMIT
+
+    def _descriptor_size(self, entry: ZipEntry) -> int:
+        return 24 if self._is_zip64(entry) else 16
+
+    def _local_header(self, entry: ZipEntry, name: bytes) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        if self._is_zip64(entry):
+            # サイズはデータ記述子に書くため、ローカルヘッダーの ZIP64 拡張フィールドは 0
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            version, size = _VERSION_ZIP64, _LIMIT
+        else:
+            extra = b""
+            version, size = _VERSION, 0
+        return _LOCAL_HEADER.pack(0x04034B50, version, _FLAGS, 0, dos_time, dos_date, 0, size, size,
+                                  len(name), len(extra)) + name + extra
+
+    def _central_header(self, entry: ZipEntry, name: bytes, crc: int, offset: int) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        fields = []
+        size = entry.size
+        if size >= _LIMIT:
+            fields += [size, size]
+            size = _LIMIT
+        if offset >= _LIMIT:
+            fields.append(offset)
+            offset = _LIMIT
+        extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+        version = _VERSION_ZIP64 if fields else _VERSION
+        return _CENTRAL_HEADER.pack(0x02014B50, _MADE_BY_UNIX | version, version, _FLAGS, 0, dos_time, dos_date,
+                                    crc, size, size, len(name), len(extra), 0, 0, 0, _EXTERNAL_ATTR,
+                                    offset) + name + extra
+
+    def _end_records(self) -> bytes:
+        count = len(self.entries)
+        records = b""
+        if count >= 0xFFFF or self._central_offset >= _LIMIT or self._central_size >= _LIMIT:
+            zip64_offset = self._central_offset + self._central_size
+            records += _ZIP64_END_RECORD.pack(0x06064B50, 44, _MADE_BY_UNIX | _VERSION_ZIP64, _VERSION_ZIP64,
+                                              0, 0, count, count, self._central_size, self._central_offset)
+            records += _ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_offset, 1)
+        return records + _END_RECORD.pack(
+            0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(self._central_size, _LIMIT), min(self._central_offset, _LIMIT), 0
+        )
+
+    async def iter_bytes(self, executor: Executor, chunk_size: int,
+                         on_read: Optional[Callable[[int, float], None]] = None) -> AsyncIterator[bytes]:
+        """ZIPの内容を先頭から順に返す（ファイルの読み込みは executor で行う）"""
+        crcs = []
+        for entry, name in zip(self.entries, self._names):
+            yield self._local_header(entry, name)
+            crc = 0
+            if entry.data is not None:
+                crc = zlib.crc32(entry.data)
+                yield entry.data
+            elif entry.size:
+                sent = 0
+                async for data in iter_file_ranges(entry.path, [(b"", 0, entry.size - 1)], b"",
+                                                   executor, chunk_size, on_read):
+                    crc = zlib.crc32(data, crc)
+                    sent += len(data)
+                    yield data
+                if sent != entry.size:
+                    raise IOError(f"ZIP作成中にファイルが短くなりました: {entry.path} ({sent}/{entry.size}バイト)")
+            crcs.append(crc)
+            if self._is_zip64(entry):
+                yield struct.pack("<IIQQ", 0x08074B50, crc, entry.size, entry.size)
+            else:
+                yield struct.pack("<IIII", 0x08074B50, crc, entry.size, entry.size)
+        yield b"".join(
+            self._central_header(entry, name, crc, offset)
+            for entry, name, crc, offset in zip(self.entries, self._names, crcs, self._offsets)
+        )
+        yield self._end_records()